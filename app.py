@@ -1,106 +1,244 @@
 # app.py
 import os
 import sys
-from flask import Flask, request, jsonify
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from pinecone import Pinecone
 import openai
 
 # Import config variables and utility functions
 import config
-from utils.embedder import generate_embedding
-from utils.retriever import query_pinecone
-
-# === DEBUG Configuration Values ===
-# ... (tus prints de depuración) ...
-
-# === VALIDATE CONFIGURATION ===
-# ... (tus validaciones) ...
+from utils.embedder import embed_cache_misses, generate_embeddings, get_embedding_cache_stats, get_rate_limiter_stats
+from utils.coalescing import EmbeddingBatcher, SingleFlight
+from utils.query_pipeline import error_payload, parse_rag_query, query_payload, run_query
+from utils.result_shaping import parse_query_options, shape_results
+from utils.retriever import module_cache_predicate, normalize_module_filter, query_pinecone
+from utils.semantic_cache import SemanticResultCache
+from utils.serialization import dumps, encode_json
+from utils.services import (get_doc_store, get_index, get_lexical_index, is_admin_request, readiness,
+                            warm_up_in_background)
+from utils.observability import REGISTRY, PROMETHEUS_CONTENT_TYPE, get_logger, record_request, setup_logging, span
 
 # === FLASK APP & EXTENSIONS ===
 app = Flask(__name__)
 CORS(app)
-
-# === INITIALIZE EXTERNAL SERVICES ===
-# (Mantenemos el try-except general aquí)
-try:
-    print("Attempting to initialize Pinecone client...")
-    pc = Pinecone(api_key=config.PINECONE_API_KEY)
-
-    print(f"Attempting to list indexes to check for '{config.INDEX_NAME}'...")
-    index_list = pc.list_indexes()
-    index_names = [index_info.name for index_info in index_list.indexes]
-    print(f"Found indexes: {index_names}")
-
-    if config.INDEX_NAME not in index_names:
-         raise ValueError(f"Pinecone index '{config.INDEX_NAME}'...") # Mensaje de error
-
-    print(f"Attempting to connect to index '{config.INDEX_NAME}'...")
-    pinecone_index = pc.Index(config.INDEX_NAME)
-    print(f"Successfully connected to Pinecone index '{config.INDEX_NAME}'.")
-
-except Exception as e: # Este except atrapará errores de inicialización
-    print(f"ERROR: Failed to initialize external services: {e}")
-    pinecone_index = None
+setup_logging()
+logger = get_logger("app")
+
+# === EXTERNAL SERVICES ===
+# The index and OpenAI clients are created lazily in each worker process (utils/services.py),
+# so importing the app (e.g. gunicorn --preload) makes no network calls and forked workers
+# never share connections. Set WARMUP_ON_START to connect before the first request.
+
+# Near-duplicate result cache in front of query_pinecone (None when disabled)
+result_cache = None
+if config.RESULT_CACHE_ENABLED:
+    result_cache = SemanticResultCache(
+        capacity=config.RESULT_CACHE_SIZE,
+        threshold=config.RESULT_CACHE_THRESHOLD,
+        ttl_seconds=config.RESULT_CACHE_TTL_SECONDS,
+    )
+
+# Cache counters are exported as gauges on /metrics
+REGISTRY.register_gauges("rag_embedding_cache", "Query embedding cache", get_embedding_cache_stats)
+REGISTRY.register_gauges("rag_openai_rate_limiter", "OpenAI embedding rate limiter", get_rate_limiter_stats)
+if result_cache is not None:
+    REGISTRY.register_gauges("rag_result_cache", "Semantic result cache", result_cache.stats)
+
+# Concurrent identical queries share one embedding + retrieval, and distinct query embeddings
+# arriving within EMBED_BATCH_WINDOW_MS go to OpenAI as one batched call (None when disabled)
+query_flights = SingleFlight() if config.COALESCE_QUERIES else None
+embedding_batcher = None
+if config.EMBED_BATCH_WINDOW_MS > 0:
+    embedding_batcher = EmbeddingBatcher(
+        embed_cache_misses,
+        window_seconds=config.EMBED_BATCH_WINDOW_MS / 1000,
+        max_batch_size=config.EMBED_BATCH_MAX_SIZE,
+    )
+if query_flights is not None:
+    REGISTRY.register_gauges("rag_single_flight", "Coalesced /rag/query computations", query_flights.stats)
+if embedding_batcher is not None:
+    REGISTRY.register_gauges("rag_embedding_batcher", "Micro-batched query embeddings", embedding_batcher.stats)
+
+# Bounded pool for the Pinecone fan-out of batch queries (shared by all requests of this worker)
+query_executor = ThreadPoolExecutor(max_workers=config.BATCH_QUERY_WORKERS, thread_name_prefix="pinecone-query")
+
+
+# === REQUEST METRICS ===
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started_at = g.get("request_started_at")
+    if started_at is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        record_request(endpoint, response.status_code, time.perf_counter() - started_at)
+    return response
+
+
+def json_response(payload, status: int = 200) -> Response:
+    """Query responses: fast JSON encoding and gzip/br compression (utils/serialization.py)."""
+    body, headers = encode_json(payload, request.headers.get("Accept-Encoding"))
+    return Response(body, status=status, headers=headers)
 
 
 # === API ENDPOINTS ===
 @app.route('/health', methods=['GET'])
 def health_check():
-    if pinecone_index is None:
-         return jsonify({"status": "error", "message": "Pinecone connection failed"}), 503
+    """Liveness: the process is up and serving requests (no external calls)."""
     return jsonify({"status": "ok"})
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: the retriever index of this worker is initialized and OpenAI is configured."""
+    state = readiness()
+    return jsonify({"status": "ok" if state["ready"] else "error", **state}), 200 if state["ready"] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text format: per-stage latency histograms, request/error counters, cache stats (this worker)."""
+    return Response(REGISTRY.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "embedding_cache": get_embedding_cache_stats(),
+        "result_cache": result_cache.stats() if result_cache is not None else {"enabled": False},
+    })
+
+@app.route('/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    """
+    Drops cached query results, e.g. after an upsert. Optional JSON body: {"module": "..." or [...]}.
+    Requires "Authorization: Bearer <CACHE_ADMIN_TOKEN>"; disabled when no token is configured.
+    """
+    if not is_admin_request(request.headers.get("Authorization")):
+        return jsonify({"error": "Unauthorized"}), 401
+    if result_cache is None:
+        return jsonify({"invalidated": 0})
+    data = request.get_json(silent=True) or {}
+    try:
+        module = normalize_module_filter(data.get("module"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if module:
+        # Unfiltered (and multi-module) queries can also return chunks of this module, so drop those too
+        dropped = result_cache.invalidate(module_cache_predicate(module))
+    else:
+        dropped = result_cache.invalidate()
+    logger.info("Result cache invalidated (%d partitions, module: %s)", dropped, module)
+    return jsonify({"invalidated": dropped})
+
 @app.route("/rag/query", methods=["POST"])
 def rag_query_endpoint():
+    """
+    {"text": ..., "module": "..." or [...], "namespaces": [...]} plus the result options of
+    utils/result_shaping.py. Several modules are searched with one "$in" filter; several
+    namespaces are queried in parallel with one shared embedding and their top-k merged,
+    with the per-namespace timings returned under "shards" (utils/query_pipeline.py).
+    """
+    pinecone_index = get_index()
     if pinecone_index is None:
          return jsonify({"error": "Pinecone service unavailable"}), 503
 
-    data = request.json
-    if not data or "text" not in data or not data["text"].strip():
-        return jsonify({"error": "Missing or empty 'text' field in JSON request"}), 400
-
-    query_text = data["text"]
-    module_to_filter = data.get("module")
-    if module_to_filter and isinstance(module_to_filter, str):
-        module_to_filter = module_to_filter.strip().lower()
-        if not module_to_filter: module_to_filter = None
-    else:
-         module_to_filter = None
-
-    print(f"Received query: '{query_text[:100]}...' | Module Filter: {module_to_filter}")
-
     try:
-        print("Generating embedding...")
-        query_vector = generate_embedding(query_text)
-        if not query_vector:
-             return jsonify({"error": "Failed to generate query embedding"}), 500
-        print(f"Embedding generated (dim: {len(query_vector)})")
-
-        print("Querying Pinecone...")
-        # Llamamos a la función actualizada que ya no tiene except ApiException
-        results = query_pinecone(
+        query = parse_rag_query(request.get_json(silent=True))
+        result = run_query(
+            query,
             index=pinecone_index,
-            query_vector=query_vector,
-            module_filter=module_to_filter
+            lexical_index=get_lexical_index(),
+            result_cache=result_cache,
+            doc_store=get_doc_store(),
+            embedding_batcher=embedding_batcher,
+            query_flights=query_flights,
+            executor=query_executor
         )
-        print(f"Retrieved {len(results)} results.")
+        with span("serialization", logger):
+            return json_response(query_payload(query, result))
+    except Exception as e:
+        payload, status = error_payload(e)
+        return jsonify(payload), status
+
+@app.route("/rag/query/batch", methods=["POST"])
+def rag_query_batch_endpoint():
+    """
+    Runs many queries in one request: {"queries": [{"text": ..., "module": ...}, ...], "stream": false}.
+    All texts are embedded with a single OpenAI call, then the Pinecone queries fan out on a
+    bounded thread pool. Returns {"results": [...]} in request order, or NDJSON lines
+    ({"index": i, "results": [...]}) as each query completes when "stream" is true.
+    The /rag/query result options (top_k, fields, snippet, collapse) apply to every query.
+    """
+    pinecone_index = get_index()
+    if pinecone_index is None:
+         return jsonify({"error": "Pinecone service unavailable"}), 503
 
-        return jsonify({"results": results})
+    data = request.json
+    queries = data.get("queries") if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "Missing or empty 'queries' list in JSON request"}), 400
+    if len(queries) > config.BATCH_MAX_QUERIES:
+        return jsonify({"error": f"Too many queries ({len(queries)}); maximum is {config.BATCH_MAX_QUERIES}"}), 400
+    for i, item in enumerate(queries):
+        if not isinstance(item, dict) or not isinstance(item.get("text"), str) or not item["text"].strip():
+            return jsonify({"error": f"Query {i}: missing or empty 'text' field"}), 400
+    try:
+        options = parse_query_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        module_filters = [normalize_module_filter(item.get("module")) for item in queries]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    stream = bool(data.get("stream")) or request.accept_mimetypes.best == "application/x-ndjson"
+    logger.info("Received batch of %d queries (stream=%s)", len(queries), stream)
 
-    except openai.APIError as e: # Mantenemos el de OpenAI
-        print(f"OpenAI API Error: {e}")
+    try:
+        with span("embedding_batch", logger):
+            query_vectors = generate_embeddings([item["text"] for item in queries])
+    except openai.APIError as e:
+        logger.error("OpenAI API Error: %s", e)
         return jsonify({"error": f"OpenAI API Error: {e}"}), 500
-    # except ApiException as e: <-- BLOQUE ELIMINADO
-    #    print(f"Pinecone API Error: {e}")
-    #    return jsonify({"error": f"Pinecone API Error: {e}"}), 500
-    except Exception as e: # <-- Este atrapará todo lo demás, incluyendo errores de Pinecone
-        print(f"Unexpected error processing query: {e}")
+    except Exception as e:
+        logger.exception("Unexpected error embedding batch: %s", e)
         return jsonify({"error": "An internal server error occurred"}), 500
 
+    def run_query(i):
+        try:
+            with span("retrieval", logger):
+                results = query_pinecone(
+                    index=pinecone_index,
+                    query_vector=query_vectors[i],
+                    module_filter=module_filters[i],
+                    result_cache=result_cache,
+                    top_k=options.fetch_k,
+                    doc_store=get_doc_store()
+                )
+            return {"index": i, "results": shape_results(results, options, queries[i]["text"])}
+        except Exception as e: # One failing query must not sink the whole batch
+            logger.error("Error in batch query %d: %s", i, e)
+            return {"index": i, "error": "An internal server error occurred"}
+
+    futures = [query_executor.submit(run_query, i) for i in range(len(queries))]
+
+    if stream:
+        def generate():
+            for future in as_completed(futures):
+                yield dumps(future.result()) + b"\n"
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    results = [future.result() for future in futures]
+    with span("serialization", logger):
+        return json_response({"results": results})
+
 
 # === MAIN EXECUTION ===
 if __name__ == "__main__":
     host = os.getenv("FLASK_RUN_HOST", "0.0.0.0")
     port = int(os.getenv("FLASK_RUN_PORT", 5050))
+    if config.WARMUP_ON_START:
+        warm_up_in_background()
     app.run(host=host, port=port, debug=config.DEBUG_MODE)
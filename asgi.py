@@ -0,0 +1,273 @@
+# asgi.py
+"""
+Async (ASGI) serving mode for the RAG API. Same /rag/query contract as app.py, but every
+request is a coroutine: the OpenAI embedding and the Pinecone query are awaited on pooled
+keep-alive connections, so one worker process serves many in-flight queries at once.
+
+Run with:
+  uvicorn asgi:app --host 0.0.0.0 --port 5050 --workers 2
+or:
+  python asgi.py
+
+The Flask app (app.py) is unchanged and still works with gunicorn / `python app.py`.
+"""
+import asyncio
+import os
+import contextlib
+import time
+from pinecone import Pinecone
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import config
+from utils.coalescing import AsyncEmbeddingBatcher, AsyncSingleFlight
+from utils.embedder import (create_embeddings_async, embed_cache_misses_async, close_async_openai_client,
+                            get_embedding_cache_stats, get_rate_limiter_stats)
+from utils.query_pipeline import error_payload, parse_rag_query, query_payload, run_query_async
+from utils.retriever import module_cache_predicate, normalize_module_filter
+from utils.doc_store import DocStore
+from utils.semantic_cache import SemanticResultCache
+from utils.serialization import encode_json
+from utils.services import WARMUP_TEXT, build_lexical_index, is_admin_request, load_local_index
+from utils.observability import REGISTRY, PROMETHEUS_CONTENT_TYPE, get_logger, record_request, setup_logging, span
+
+setup_logging()
+logger = get_logger("asgi")
+
+# === SERVICES (created in the lifespan, one set per worker process) ===
+pinecone_index = None
+lexical_index = None
+doc_store = None
+result_cache = None
+warmed_up = False
+
+
+def connect_pinecone_index_async():
+    """Resolves the index host once (sync control-plane call) and returns an IndexAsyncio client."""
+    logger.info("Attempting to initialize Pinecone client...")
+    pc = Pinecone(api_key=config.PINECONE_API_KEY, connection_pool_maxsize=config.ASYNC_MAX_CONNECTIONS)
+
+    host = config.PINECONE_INDEX_HOST
+    if not host:
+        logger.info("Attempting to describe index '%s'...", config.INDEX_NAME)
+        host = pc.describe_index(config.INDEX_NAME).host
+
+    logger.info("Attempting to connect to index '%s' (async) at %s...", config.INDEX_NAME, host)
+    # The data-plane client keeps its own (aiohttp) pool: connection_pool_maxsize on Pinecone() only
+    # covers the control plane, so the connector limit is passed again here
+    index = pc.IndexAsyncio(host=host, connection_pool_maxsize=config.ASYNC_MAX_CONNECTIONS)
+    logger.info("Successfully connected to Pinecone index '%s'.", config.INDEX_NAME)
+    return index
+
+async def warm_up(index) -> bool:
+    """Opens the pooled connections before the first request: one index stats call and one embedding."""
+    global warmed_up
+    try:
+        if asyncio.iscoroutinefunction(index.describe_index_stats):
+            await index.describe_index_stats()
+        else:
+            await asyncio.to_thread(index.describe_index_stats)
+        await create_embeddings_async([WARMUP_TEXT]) # Through the rate limiter, like every embedding call
+    except Exception as e:
+        logger.warning("Warm-up failed: %s", e)
+        return False
+    warmed_up = True
+    logger.info("Warm-up done.")
+    return True
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global pinecone_index, lexical_index, doc_store, result_cache
+    try:
+        if config.RETRIEVER_BACKEND == "local":
+            pinecone_index = await asyncio.to_thread(load_local_index)
+        else:
+            pinecone_index = await asyncio.to_thread(connect_pinecone_index_async)
+    except Exception as e:
+        logger.error("Failed to initialize external services: %s", e)
+        pinecone_index = None
+    lexical_index = await asyncio.to_thread(build_lexical_index, pinecone_index)
+    if config.DOC_STORE_PATH:
+        try:
+            doc_store = DocStore(config.DOC_STORE_PATH, read_only=True)
+        except Exception as e:
+            logger.error("Failed to open document store: %s", e)
+            pinecone_index = None # Results without text would look valid; report not ready instead
+
+    if config.RESULT_CACHE_ENABLED:
+        result_cache = SemanticResultCache(
+            capacity=config.RESULT_CACHE_SIZE,
+            threshold=config.RESULT_CACHE_THRESHOLD,
+            ttl_seconds=config.RESULT_CACHE_TTL_SECONDS,
+        )
+        REGISTRY.register_gauges("rag_result_cache", "Semantic result cache", result_cache.stats)
+
+    if config.WARMUP_ON_START and pinecone_index is not None:
+        await warm_up(pinecone_index)
+
+    yield
+
+    # Close the pooled connections on shutdown
+    await close_async_openai_client()
+    close = getattr(pinecone_index, "close", None)
+    if close is not None and asyncio.iscoroutinefunction(close):
+        await close()
+
+
+# === REQUEST METRICS ===
+REGISTRY.register_gauges("rag_embedding_cache", "Query embedding cache", get_embedding_cache_stats)
+REGISTRY.register_gauges("rag_openai_rate_limiter", "OpenAI embedding rate limiter", get_rate_limiter_stats)
+
+# Concurrent identical queries share one embedding + retrieval, and distinct query embeddings
+# arriving within EMBED_BATCH_WINDOW_MS go to OpenAI as one batched call (None when disabled)
+query_flights = AsyncSingleFlight() if config.COALESCE_QUERIES else None
+embedding_batcher = None
+if config.EMBED_BATCH_WINDOW_MS > 0:
+    embedding_batcher = AsyncEmbeddingBatcher(
+        embed_cache_misses_async,
+        window_seconds=config.EMBED_BATCH_WINDOW_MS / 1000,
+        max_batch_size=config.EMBED_BATCH_MAX_SIZE,
+    )
+if query_flights is not None:
+    REGISTRY.register_gauges("rag_single_flight", "Coalesced /rag/query computations", query_flights.stats)
+if embedding_batcher is not None:
+    REGISTRY.register_gauges("rag_embedding_batcher", "Micro-batched query embeddings", embedding_batcher.stats)
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware: records latency and status of every HTTP request by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started_at = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route") # Set by the router on the shared scope once a route matched
+            record_request(getattr(route, "path", "unmatched"), status, time.perf_counter() - started_at)
+
+
+def json_response(request: Request, payload, status_code: int = 200) -> Response:
+    """Query responses: fast JSON encoding and gzip/br compression (utils/serialization.py)."""
+    body, headers = encode_json(payload, request.headers.get("accept-encoding"))
+    return Response(body, status_code=status_code, headers=headers)
+
+
+# === API ENDPOINTS ===
+async def health_check(request: Request):
+    """Liveness: the process is up and serving requests (no external calls)."""
+    return JSONResponse({"status": "ok"})
+
+async def readiness_check(request: Request):
+    """Readiness: the index client of this worker is initialized and OpenAI is configured."""
+    checks = {
+        "index": "ok" if pinecone_index is not None else "error: index initialization failed",
+        "openai": "ok" if config.OPENAI_API_KEY else "error: OPENAI_API_KEY not set",
+    }
+    ready = all(value == "ok" for value in checks.values())
+    return JSONResponse({"status": "ok" if ready else "error", "ready": ready, "checks": checks,
+                         "warmed_up": warmed_up, "lexical_index": lexical_index is not None,
+                         "pid": os.getpid()}, status_code=200 if ready else 503)
+
+async def metrics(request: Request):
+    """Prometheus text format: per-stage latency histograms, request/error counters, cache stats (this worker)."""
+    return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+async def cache_stats(request: Request):
+    return JSONResponse({
+        "embedding_cache": get_embedding_cache_stats(),
+        "result_cache": result_cache.stats() if result_cache is not None else {"enabled": False},
+    })
+
+async def cache_invalidate(request: Request):
+    """
+    Drops cached query results, e.g. after an upsert. Optional JSON body: {"module": "..." or [...]}.
+    Requires "Authorization: Bearer <CACHE_ADMIN_TOKEN>"; disabled when no token is configured.
+    """
+    if not is_admin_request(request.headers.get("Authorization")):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if result_cache is None:
+        return JSONResponse({"invalidated": 0})
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    try:
+        module = normalize_module_filter(data.get("module")) if isinstance(data, dict) else None
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if module:
+        # Unfiltered (and multi-module) queries can also return chunks of this module, so drop those too
+        dropped = result_cache.invalidate(module_cache_predicate(module))
+    else:
+        dropped = result_cache.invalidate()
+    logger.info("Result cache invalidated (%d partitions, module: %s)", dropped, module)
+    return JSONResponse({"invalidated": dropped})
+
+async def rag_query_endpoint(request: Request):
+    """Same request / response as app.py's /rag/query; namespace fan-outs run concurrently on the event loop."""
+    if pinecone_index is None:
+        return JSONResponse({"error": "Pinecone service unavailable"}, status_code=503)
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    try:
+        query = parse_rag_query(data)
+        result = await run_query_async(
+            query,
+            index=pinecone_index,
+            lexical_index=lexical_index,
+            result_cache=result_cache,
+            doc_store=doc_store,
+            embedding_batcher=embedding_batcher,
+            query_flights=query_flights
+        )
+        with span("serialization", logger):
+            return json_response(request, query_payload(query, result))
+    except Exception as e:
+        payload, status = error_payload(e)
+        return JSONResponse(payload, status_code=status)
+
+
+app = Starlette(
+    debug=config.DEBUG_MODE.lower() in ['true', '1', 't'],
+    routes=[
+        Route("/health", health_check, methods=["GET"]),
+        Route("/ready", readiness_check, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/cache/stats", cache_stats, methods=["GET"]),
+        Route("/cache/invalidate", cache_invalidate, methods=["POST"]),
+        Route("/rag/query", rag_query_endpoint, methods=["POST"]),
+    ],
+    middleware=[
+        Middleware(RequestMetricsMiddleware),
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]), # Same as flask_cors defaults
+    ],
+    lifespan=lifespan,
+)
+
+
+# === MAIN EXECUTION ===
+if __name__ == "__main__":
+    import uvicorn
+    host = os.getenv("ASGI_HOST", "0.0.0.0")
+    port = int(os.getenv("ASGI_PORT", 5050))
+    uvicorn.run(app, host=host, port=port)
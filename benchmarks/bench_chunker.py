@@ -0,0 +1,71 @@
+# benchmarks/bench_chunker.py
+"""
+Compares character-window chunking (chunk_text) with sentence/token-aware chunking
+(chunk_text_tokens) in utils/pubmed_chunker.py on a large text built from the fixture articles.
+Reports chunking time, chunk count, tokens per chunk, tokens spent on overlap and the number
+of embedding requests the chunks pack into.
+
+Usage (from the repository root):
+  python benchmarks/bench_chunker.py [fixture.xml ...] [--copies N] [--max-tokens N] [--overlap-tokens N]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pmc_extract import split_pmc_articles
+from utils.pubmed_chunker import (CHUNK_OVERLAP, CHUNK_OVERLAP_TOKENS, CHUNK_SIZE, CHUNK_TOKENS,
+                                  MAX_TOKENS_PER_INPUT, chunk_text, chunk_text_tokens, get_encoding,
+                                  pack_embedding_batches)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def measure(name, chunk_function, text, encoding):
+    start = time.perf_counter()
+    chunks = chunk_function(text)
+    elapsed = time.perf_counter() - start
+
+    token_counts = [len(encoding.encode(chunk, disallowed_special=())) for chunk, _, _ in chunks]
+    embedded_tokens = [min(n, MAX_TOKENS_PER_INPUT) for n in token_counts]
+    total_tokens = sum(embedded_tokens)
+    text_tokens = len(encoding.encode(text, disallowed_special=()))
+    # embed_text cuts inputs at MAX_TOKENS_PER_INPUT; count how many chunks would lose text
+    truncated = sum(1 for n in token_counts if n > MAX_TOKENS_PER_INPUT)
+    requests = len(pack_embedding_batches([(i, None, n) for i, n in enumerate(embedded_tokens)]))
+    mid_sentence = sum(1 for chunk, _, _ in chunks[:-1] if chunk.rstrip()[-1:] not in ".!?")
+
+    print(f"{name:<10} chunks={len(chunks):>6}  time={elapsed * 1000:8.2f} ms  "
+          f"tokens/chunk mean={total_tokens / max(1, len(chunks)):7.1f} max={max(token_counts, default=0):>5}  "
+          f"overlap tokens={max(0, total_tokens - text_tokens):>7}  truncated={truncated}  "
+          f"mid-sentence ends={mid_sentence:>5}  embedding requests={requests}")
+    return chunks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", nargs="*", help="PMC efetch XML files (default: benchmarks/fixtures/*.xml)")
+    parser.add_argument("--copies", type=int, default=20, help="Times the fixture text is repeated")
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS)
+    args = parser.parse_args()
+
+    paths = args.fixtures or sorted(
+        os.path.join(FIXTURE_DIR, name) for name in os.listdir(FIXTURE_DIR) if name.endswith(".xml")
+    )
+    texts = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            texts.extend(text for text in split_pmc_articles(f.read()).values() if text)
+    text = "\n".join(texts * args.copies)
+    encoding = get_encoding()
+    print(f"{len(texts)} article(s) x {args.copies}: {len(text)} chars, "
+          f"{len(encoding.encode(text, disallowed_special=()))} tokens\n")
+
+    measure("chars", lambda t: chunk_text(t, CHUNK_SIZE, CHUNK_OVERLAP), text, encoding)
+    chunks = measure("tokens", lambda t: chunk_text_tokens(t, args.max_tokens, args.overlap_tokens), text, encoding)
+    assert all(text[start:end] == chunk for chunk, start, end in chunks), "char offsets do not match the text"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_dimensions.py
+"""
+Recall@k vs latency / memory of shortened embeddings on our corpus. Every candidate dimension
+is built the way utils/reindex.py --mode truncate builds it (first D components, renormalized)
+and searched exactly with LocalIndex; recall@k is measured against the full-dimension top-k.
+
+Queries are --sample-queries chunk vectors from the corpus (the chunk itself is excluded from
+its results), or the lines of --queries-file embedded at the full dimension (needs OPENAI_API_KEY).
+--synthetic N runs on random clustered vectors instead of a corpus (timings and memory only;
+recall on random data says nothing about real embeddings).
+
+Usage (from the repository root):
+  python benchmarks/bench_dimensions.py [records.json|.jsonl|.vectors.npy] [--dimensions 3072,1536,1024,512,256]
+      [--k 10] [--sample-queries 200] [--queries-file queries.txt] [--synthetic 50000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from utils.local_index import LocalIndex
+from utils.reindex import truncate_vectors
+
+
+def synthetic_corpus(count: int, dimension: int = 3072, clusters: int = 200, seed: int = 7) -> LocalIndex:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+    ids = [f"synthetic_{i}" for i in range(count)]
+    return LocalIndex(truncate_vectors(vectors, dimension), ids, [{} for _ in ids])
+
+def embed_queries(path: str, dimension: int) -> np.ndarray:
+    from utils.services import get_openai_client
+    with open(path, 'r') as f:
+        texts = [line.strip() for line in f if line.strip()]
+    response = get_openai_client().embeddings.create(input=texts, model=config.EMBEDDING_MODEL, dimensions=dimension)
+    return np.asarray([item.embedding for item in sorted(response.data, key=lambda item: item.index)], dtype=np.float32)
+
+def top_ids(index: LocalIndex, query: np.ndarray, k: int, exclude: str | None) -> list[str]:
+    ids = [match.id for match in index.query(vector=query, top_k=k + 1, include_metadata=False).matches]
+    return [vector_id for vector_id in ids if vector_id != exclude][:k]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", nargs="?", default=config.LOCAL_INDEX_PATH)
+    parser.add_argument("--dimensions", default="3072,1536,1024,512,256")
+    parser.add_argument("--k", type=int, default=config.TOP_K)
+    parser.add_argument("--sample-queries", type=int, default=200)
+    parser.add_argument("--queries-file", default=None)
+    parser.add_argument("--synthetic", type=int, default=0, help="Random clustered corpus of N vectors instead of source")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    full = synthetic_corpus(args.synthetic, seed=args.seed) if args.synthetic else LocalIndex.from_path(args.source)
+    full_vectors = np.asarray(full.vectors, dtype=np.float32)
+    dimensions = [d for d in (int(value) for value in args.dimensions.split(",")) if d <= full.dimension]
+
+    if args.queries_file:
+        queries = embed_queries(args.queries_file, full.dimension)
+        exclude = [None] * len(queries)
+    else:
+        rng = np.random.default_rng(args.seed)
+        rows = rng.choice(len(full.ids), size=min(args.sample_queries, len(full.ids)), replace=False)
+        queries = full_vectors[rows]
+        exclude = [full.ids[row] for row in rows]
+    truth = [set(top_ids(full, query, args.k, skip)) for query, skip in zip(queries, exclude)]
+    print(f"{len(full.ids)} vectors ({full.dimension} dims), {len(queries)} queries, recall@{args.k} vs full dimension\n")
+
+    print(f"{'dims':>6} {'recall':>8} {'mean ms':>9} {'p95 ms':>8} {'MB':>9} {'KB/vector':>10}")
+    for dimension in dimensions:
+        index = LocalIndex(truncate_vectors(full_vectors, dimension), full.ids, full.metadata)
+        reduced_queries = truncate_vectors(queries, dimension)
+        latencies, hits = [], 0
+        for query, skip, expected in zip(reduced_queries, exclude, truth):
+            start = time.perf_counter()
+            found = top_ids(index, query, args.k, skip)
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected.intersection(found))
+        latencies.sort()
+        recall = hits / max(1, sum(len(expected) for expected in truth))
+        print(f"{dimension:>6} {recall:>8.3f} {np.mean(latencies) * 1000:>9.2f} "
+              f"{latencies[int(0.95 * (len(latencies) - 1))] * 1000:>8.2f} "
+              f"{index.vectors.nbytes / 1024 ** 2:>9.1f} {dimension * 4 / 1024:>10.2f}")
+
+if __name__ == "__main__":
+    main()
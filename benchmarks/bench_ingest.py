@@ -0,0 +1,127 @@
+# benchmarks/bench_ingest.py
+"""
+End-to-end ingestion benchmark: process_pmids (fetch -> chunk -> embed) followed by
+upsert_new_data, against the fake OpenAI / Pinecone server and with NCBI replaced by the
+fixture PMC XML (served with a configurable per-request latency). Reports per-stage
+throughput and the overall chunks/s, so batch sizes and concurrency can be compared.
+
+Usage (from the repository root):
+  python benchmarks/bench_ingest.py [fixture.xml ...] [--copies 20] [--embed-batch-tokens 300000]
+      [--upsert-batch-size 100] [--upsert-concurrency 4] [--fetch-workers 4] [--ncbi-latency-ms 300]
+      [--openai-latency-ms 200] [--pinecone-latency-ms 50] [--chunking chars|tokens] [--doc-store path.sqlite]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_services import add_fault_arguments, faults_from_arguments, start_fake_services
+from utils.doc_store import DocStore
+from utils.observability import StageStats
+from utils.pmc_extract import split_pmc_articles
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture_articles(paths: list[str], copies: int) -> dict:
+    """{pmcid: text} from the fixture XML, repeated `copies` times under distinct PMCIDs (and texts)."""
+    base_articles = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            base_articles.update({pmcid: text for pmcid, text in split_pmc_articles(f.read()).items() if text})
+    articles = {}
+    for copy in range(copies):
+        for pmcid, text in base_articles.items():
+            # A distinct first line per copy keeps the copies from being served by the embedding store
+            articles[f"{pmcid}{copy:04d}"] = f"Copy {copy}\n{text}"
+    return articles
+
+def install_fake_ncbi(chunker, articles: dict, latency_ms: float) -> list[str]:
+    """Replaces the bulk NCBI calls of pubmed_chunker with fixture lookups; returns the fake PMIDs."""
+    pmid_to_pmcid = {str(90000000 + i): pmcid for i, pmcid in enumerate(articles)}
+
+    def fetch_pmcids_bulk(pmids, batch_size=chunker.ELINK_BATCH_SIZE, limiter=None):
+        for _ in range(0, len(pmids), batch_size):
+            if limiter: limiter.acquire()
+            time.sleep(latency_ms / 1000)
+        return {str(pmid): pmid_to_pmcid.get(str(pmid)) for pmid in pmids}
+
+    def fetch_full_texts_pmc_bulk(pmcids, batch_size=chunker.EFETCH_BATCH_SIZE, limiter=None, extract_processes=0):
+        for _ in range(0, len(pmcids), batch_size):
+            if limiter: limiter.acquire()
+            time.sleep(latency_ms / 1000)
+        return {pmcid: articles.get(str(pmcid)) for pmcid in pmcids}
+
+    chunker.fetch_pmcids_bulk = fetch_pmcids_bulk
+    chunker.fetch_full_texts_pmc_bulk = fetch_full_texts_pmc_bulk
+    return list(pmid_to_pmcid)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", nargs="*", help="PMC efetch XML files (default: benchmarks/fixtures/*.xml)")
+    parser.add_argument("--copies", type=int, default=20, help="Times each fixture article is ingested (distinct PMIDs)")
+    parser.add_argument("--embed-batch-tokens", type=int, default=None, help="Default: MAX_TOKENS_PER_REQUEST")
+    parser.add_argument("--upsert-batch-size", type=int, default=None, help="Default: pincone_update.BATCH_SIZE")
+    parser.add_argument("--upsert-concurrency", type=int, default=None, help="Default: UPSERT_CONCURRENCY")
+    parser.add_argument("--fetch-workers", type=int, default=None, help="Default: FETCH_WORKERS")
+    parser.add_argument("--ncbi-latency-ms", type=float, default=300.0)
+    parser.add_argument("--ncbi-rate", type=float, default=None, help="NCBI requests/s (default: NCBI_REQUESTS_PER_SECOND)")
+    parser.add_argument("--chunking", choices=("chars", "tokens"), default=None, help="Default: CHUNKING_MODE")
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--doc-store", default=None, help="Keep chunk text in this local doc store, upsert minimal metadata")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    _, services = start_fake_services(dimension=args.dimension,
+                                      openai_faults=faults_from_arguments(args, "openai"),
+                                      pinecone_faults=faults_from_arguments(args, "pinecone"))
+
+    import openai
+    from pinecone import Pinecone
+    from utils import pubmed_chunker as chunker
+    from utils import pincone_update as updater
+
+    # Point the ingestion scripts at the fake server and keep every run cold
+    openai.api_key = "fake-key"
+    openai.base_url = f"{services.base_url}/v1/"
+    chunker.EMBEDDING_STORE_PATH = ""
+    chunker.EMBED_DIMENSIONS = args.dimension
+    if args.chunking: chunker.CHUNKING_MODE = args.chunking
+    if args.ncbi_rate: chunker.NCBI_REQUESTS_PER_SECOND = args.ncbi_rate
+    if args.upsert_batch_size: updater.BATCH_SIZE = args.upsert_batch_size
+
+    paths = args.fixtures or sorted(
+        os.path.join(FIXTURE_DIR, name) for name in os.listdir(FIXTURE_DIR) if name.endswith(".xml")
+    )
+    articles = load_fixture_articles(paths, args.copies)
+    pmids = install_fake_ncbi(chunker, articles, args.ncbi_latency_ms)
+    print(f"{len(pmids)} articles ({sum(len(t) for t in articles.values())} chars) from {len(paths)} fixture file(s); "
+          f"fake services at {services.base_url}")
+
+    stats = StageStats("ingest benchmark")
+    started_at = time.perf_counter()
+    process_options = {"stats": stats}
+    if args.embed_batch_tokens: process_options["embed_batch_tokens"] = args.embed_batch_tokens
+    if args.fetch_workers: process_options["fetch_workers"] = args.fetch_workers
+    records = chunker.process_pmids(pmids, **process_options)
+    process_seconds = time.perf_counter() - started_at
+
+    index = Pinecone(api_key="fake-key").Index(host=services.base_url)
+    upsert_started_at = time.perf_counter()
+    upsert_options = {"stats": stats, "checkpoint_file": None}
+    if args.doc_store: upsert_options["doc_store"] = DocStore(args.doc_store)
+    if args.upsert_concurrency: upsert_options["concurrency"] = args.upsert_concurrency
+    upserted = updater.upsert_new_data(index, records, set(), **upsert_options)
+    upsert_seconds = time.perf_counter() - upsert_started_at
+    total_seconds = time.perf_counter() - started_at
+
+    stats.report()
+    print(f"\nprocess_pmids: {len(records)} chunks in {process_seconds:.2f}s ({len(records) / process_seconds:.1f} chunks/s)")
+    print(f"upsert_new_data: {upserted} vectors in {upsert_seconds:.2f}s ({upserted / max(upsert_seconds, 1e-9):.1f} vectors/s)")
+    print(f"total: {total_seconds:.2f}s, {len(pmids) / total_seconds:.2f} articles/s")
+    print(f"fake service counters: {services.counters}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# benchmarks/bench_pmc_extract.py
+"""
+Compares the old BeautifulSoup PMC text extraction (<sec> and <p> text both collected, so
+nested paragraphs are extracted twice) with the single-pass lxml extractor in utils/pmc_extract.py.
+
+Usage (from the repository root):
+  python benchmarks/bench_pmc_extract.py [fixture.xml ...] [--repeat N] [--processes N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from utils.pmc_extract import split_pmc_articles, split_pmc_articles_many
+from utils.pubmed_chunker import chunk_text
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def legacy_split_pmc_articles(xml):
+    """The extraction pubmed_chunker used before utils/pmc_extract.py (kept here for comparison)."""
+    soup = BeautifulSoup(xml, "lxml-xml")
+    articles = {}
+    for article in soup.find_all("article"):
+        article_id = article.find("article-id", attrs={"pub-id-type": ["pmc", "pmcid"]})
+        body = article.find("body")
+        if article_id is None or body is None: continue
+        text_parts = [p.get_text() for p in body.find_all(['p', 'sec'])]
+        full_text = "\n".join(text_parts); full_text = re.sub(r'\s+', ' ', full_text).strip()
+        articles[article_id.get_text().replace("PMC", "")] = full_text
+    return articles
+
+def measure(name, split_function, documents, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [split_function(xml) for xml in documents]
+    elapsed = (time.perf_counter() - start) / repeat
+    texts = [text for articles in results for text in articles.values() if text]
+    chars = sum(len(text) for text in texts)
+    chunks = sum(len(chunk_text(text)) for text in texts)
+    print(f"{name:<22} articles={len(texts):>4}  chars={chars:>9}  chunks={chunks:>6}  parse={elapsed * 1000:8.2f} ms")
+    return chars, chunks, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", nargs="*", help="PMC efetch XML files (default: benchmarks/fixtures/*.xml)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=0, help="Also time the process-pool path with N processes")
+    args = parser.parse_args()
+
+    paths = args.fixtures or sorted(
+        os.path.join(FIXTURE_DIR, name) for name in os.listdir(FIXTURE_DIR) if name.endswith(".xml")
+    )
+    documents = []
+    for path in paths:
+        with open(path, 'rb') as f: documents.append(f.read())
+    print(f"{len(documents)} fixture file(s), {sum(len(d) for d in documents)} bytes of XML, repeat={args.repeat}\n")
+
+    old_chars, old_chunks, old_time = measure("bs4 (sec + p)", legacy_split_pmc_articles, documents, args.repeat)
+    new_chars, new_chunks, new_time = measure("lxml single pass", split_pmc_articles, documents, args.repeat)
+    print(f"\nchars x{new_chars / old_chars:.2f}, chunks x{new_chunks / old_chunks:.2f}, parse time x{new_time / old_time:.2f}")
+
+    if args.processes > 1:
+        many = documents * max(1, args.processes * 2)
+        start = time.perf_counter()
+        split_pmc_articles_many(many, processes=1)
+        serial = time.perf_counter() - start
+        split_pmc_articles_many(many[:args.processes], processes=args.processes) # Warm up the pool
+        start = time.perf_counter()
+        split_pmc_articles_many(many, processes=args.processes)
+        parallel = time.perf_counter() - start
+        print(f"{len(many)} documents: serial {serial * 1000:.1f} ms, {args.processes} processes {parallel * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+# benchmarks/fake_services.py
+"""
+Local stand-ins for the OpenAI embeddings API and a Pinecone index, for benchmarking
+mind-api without live services. One HTTP server answers both:
+
+  OpenAI    POST /v1/embeddings              deterministic unit vectors (seeded by the input text)
+  Pinecone  POST /query, /vectors/upsert, /vectors/delete, /describe_index_stats, GET /vectors/fetch
+            GET /indexes, /indexes/<name>    (control plane; the index host is this server)
+
+Latency (base + uniform jitter) and errors (HTTP 429 / 500 at a given rate) can be injected
+per service. Queries run against whatever was upserted, plus optional synthetic seed vectors.
+
+Usage (from the repository root):
+  python benchmarks/fake_services.py [--port 8900] [--seed-vectors 10000] [--openai-latency-ms 80] ...
+then start the API against it with the environment variables the server prints.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.local_index import LocalIndex
+
+DEFAULT_DIMENSION = 3072
+DEFAULT_INDEX_NAME = "mind-bench"
+SEED_MODULES = ("design", "workflow", "analysis", "interpretation", "ethics")
+
+
+def deterministic_vector(text: str, dimension: int) -> np.ndarray:
+    """Unit-length float32 vector that depends only on the text (same text -> same vector)."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FaultInjector:
+    """Sleeps base + jitter milliseconds per request and fails a fraction of requests."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+
+    def apply(self) -> int | None:
+        """Sleeps, then returns an HTTP error status to send instead of the response (or None)."""
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+
+class FakeIndexStore:
+    """Namespaced in-memory vectors; queries go through LocalIndex (rebuilt after writes)."""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._records = {} # namespace -> {id: (values, metadata)}
+        self._indexes = {} # namespace -> LocalIndex, dropped on every write to that namespace
+        self._lock = threading.Lock()
+
+    def seed(self, count: int, namespace: str = "") -> None:
+        """Adds synthetic chunks spread over SEED_MODULES so unfiltered and filtered queries both return matches."""
+        records = []
+        for i in range(count):
+            module = SEED_MODULES[i % len(SEED_MODULES)]
+            text = f"synthetic chunk {i} about {module}"
+            records.append({"id": f"{module}_seed_{i}", "values": deterministic_vector(text, self.dimension),
+                            "metadata": {"module": module, "text": text, "source": "seed", "pmid": str(i)}})
+        self.upsert(records, namespace)
+
+    def upsert(self, vectors: list, namespace: str = "") -> int:
+        with self._lock:
+            records = self._records.setdefault(namespace, {})
+            for vector in vectors:
+                records[vector["id"]] = (np.asarray(vector["values"], dtype=np.float32), vector.get("metadata") or {})
+            self._indexes.pop(namespace, None)
+        return len(vectors)
+
+    def delete(self, ids: list, namespace: str = "", delete_all: bool = False) -> None:
+        with self._lock:
+            records = self._records.setdefault(namespace, {})
+            if delete_all:
+                records.clear()
+            for vector_id in ids:
+                records.pop(vector_id, None)
+            self._indexes.pop(namespace, None)
+
+    def fetch(self, ids: list, namespace: str = "") -> dict:
+        with self._lock:
+            records = self._records.get(namespace, {})
+            return {vector_id: {"id": vector_id, "values": records[vector_id][0].tolist(), "metadata": records[vector_id][1]}
+                    for vector_id in ids if vector_id in records}
+
+    def _index(self, namespace: str) -> LocalIndex | None:
+        with self._lock:
+            index = self._indexes.get(namespace)
+            records = self._records.get(namespace)
+            if index is None and records:
+                ids = list(records)
+                vectors = np.stack([records[vector_id][0] for vector_id in ids])
+                index = self._indexes[namespace] = LocalIndex(vectors, ids, [records[vector_id][1] for vector_id in ids])
+            return index
+
+    def query(self, vector: list, top_k: int, namespace: str = "", filter: dict | None = None,
+              include_metadata: bool = True) -> list[dict]:
+        index = self._index(namespace)
+        if index is None:
+            return []
+        result = index.query(vector=vector, top_k=top_k, include_metadata=include_metadata, filter=filter)
+        return [{"id": match.id, "score": float(match.score), "values": [],
+                 **({"metadata": match.metadata} if include_metadata else {})} for match in result.matches]
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = {namespace: {"vectorCount": len(records)} for namespace, records in self._records.items()}
+        return {"namespaces": namespaces, "dimension": self.dimension, "indexFullness": 0.0,
+                "totalVectorCount": sum(ns["vectorCount"] for ns in namespaces.values())}
+
+
+class FakeServices:
+    """Shared state of the fake server: the index store, fault injectors and request counters."""
+
+    def __init__(self, dimension: int = DEFAULT_DIMENSION, index_name: str = DEFAULT_INDEX_NAME,
+                 openai_faults: FaultInjector | None = None, pinecone_faults: FaultInjector | None = None):
+        self.dimension = dimension
+        self.index_name = index_name
+        self.store = FakeIndexStore(dimension)
+        self.openai_faults = openai_faults or FaultInjector()
+        self.pinecone_faults = pinecone_faults or FaultInjector()
+        self.base_url = None
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real APIs
+    services: FakeServices = None
+
+    def log_message(self, format, *args): # Quiet: one line per request would dominate the benchmark
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _send_json(self, payload, status: int = 200, headers: dict | None = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int) -> None:
+        self.services.count(f"errors_{status}")
+        message = "Rate limit reached (fake)" if status == 429 else "Injected server error (fake)"
+        self._send_json({"error": {"message": message, "type": "fake_error", "code": status}}, status,
+                        headers={"Retry-After": "1"} if status == 429 else None)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        services = self.services
+        if url.path == "/indexes":
+            self._send_json({"indexes": [self._describe_index()]})
+        elif url.path.startswith("/indexes/"):
+            self._send_json(self._describe_index())
+        elif url.path == "/vectors/fetch":
+            if (status := services.pinecone_faults.apply()) is not None:
+                return self._send_error(status)
+            params = parse_qs(url.query)
+            namespace = (params.get("namespace") or [""])[0]
+            services.count("pinecone_fetch")
+            self._send_json({"vectors": services.store.fetch(params.get("ids", []), namespace), "namespace": namespace})
+        elif url.path == "/stats":
+            self._send_json({"counters": services.counters, "index": services.store.stats()})
+        else:
+            self._send_json({"error": f"unknown path {url.path}"}, 404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        services = self.services
+        body = self._read_json()
+        if path.endswith("/embeddings"):
+            return self._embeddings(body)
+
+        if path == "/describe_index_stats":
+            return self._send_json(services.store.stats())
+        if (status := services.pinecone_faults.apply()) is not None:
+            return self._send_error(status)
+        namespace = body.get("namespace", "")
+        if path == "/query":
+            services.count("pinecone_query")
+            matches = services.store.query(body.get("vector") or [], int(body.get("topK", 10)), namespace,
+                                           body.get("filter"), bool(body.get("includeMetadata", False)))
+            self._send_json({"matches": matches, "namespace": namespace, "usage": {"readUnits": 1}})
+        elif path == "/vectors/upsert":
+            vectors = body.get("vectors", [])
+            services.count("pinecone_upserted_vectors", len(vectors))
+            self._send_json({"upsertedCount": services.store.upsert(vectors, namespace)})
+        elif path == "/vectors/delete":
+            services.store.delete(body.get("ids", []), namespace, bool(body.get("deleteAll")))
+            self._send_json({})
+        else:
+            self._send_json({"error": f"unknown path {path}"}, 404)
+
+    def _describe_index(self) -> dict:
+        services = self.services
+        # Both the older (dimension/metric/spec) and the newer (schema/deployment) describe shapes
+        return {"name": services.index_name, "dimension": services.dimension, "metric": "cosine",
+                "host": services.base_url, "vector_type": "dense", "deletion_protection": "disabled",
+                "spec": {"serverless": {"cloud": "aws", "region": "us-east-1"}},
+                "schema": {"fields": {"values": {"type": "dense_vector", "dimension": services.dimension, "metric": "cosine"}}},
+                "deployment": {"deployment_type": "managed", "cloud": "aws", "region": "us-east-1"},
+                "status": {"ready": True, "state": "Ready"}}
+
+    def _embeddings(self, body: dict) -> None:
+        services = self.services
+        if (status := services.openai_faults.apply()) is not None:
+            return self._send_error(status)
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimension = int(body.get("dimensions") or services.dimension)
+        use_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for i, text in enumerate(inputs):
+            vector = deterministic_vector(text if isinstance(text, str) else json.dumps(text), dimension)
+            embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii") if use_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(text.split()) if isinstance(text, str) else len(text) for text in inputs)
+        services.count("openai_requests")
+        services.count("openai_inputs", len(inputs))
+        self._send_json(
+            {"object": "list", "data": data, "model": body.get("model", ""),
+             "usage": {"prompt_tokens": tokens, "total_tokens": tokens}},
+            headers={"x-ratelimit-limit-requests": "10000", "x-ratelimit-remaining-requests": "9999",
+                     "x-ratelimit-limit-tokens": "10000000", "x-ratelimit-remaining-tokens": "9999999",
+                     "x-ratelimit-reset-requests": "6ms", "x-ratelimit-reset-tokens": "0s"},
+        )
+
+
+def start_fake_services(host: str = "127.0.0.1", port: int = 0, **options) -> tuple[ThreadingHTTPServer, FakeServices]:
+    """Starts the server on a daemon thread (port 0 picks a free port). services.base_url is its URL."""
+    services = FakeServices(**options)
+    handler = type("BoundFakeServiceHandler", (FakeServiceHandler,), {"services": services})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    services.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="fake-services", daemon=True).start()
+    return server, services
+
+def service_environment(services: FakeServices) -> dict:
+    """Environment variables that point mind-api (app.py / asgi.py) at the fake server."""
+    return {
+        "OPENAI_API_KEY": "fake-key",
+        "OPENAI_BASE_URL": f"{services.base_url}/v1",
+        "PINECONE_API_KEY": "fake-key",
+        "INDEX_NAME": services.index_name,
+        "PINECONE_INDEX_HOST": services.base_url,
+        "EMBEDDING_DIMENSIONS": str(services.dimension),
+    }
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    for service in ("openai", "pinecone"):
+        parser.add_argument(f"--{service}-latency-ms", type=float, default=0.0)
+        parser.add_argument(f"--{service}-jitter-ms", type=float, default=0.0)
+        parser.add_argument(f"--{service}-error-rate", type=float, default=0.0, help="Fraction answered with HTTP 500")
+        parser.add_argument(f"--{service}-rate-limit-rate", type=float, default=0.0, help="Fraction answered with HTTP 429")
+
+def faults_from_arguments(args, service: str) -> FaultInjector:
+    return FaultInjector(
+        latency_ms=getattr(args, f"{service}_latency_ms"), jitter_ms=getattr(args, f"{service}_jitter_ms"),
+        error_rate=getattr(args, f"{service}_error_rate"), rate_limit_rate=getattr(args, f"{service}_rate_limit_rate"),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--dimension", type=int, default=DEFAULT_DIMENSION)
+    parser.add_argument("--seed-vectors", type=int, default=10000, help="Synthetic vectors to preload for queries")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server, services = start_fake_services(
+        args.host, args.port, dimension=args.dimension,
+        openai_faults=faults_from_arguments(args, "openai"), pinecone_faults=faults_from_arguments(args, "pinecone"),
+    )
+    services.store.seed(args.seed_vectors)
+    print(f"Fake OpenAI + Pinecone listening on {services.base_url} ({args.seed_vectors} seed vectors, dim {args.dimension})")
+    print("Point the API at it with:")
+    for name, value in service_environment(services).items():
+        print(f"  export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
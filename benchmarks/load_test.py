@@ -0,0 +1,176 @@
+# benchmarks/load_test.py
+"""
+Load generator for the RAG API: sends /rag/query requests from N concurrent clients and
+reports throughput, latency percentiles (p50/p95/p99) and status codes, followed by the
+server's own per-stage latency from /metrics (mean per stage over the run).
+
+Query texts are drawn from a pool of --unique-queries synthetic questions, so repeated
+texts exercise the embedding / result caches; use a large pool to measure cold paths.
+
+Usage (from the repository root), e.g. against the fake services:
+  python benchmarks/fake_services.py --openai-latency-ms 80 --pinecone-latency-ms 30 &
+  (export the printed variables) gunicorn -w 4 app:app -b 127.0.0.1:5050   # or: uvicorn asgi:app --port 5050
+  python benchmarks/load_test.py --url http://127.0.0.1:5050 --concurrency 64 --requests 5000
+
+--spawn-fakes runs the fake services and the chosen app (--mode flask|asgi) in-process instead.
+That is handy for quick comparisons, but everything then shares one GIL with the load
+generator; run the three as separate processes for numbers worth recording.
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOPICS = ("sampling strategy", "sequencing bias", "rarefaction", "batch effects", "negative controls",
+          "16S primers", "metadata standards", "alpha diversity", "confounding factors", "DADA2 denoising")
+MODULES = (None, "design", "workflow", "analysis", "interpretation")
+STAGE_SUM_RE = re.compile(r'^rag_stage_duration_seconds_sum\{stage="([^"]+)"\} (\S+)$', re.M)
+STAGE_COUNT_RE = re.compile(r'^rag_stage_duration_seconds_count\{stage="([^"]+)"\} (\S+)$', re.M)
+
+
+def build_queries(unique_queries: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    return [{"text": f"How does {rng.choice(TOPICS)} affect study {i} results?", "module": rng.choice(MODULES)}
+            for i in range(unique_queries)]
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def stage_means(metrics_text: str) -> dict:
+    sums = {stage: float(value) for stage, value in STAGE_SUM_RE.findall(metrics_text)}
+    counts = {stage: float(value) for stage, value in STAGE_COUNT_RE.findall(metrics_text)}
+    return {stage: (sums[stage], counts[stage]) for stage in sums if stage in counts}
+
+async def run_load(url: str, queries: list[dict], concurrency: int, total_requests: int, duration: float | None,
+                   timeout: float) -> tuple[list[float], dict, float]:
+    latencies = []
+    statuses = {}
+    sent = 0
+    deadline = time.perf_counter() + duration if duration else None
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def worker(worker_id: int):
+            nonlocal sent
+            rng = random.Random(worker_id)
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline: return
+                elif sent >= total_requests:
+                    return
+                sent += 1
+                query = rng.choice(queries)
+                payload = {"text": query["text"], **({"module": query["module"]} if query["module"] else {})}
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/rag/query", json=payload)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+    return latencies, statuses, elapsed
+
+def fetch_metrics(url: str) -> str:
+    try:
+        response = httpx.get(f"{url.rstrip('/')}/metrics", timeout=10)
+        return response.text if response.status_code == 200 else ""
+    except httpx.HTTPError:
+        return ""
+
+def spawn_in_process(args) -> str:
+    """Starts the fake services and the API (Flask via werkzeug's threaded server, or uvicorn) in this process."""
+    from benchmarks.fake_services import start_fake_services, service_environment, faults_from_arguments
+
+    _, services = start_fake_services(dimension=args.dimension,
+                                      openai_faults=faults_from_arguments(args, "openai"),
+                                      pinecone_faults=faults_from_arguments(args, "pinecone"))
+    services.store.seed(args.seed_vectors)
+    os.environ.update(service_environment(services))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    port = args.app_port
+    if args.mode == "asgi":
+        import uvicorn
+        from asgi import app
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+    else:
+        import logging
+        from werkzeug.serving import make_server
+        from app import app
+        logging.getLogger("werkzeug").setLevel(logging.WARNING) # No access log line per request
+        server = make_server("127.0.0.1", port, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100): # Wait for the API to accept connections
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200: break
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    print(f"Spawned fake services at {services.base_url} and the {args.mode} app at {url}")
+    return url
+
+def main():
+    from benchmarks.fake_services import add_fault_arguments
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5050")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=None, help="Run for N seconds instead of --requests")
+    parser.add_argument("--unique-queries", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent (and not measured) before the run")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--spawn-fakes", action="store_true", help="Run the fake services and the API in-process")
+    parser.add_argument("--mode", choices=("flask", "asgi"), default="flask", help="App to spawn with --spawn-fakes")
+    parser.add_argument("--app-port", type=int, default=5057)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--seed-vectors", type=int, default=10000)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    url = spawn_in_process(args) if args.spawn_fakes else args.url
+    queries = build_queries(args.unique_queries)
+    if args.warmup:
+        asyncio.run(run_load(url, queries, min(args.concurrency, args.warmup), args.warmup, None, args.timeout))
+
+    metrics_before = stage_means(fetch_metrics(url))
+    latencies, statuses, elapsed = asyncio.run(
+        run_load(url, queries, args.concurrency, args.requests, args.duration, args.timeout))
+    metrics_after = stage_means(fetch_metrics(url))
+
+    latencies.sort()
+    ok = int(statuses.get("200", 0))
+    print(f"\n{len(latencies)} requests in {elapsed:.2f}s with {args.concurrency} clients "
+          f"({len(latencies) / elapsed:.1f} req/s, {ok / elapsed:.1f} successful/s)")
+    print(f"latency ms: p50={percentile(latencies, 0.50) * 1000:.1f}  p95={percentile(latencies, 0.95) * 1000:.1f}  "
+          f"p99={percentile(latencies, 0.99) * 1000:.1f}  max={latencies[-1] * 1000 if latencies else float('nan'):.1f}")
+    print("status codes: " + ", ".join(f"{status}={count}" for status, count in sorted(statuses.items())))
+
+    if metrics_after:
+        # /metrics is per worker process: with several workers this covers whichever ones answered the scrapes
+        print("\nserver stage latency over the run (mean ms, from /metrics):")
+        for stage, (total, count) in sorted(metrics_after.items()):
+            before_total, before_count = metrics_before.get(stage, (0.0, 0.0))
+            if count > before_count:
+                print(f"  {stage:<16} {(total - before_total) / (count - before_count) * 1000:8.2f}  (n={int(count - before_count)})")
+
+if __name__ == "__main__":
+    main()
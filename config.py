@@ -8,14 +8,110 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY", "")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT") # Replace if needed
 INDEX_NAME = os.getenv("INDEX_NAME", "") # Set default 'mind' or load from env
 NAMESPACE = os.getenv("PINECONE_NAMESPACE", "") # Default to empty namespace
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST", "") # Optional; skips the host lookup when connecting
+
+# --- Retriever Backend ---
+# "pinecone" (default) or "local" for the in-process NumPy index built from the chunker output
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "pinecone").lower()
+# Records JSON/JSONL file or binary vector store (utils/vector_format.py) to load the local index from
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "pinecone_data_final_modules.json")
 
 # --- OpenAI Configuration ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
 EMBEDDING_MODEL = "text-embedding-3-large"
+# Vector size requested from OpenAI for both queries (utils/embedder.py) and chunks (utils/pubmed_chunker.py).
+# text-embedding-3 models return shortened vectors for dimensions < 3072 (e.g. 1024 or 256); the index
+# must hold vectors of the same size, see utils/reindex.py for migrating one.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 3072))
+
+# --- OpenAI Rate Limits (utils/rate_limiter.py) ---
+# Starting point of the client-side pacing; replaced by the x-ratelimit-* headers of the first response
+OPENAI_RATE_LIMIT_ENABLED = os.getenv("OPENAI_RATE_LIMIT_ENABLED", "True").lower() in ['true', '1', 't']
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 3000))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", 1000000))
+# Fraction of both limits ingestion (utils/pubmed_chunker.py) leaves unused for the serving path
+OPENAI_SERVING_HEADROOM = float(os.getenv("OPENAI_SERVING_HEADROOM", 0.2))
+# Retries of rate-limited / failed embedding calls on the serving path, and their max backoff
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+OPENAI_BACKOFF_CAP_SECONDS = float(os.getenv("OPENAI_BACKOFF_CAP_SECONDS", 4))
+
+# --- Query Embedding Cache ---
+# In-process LRU (per worker) in front of an optional SQLite file shared by all workers
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() in ['true', '1', 't']
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 64 * 1024 * 1024)) # ~5000 3072-dim vectors
+EMBEDDING_CACHE_TTL_SECONDS = int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", 24 * 3600))
+EMBEDDING_CACHE_DB_PATH = os.getenv("EMBEDDING_CACHE_DB_PATH", "") # Empty disables the shared on-disk tier
+
+# --- Semantic Result Cache ---
+# Near-duplicate queries (cosine >= threshold) reuse a previous query's Pinecone results
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "True").lower() in ['true', '1', 't']
+RESULT_CACHE_THRESHOLD = float(os.getenv("RESULT_CACHE_THRESHOLD", 0.97))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 256)) # Entries per module filter
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", 3600))
 
 # --- API / Retrieval Configuration ---
 TOP_K = 10 # Number of results to retrieve from Pinecone
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", 50)) # Upper bound for the per-request 'top_k' option
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 256)) # Max items accepted by /rag/query/batch
+BATCH_QUERY_WORKERS = int(os.getenv("BATCH_QUERY_WORKERS", 8)) # Concurrent Pinecone queries per worker process
+# Namespaces a /rag/query request may fan out to with "namespaces" (comma-separated), besides NAMESPACE,
+# which is always allowed. An empty entry is Pinecone's default namespace "" (e.g. ",archive").
+QUERY_NAMESPACES = [name.strip() for name in os.getenv("QUERY_NAMESPACES").split(",")] if os.getenv("QUERY_NAMESPACES") else []
+
+# --- Request Coalescing ---
+# Concurrent identical queries (same normalized text and module) share one embedding + retrieval
+COALESCE_QUERIES = os.getenv("COALESCE_QUERIES", "True").lower() in ['true', '1', 't']
+# While a batch is in flight, distinct query embeddings requested within this window go to OpenAI as
+# one batched call; a query arriving when nothing is in flight is sent at once (0 disables batching)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", 5))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", 64))
+
+# --- Document Store ---
+# SQLite file with the full chunk metadata keyed by vector ID (utils/doc_store.py, written by pincone_update).
+# When set, the index is queried without metadata and results are hydrated from this file.
+DOC_STORE_PATH = os.getenv("DOC_STORE_PATH", "")
+
+# --- Lexical Index (BM25 over chunk text, tags and PMIDs) ---
+# Records JSON/JSONL file or vector store to build it from; empty = reuse the local backend's records
+# (RETRIEVER_BACKEND=local) or no lexical index (Pinecone)
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "")
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "True").lower() in ['true', '1', 't']
+# Identifier-like queries (PMIDs, tool names such as DADA2, exact tags) are answered from the lexical index without embedding
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "True").lower() in ['true', '1', 't']
+# Fuse lexical and vector results (Reciprocal Rank Fusion) for all other queries
+HYBRID_FUSION_ENABLED = os.getenv("HYBRID_FUSION_ENABLED", "False").lower() in ['true', '1', 't']
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# --- Admin Endpoints ---
+# Shared secret for POST /cache/invalidate, sent as "Authorization: Bearer <token>" (pincone_update sends
+# it from the same env var). Empty disables the endpoint, so nobody can keep the caches cold.
+CACHE_ADMIN_TOKEN = os.getenv("CACHE_ADMIN_TOKEN", "")
+
+# --- Response Shaping / Encoding ---
+SNIPPET_CHARS = int(os.getenv("SNIPPET_CHARS", 240)) # Length of 'snippet' results
+SNIPPET_HIGHLIGHT_PRE = os.getenv("SNIPPET_HIGHLIGHT_PRE", "<em>")
+SNIPPET_HIGHLIGHT_POST = os.getenv("SNIPPET_HIGHLIGHT_POST", "</em>")
+# Query responses are gzip/br-compressed (br needs the optional brotli package) when the client accepts it
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "True").lower() in ['true', '1', 't']
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024)) # Smaller bodies aren't worth compressing
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+
+# --- Service Startup ---
+# Clients are created lazily in each worker process (utils/services.py)
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "False").lower() in ['true', '1', 't'] # Pre-open connections when a worker starts
+SERVICE_INIT_RETRY_SECONDS = float(os.getenv("SERVICE_INIT_RETRY_SECONDS", 10)) # Min. wait before retrying a failed init
+
+# --- Async Serving (asgi.py) ---
+# Per-process HTTP connection pools of the async OpenAI / Pinecone clients, shared by all in-flight queries
+ASYNC_MAX_CONNECTIONS = int(os.getenv("ASYNC_MAX_CONNECTIONS", 100))
+ASYNC_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ASYNC_MAX_KEEPALIVE_CONNECTIONS", 20))
+ASYNC_KEEPALIVE_EXPIRY = float(os.getenv("ASYNC_KEEPALIVE_EXPIRY", 30.0)) # Seconds an idle connection is kept open
+ASYNC_REQUEST_TIMEOUT = float(os.getenv("ASYNC_REQUEST_TIMEOUT", 30.0))
+
+# --- Logging / Metrics ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper() # DEBUG adds per-stage timings of every request
 
 # --- Flask Configuration (Optional) ---
 # Example: For production, you'd set DEBUG=False
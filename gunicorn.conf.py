@@ -0,0 +1,11 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn app:app` from the repository root.
+import config
+
+
+def post_fork(server, worker):
+    # Each worker creates its own clients after the fork (utils/services.py); optionally
+    # connect right away so the first request doesn't pay for it.
+    if config.WARMUP_ON_START:
+        from utils.services import warm_up_in_background
+        warm_up_in_background()
@@ -0,0 +1,63 @@
+# tests/test_cache_invalidate.py
+import pytest
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+import app as flask_app
+import asgi
+import config
+from utils.services import is_admin_request
+
+
+class FakeResultCache:
+    def __init__(self):
+        self.cleared = 0
+
+    def invalidate(self, predicate=None):
+        self.cleared += 1
+        return 3
+
+
+def test_is_admin_request_requires_a_configured_token(monkeypatch):
+    monkeypatch.setattr(config, "CACHE_ADMIN_TOKEN", "")
+    assert not is_admin_request("Bearer ")
+    assert not is_admin_request(None)
+
+    monkeypatch.setattr(config, "CACHE_ADMIN_TOKEN", "s3cret")
+    assert is_admin_request("Bearer s3cret")
+    assert is_admin_request("bearer s3cret")
+    assert not is_admin_request("Bearer wrong")
+    assert not is_admin_request("s3cret")
+    assert not is_admin_request(None)
+
+
+@pytest.fixture
+def flask_client(monkeypatch):
+    cache = FakeResultCache()
+    monkeypatch.setattr(flask_app, "result_cache", cache)
+    return flask_app.app.test_client(), cache
+
+
+@pytest.fixture
+def asgi_client(monkeypatch):
+    cache = FakeResultCache()
+    monkeypatch.setattr(asgi, "result_cache", cache)
+    # Same routes without the lifespan, so no index/doc store is loaded
+    return TestClient(Starlette(routes=asgi.app.routes)), cache
+
+
+@pytest.mark.parametrize("client_fixture", ["flask_client", "asgi_client"])
+def test_cache_invalidate_rejects_requests_without_the_token(request, monkeypatch, client_fixture):
+    client, cache = request.getfixturevalue(client_fixture)
+
+    monkeypatch.setattr(config, "CACHE_ADMIN_TOKEN", "")
+    assert client.post("/cache/invalidate", json={}).status_code == 401
+
+    monkeypatch.setattr(config, "CACHE_ADMIN_TOKEN", "s3cret")
+    assert client.post("/cache/invalidate", json={}).status_code == 401
+    assert client.post("/cache/invalidate", json={}, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert cache.cleared == 0
+
+    response = client.post("/cache/invalidate", json={}, headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert cache.cleared == 1
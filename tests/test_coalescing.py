@@ -0,0 +1,106 @@
+# tests/test_coalescing.py
+import asyncio
+import threading
+import time
+
+from utils.coalescing import AsyncEmbeddingBatcher, AsyncSingleFlight, EmbeddingBatcher, SingleFlight
+
+
+def fake_vectors(texts):
+    return [[float(len(text))] for text in texts]
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    flights = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def compute():
+        runs.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", compute))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flights.stats()["calls"] + flights.stats()["shared"] < 5:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert runs == [1] and results == ["result"] * 5
+    assert flights.stats() == {"calls": 1, "shared": 4, "in_flight": 0}
+
+
+def test_async_single_flight_counts():
+    async def main():
+        flights = AsyncSingleFlight()
+        runs = []
+
+        async def compute():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return 42
+
+        results = await asyncio.gather(*(flights.do("key", compute) for _ in range(4)))
+        return runs, results, flights.stats()
+
+    runs, results, stats = asyncio.run(main())
+    assert runs == [1] and results == [42] * 4
+    assert stats == {"calls": 1, "shared": 3, "in_flight": 0}
+
+
+def test_lone_request_skips_the_window():
+    batcher = EmbeddingBatcher(fake_vectors, window_seconds=2.0)
+    start = time.perf_counter()
+    assert batcher.embed("abc") == [3.0]
+    assert time.perf_counter() - start < 1.0
+
+
+def test_requests_during_a_batch_are_batched_together():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_embed(texts):
+        calls.append(list(texts))
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+        return fake_vectors(texts)
+
+    batcher = EmbeddingBatcher(slow_embed, window_seconds=0.2)
+    results = {}
+    first = threading.Thread(target=lambda: results.setdefault("a", batcher.embed("a")))
+    first.start()
+    started.wait(5)
+    others = [threading.Thread(target=lambda text=text: results.setdefault(text, batcher.embed(text))) for text in ("bb", "ccc", "dddd")]
+    for thread in others:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [first, *others]:
+        thread.join()
+
+    assert calls[0] == ["a"] and sorted(calls[1]) == ["bb", "ccc", "dddd"]
+    assert results == {"a": [1.0], "bb": [2.0], "ccc": [3.0], "dddd": [4.0]}
+    assert batcher.stats()["batches"] == 2
+
+
+def test_async_batcher_joins_same_iteration_texts():
+    calls = []
+
+    async def embed_many(texts):
+        calls.append(list(texts))
+        return fake_vectors(texts)
+
+    async def main():
+        batcher = AsyncEmbeddingBatcher(embed_many, window_seconds=2.0)
+        start = time.perf_counter()
+        vectors = await asyncio.gather(*(batcher.embed(text) for text in ("a", "bb", "ccc")))
+        return vectors, time.perf_counter() - start
+
+    vectors, elapsed = asyncio.run(main())
+    assert vectors == [[1.0], [2.0], [3.0]] and calls == [["a", "bb", "ccc"]]
+    assert elapsed < 1.0
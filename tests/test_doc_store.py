@@ -0,0 +1,64 @@
+# tests/test_doc_store.py
+from types import SimpleNamespace
+
+import pytest
+
+from utils import doc_store as doc_store_module
+from utils import pincone_update
+from utils.doc_store import DocStore, index_metadata
+from utils.retriever import query_pinecone
+
+FULL_METADATA = {"pmid": "1", "module": "protocol", "text": "Reads were denoised.", "source": "PubMed",
+                 "tags": ["dada2"], "char_start": 0, "char_end": 20}
+
+
+class SlimIndex:
+    """Pinecone stand-in that only knows the slim metadata upserted alongside a doc store."""
+    def __init__(self):
+        self.vectors = {}
+        self.include_metadata = None
+
+    def upsert(self, vectors, namespace):
+        self.vectors.update((vector_id, metadata) for vector_id, _, metadata in vectors)
+        return SimpleNamespace(upserted_count=len(vectors))
+
+    def query(self, vector, namespace, top_k, include_metadata, filter):
+        self.include_metadata = include_metadata
+        return SimpleNamespace(matches=[SimpleNamespace(id=vector_id, score=0.9, metadata=metadata if include_metadata else None)
+                                        for vector_id, metadata in self.vectors.items()][:top_k])
+
+
+def test_index_metadata_keeps_only_the_filter_fields():
+    assert index_metadata(FULL_METADATA) == {"pmid": "1", "module": "protocol"}
+    assert index_metadata({"module": "protocol", "pmid": None}) == {"module": "protocol"}
+
+
+def test_slim_matches_are_hydrated_from_the_store(tmp_path):
+    path = str(tmp_path / "docs.sqlite")
+    index = SlimIndex()
+    writer = DocStore(path)
+    pincone_update.upsert_new_data(index, [{"id": "protocol_1_0", "values": [0.1, 0.2], "metadata": FULL_METADATA}],
+                                   set(), checkpoint_file="", doc_store=writer)
+    writer.close()
+    assert index.vectors == {"protocol_1_0": {"pmid": "1", "module": "protocol"}}
+
+    results = query_pinecone(index, [0.1, 0.2], doc_store=DocStore(path, read_only=True))
+    assert index.include_metadata is False
+    assert results[0]["text"] == "Reads were denoised." and results[0]["source"] == "PubMed"
+    assert (results[0]["char_start"], results[0]["char_end"]) == (0, 20)
+
+
+def test_bulk_lookup_spans_several_batches_and_skips_missing_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr(doc_store_module, "LOOKUP_BATCH_SIZE", 3)
+    store = DocStore(str(tmp_path / "docs.sqlite"))
+    store.put_many([{"id": f"id{i}", "metadata": {"text": f"chunk {i}"}} for i in range(7)])
+    store.delete(["id2"])
+
+    found = store.get_many([f"id{i}" for i in range(9)])
+    assert sorted(found) == ["id0", "id1", "id3", "id4", "id5", "id6"]
+    assert found["id6"] == {"text": "chunk 6"} and store.count() == 6
+
+
+def test_read_only_store_must_exist(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        DocStore(str(tmp_path / "missing.sqlite"), read_only=True)
@@ -0,0 +1,36 @@
+# tests/test_embedder.py
+from types import SimpleNamespace
+
+from utils import embedder
+from utils.coalescing import EmbeddingBatcher
+from utils.embedding_cache import EmbeddingCache
+
+
+def fake_response(texts):
+    return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=[float(len(text)), 1.0]) for i, text in enumerate(texts)])
+
+
+def test_batched_miss_is_looked_up_once(monkeypatch):
+    requests = []
+    monkeypatch.setattr(embedder, "embedding_cache", EmbeddingCache(max_bytes=1 << 20))
+    monkeypatch.setattr(embedder, "create_embeddings", lambda texts: requests.append(texts) or fake_response(texts))
+    batcher = EmbeddingBatcher(embedder.embed_cache_misses, window_seconds=0.001)
+
+    assert embedder.generate_embedding("Hello  world", batcher=batcher) == [11.0, 1.0]
+    assert embedder.get_embedding_cache_stats()["misses"] == 1
+
+    assert embedder.generate_embedding(" Hello world ", batcher=batcher) == [11.0, 1.0]
+    stats = embedder.get_embedding_cache_stats()
+    assert stats["misses"] == 1 and stats["memory_hits"] == 1
+    assert requests == [["Hello world"]]
+
+
+def test_generate_embeddings_dedupes_and_keeps_order(monkeypatch):
+    requests = []
+    monkeypatch.setattr(embedder, "embedding_cache", EmbeddingCache(max_bytes=1 << 20))
+    monkeypatch.setattr(embedder, "create_embeddings", lambda texts: requests.append(texts) or fake_response(texts))
+
+    vectors = embedder.generate_embeddings(["abc", "", "de", " abc "])
+
+    assert vectors == [[3.0, 1.0], [], [2.0, 1.0], [3.0, 1.0]]
+    assert requests == [["abc", "de"]]
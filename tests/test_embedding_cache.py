@@ -0,0 +1,64 @@
+# tests/test_embedding_cache.py
+from array import array
+
+from utils import embedding_cache
+from utils.embedding_cache import EmbeddingCache, MemoryTier, SQLiteTier, make_cache_key, normalize_text
+
+
+def test_normalize_text_collapses_whitespace_and_unicode_forms():
+    assert normalize_text("  16S\t rRNA\n\namplicons ") == "16S rRNA amplicons"
+    assert normalize_text("prote\u0301ina") == normalize_text("prot\u00e9ina")
+    assert normalize_text("DADA2") != normalize_text("dada2") # Case is meaningful to the embedding model
+
+
+def test_cache_key_depends_on_text_model_and_dimensions():
+    key = make_cache_key("reads", "text-embedding-3-large", 1024)
+    assert key == make_cache_key("reads", "text-embedding-3-large", 1024)
+    assert key != make_cache_key("reads", "text-embedding-3-small", 1024)
+    assert key != make_cache_key("reads", "text-embedding-3-large", 256)
+    assert key != make_cache_key("read", "text-embedding-3-large", 1024)
+
+
+def test_hits_misses_and_disk_promotion(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(max_bytes=1 << 20, disk_path=path)
+    key = make_cache_key("reads", "model", 4)
+
+    assert cache.get(key) is None
+    cache.put(key, [0.5, 0.25, 0.0, 1.0])
+    assert cache.get(key) == [0.5, 0.25, 0.0, 1.0]
+
+    # A new process sees the shared disk tier; the hit is promoted into its memory tier
+    other = EmbeddingCache(max_bytes=1 << 20, disk_path=path)
+    assert other.get(key) == [0.5, 0.25, 0.0, 1.0]
+    assert other.get(key) == [0.5, 0.25, 0.0, 1.0]
+    assert (cache.stats()["misses"], cache.stats()["memory_hits"]) == (1, 1)
+    assert (other.stats()["disk_hits"], other.stats()["memory_hits"], other.stats()["hit_rate"]) == (1, 1, 1.0)
+
+
+def test_memory_tier_evicts_least_recently_used_within_its_budget(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "ENTRY_OVERHEAD_BYTES", 0)
+    tier = MemoryTier(max_bytes=2 * 4 * 4) # Two 4-dim float32 vectors
+    vector = array("f", [0.0] * 4)
+    tier.put("a", vector)
+    tier.put("b", vector)
+    assert tier.get("a") is not None # "b" is now the least recently used
+    tier.put("c", vector)
+    assert tier.get("b") is None and tier.get("a") is not None and tier.get("c") is not None
+    assert tier.current_bytes == 32
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now[0])
+    tier = MemoryTier(max_bytes=1 << 20, ttl_seconds=10)
+    tier.put("a", array("f", [1.0]))
+    now[0] += 11
+    assert tier.get("a") is None and len(tier) == 0
+
+
+def test_disk_tier_evicts_to_size(tmp_path):
+    tier = SQLiteTier(str(tmp_path / "embeddings.sqlite"))
+    tier.put_many([(key, array("f", [0.0] * 4)) for key in ("a", "b", "c")])
+    assert tier.evict_to_size(2 * 16) == 1
+    assert len(tier) == 2
@@ -0,0 +1,52 @@
+# tests/test_ingest_ledger.py
+from utils.ingest_ledger import IngestLedger, record_content_hash
+
+
+def make_record(vector_id: str, pmid: str, text: str, dimension: int = 4, **metadata) -> dict:
+    return {"id": vector_id, "values": [0.1] * dimension,
+            "metadata": {"pmid": pmid, "module": "protocol", "text": text, "source": "PubMed", **metadata}}
+
+
+def test_hash_covers_metadata_and_upsert_mode():
+    record = make_record("protocol_1_0", "1", "some chunk text", tags=["qiime"], char_start=0)
+    assert record_content_hash(record) == record_content_hash(make_record("protocol_1_0", "1", "some chunk text", char_start=0, tags=["qiime"]))
+    assert record_content_hash(record) != record_content_hash(make_record("protocol_1_0", "1", "some chunk text", tags=["qiime", "16s"], char_start=0))
+    assert record_content_hash(record) != record_content_hash(record, slim=True)
+
+
+def test_hash_changes_with_text_and_dimension():
+    record = make_record("protocol_1_0", "1", "some chunk text")
+    assert record_content_hash(record) != record_content_hash(make_record("protocol_1_0", "1", "other text"))
+    assert record_content_hash(record) != record_content_hash(make_record("protocol_1_0", "1", "some chunk text", dimension=8))
+
+
+def test_filter_changed_and_stale_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr("utils.ingest_ledger.LOOKUP_BATCH_SIZE", 3) # Several lookup batches
+    ledger = IngestLedger(str(tmp_path / "ledger.sqlite"))
+    first_run = [make_record(f"protocol_{pmid}_{chunk}", str(pmid), f"text {pmid} {chunk}") for pmid in range(4) for chunk in range(2)]
+    ledger.record_upserted(first_run)
+
+    second_run = [record for record in first_run if record["id"] != "protocol_2_1"]
+    second_run[0] = make_record("protocol_0_0", "0", "edited text")
+    second_run.append(make_record("protocol_4_0", "4", "new article"))
+    seen = {}
+    changed = list(ledger.filter_changed(second_run, seen_ids_by_pmid=seen))
+
+    assert [record["id"] for record in changed] == ["protocol_0_0", "protocol_4_0"]
+    assert seen["2"] == {"protocol_2_0"}
+    assert ledger.stale_ids(seen) == ["protocol_2_1"]
+    assert ledger.count() == 8
+    ledger.close()
+
+
+def test_metadata_only_change_is_re_upserted(tmp_path):
+    ledger = IngestLedger(str(tmp_path / "ledger.sqlite"))
+    record = make_record("protocol_1_0", "1", "some chunk text", tags=["qiime"])
+    ledger.record_upserted([record])
+    assert list(ledger.filter_changed([record])) == []
+
+    retagged = make_record("protocol_1_0", "1", "some chunk text", tags=["qiime", "16s"])
+    assert [changed["id"] for changed in ledger.filter_changed([retagged])] == ["protocol_1_0"]
+    # Turning the doc store on (or off) changes what is written, so it re-upserts too
+    assert [changed["id"] for changed in ledger.filter_changed([record], slim=True)] == ["protocol_1_0"]
+    ledger.close()
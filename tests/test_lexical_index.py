@@ -0,0 +1,36 @@
+# tests/test_lexical_index.py
+import pytest
+
+from utils.lexical_index import LexicalIndex
+
+
+@pytest.fixture
+def lexical_index():
+    return LexicalIndex.from_records([
+        ("protocol_31234567_0", {"pmid": "31234567", "pmcid": "PMC6543210", "module": "protocol",
+                                 "text": "Human gut microbiome samples were sequenced on the MiSeq.",
+                                 "tags": ["illumina_miseq", "human_gut", "quality control pipeline"]}),
+        ("tool_31234568_0", {"pmid": "31234568", "module": "tool",
+                             "text": "DADA2 infers exact amplicon sequence variants; PCR errors are modelled.",
+                             "tags": ["dada2", "study design"]}),
+    ])
+
+
+@pytest.mark.parametrize("query", [
+    "illumina_miseq", "Quality control pipeline", "DADA2", "QIIME2 16S", "31234567", "PMC6543210", "pmc1234", "99999999",
+])
+def test_identifier_queries_take_the_fast_path(lexical_index, query):
+    assert lexical_index.is_identifier_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "gut microbiome", "quality control", "study design methods", "human", "PCR", "miseq", "16S rRNA", "",
+    "what is DADA2",
+])
+def test_ordinary_questions_are_not_identifier_queries(lexical_index, query):
+    assert not lexical_index.is_identifier_query(query)
+
+
+def test_search_ranks_pmid_matches(lexical_index):
+    result = lexical_index.search("31234568", top_k=5)
+    assert [match.id for match in result.matches] == ["tool_31234568_0"]
@@ -0,0 +1,52 @@
+# tests/test_local_index.py
+import json
+import os
+
+import numpy as np
+import pytest
+
+from utils import local_index
+from utils.local_index import LocalIndex
+
+
+def write_records(path, vectors: dict, mtime: float):
+    with open(path, 'w') as f:
+        json.dump([{"id": vector_id, "values": values, "metadata": {"module": "protocol", "text": vector_id}}
+                   for vector_id, values in vectors.items()], f)
+    os.utime(path, (mtime, mtime))
+
+
+def test_npy_cache_is_built_once_and_rebuilt_when_the_json_is_newer(tmp_path, monkeypatch):
+    json_path = str(tmp_path / "records.json")
+    write_records(json_path, {"a": [1.0, 0.0], "b": [0.0, 1.0]}, mtime=1_000)
+    conversions = []
+    convert = local_index.convert_json_to_vector_store
+    monkeypatch.setattr(local_index, "convert_json_to_vector_store", lambda *args: conversions.append(args) or convert(*args))
+
+    assert LocalIndex.from_json(json_path).ids == ["a", "b"]
+    assert os.path.exists(tmp_path / "records.vectors.npy") and os.path.exists(tmp_path / "records.meta.jsonl")
+    assert LocalIndex.from_json(json_path).ids == ["a", "b"]
+    assert len(conversions) == 1 # Second load memory-maps the cached .npy
+
+    write_records(json_path, {"a": [1.0, 0.0], "b": [0.0, 1.0], "c": [1.0, 1.0]}, mtime=os.path.getmtime(tmp_path / "records.vectors.npy") + 10)
+    assert LocalIndex.from_json(json_path).ids == ["a", "b", "c"]
+    assert len(conversions) == 2
+
+    assert LocalIndex.from_json(json_path, use_cache=False).ids == ["a", "b", "c"]
+    assert len(conversions) == 2
+
+
+def test_query_ranks_by_cosine_and_filters_modules():
+    vectors = np.array([[1.0, 0.0], [0.7, 0.7], [0.0, 1.0], [0.0, 0.0]], dtype=np.float32)
+    metadata = [{"module": "protocol"}, {"module": "workflow"}, {"module": "protocol"}, {"module": "protocol"}]
+    index = LocalIndex(vectors, ["a", "b", "c", "zero"], metadata)
+
+    result = index.query(vector=[1.0, 0.1], top_k=2)
+    assert [match.id for match in result.matches] == ["a", "b"]
+    assert result.matches[0].score == pytest.approx(1.0 / np.linalg.norm([1.0, 0.1]))
+
+    filtered = index.query(vector=[1.0, 0.1], top_k=10, filter={"module": {"$in": ["workflow"]}}, include_metadata=False)
+    assert [(match.id, match.metadata) for match in filtered.matches] == [("b", None)]
+    assert index.query(vector=[1.0, 0.1], filter={"module": "missing"}).matches == []
+    with pytest.raises(ValueError):
+        index.query(vector=[1.0, 0.0, 0.0])
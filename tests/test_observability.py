@@ -0,0 +1,21 @@
+# tests/test_observability.py
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _root_handler_count(imports: str) -> int:
+    # Fresh interpreter: other tests import the apps, which configure logging for the whole session
+    script = f"import logging; {imports}; print(len(logging.getLogger().handlers))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return int(result.stdout.strip().splitlines()[-1])
+
+
+def test_importing_utils_leaves_root_logger_alone():
+    assert _root_handler_count("import utils.observability, utils.retriever, utils.services, utils.embedder") == 0
+
+
+def test_setup_logging_configures_root_logger_once():
+    assert _root_handler_count("from utils.observability import setup_logging; setup_logging(); setup_logging()") == 1
@@ -0,0 +1,137 @@
+# tests/test_pincone_update.py
+from types import SimpleNamespace
+
+from utils import pincone_update
+from utils.doc_store import DocStore
+from utils.ingest_ledger import IngestLedger
+from utils.rate_limiter import AdaptiveThrottle
+
+
+class ApiError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class FlakyIndex:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def upsert(self, vectors, namespace):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(upserted_count=len(vectors))
+
+
+def test_transient_upsert_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(pincone_update.time, "sleep", lambda seconds: None)
+    index = FlakyIndex([ApiError(503), ApiError(429)])
+    count = pincone_update._upsert_batch_with_retry(index, [("a", [0.1], {})], "", AdaptiveThrottle(max_delay=0), max_retries=5)
+    assert count == 1 and index.calls == 3
+
+
+def test_non_retryable_upsert_error_fails_fast(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(pincone_update.time, "sleep", sleeps.append)
+    index = FlakyIndex([ApiError(400)])
+    count = pincone_update._upsert_batch_with_retry(index, [("a", [0.1], {})], "", AdaptiveThrottle(), max_retries=5)
+    assert count is None and index.calls == 1 and sleeps == []
+
+
+def test_no_sleep_after_the_last_attempt(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(pincone_update.time, "sleep", sleeps.append)
+    index = FlakyIndex([ApiError(500)] * 3)
+    count = pincone_update._upsert_batch_with_retry(index, [("a", [0.1], {})], "", AdaptiveThrottle(), max_retries=3)
+    assert count is None and index.calls == 3 and len(sleeps) == 2
+
+
+class RecordingIndex:
+    """Accepts `accepted_batches` upserts (all if None), then rejects every batch with a 400."""
+    def __init__(self, accepted_batches=None):
+        self.accepted_batches = accepted_batches
+        self.upserted = []
+
+    def upsert(self, vectors, namespace):
+        if self.accepted_batches is not None:
+            if not self.accepted_batches:
+                raise ApiError(400)
+            self.accepted_batches -= 1
+        self.upserted.extend(vector_id for vector_id, _, _ in vectors)
+        return SimpleNamespace(upserted_count=len(vectors))
+
+
+def make_record(vector_id, text):
+    return {"id": vector_id, "values": [0.1, 0.2], "metadata": {"pmid": vector_id.split("_")[1], "text": text}}
+
+
+def interrupted_run(checkpoint_file, records, source):
+    """Upserts the first batch and fails the rest, so the checkpoint is kept."""
+    index = RecordingIndex(accepted_batches=1)
+    pincone_update.upsert_new_data(index, records, set(), checkpoint_file=checkpoint_file, concurrency=1, source=source)
+    return index.upserted
+
+
+def test_checkpoint_resumes_only_the_same_input_with_unchanged_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(pincone_update, "BATCH_SIZE", 2)
+    checkpoint_file = str(tmp_path / "checkpoint.log")
+    records = [make_record(f"protocol_{i}_0", f"text {i}") for i in range(4)]
+    assert interrupted_run(checkpoint_file, records, "a.jsonl") == ["protocol_0_0", "protocol_1_0"]
+
+    # Same input: only the changed record of the completed batch is upserted again
+    edited = [make_record("protocol_0_0", "edited")] + records[1:]
+    index = RecordingIndex()
+    pincone_update.upsert_new_data(index, edited, set(), checkpoint_file=checkpoint_file, source="a.jsonl")
+    assert sorted(index.upserted) == ["protocol_0_0", "protocol_2_0", "protocol_3_0"]
+
+
+def test_checkpoint_from_another_input_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(pincone_update, "BATCH_SIZE", 2)
+    checkpoint_file = str(tmp_path / "checkpoint.log")
+    records = [make_record(f"protocol_{i}_0", f"text {i}") for i in range(4)]
+    interrupted_run(checkpoint_file, records, "old.jsonl")
+
+    index = RecordingIndex()
+    pincone_update.upsert_new_data(index, records, set(), checkpoint_file=checkpoint_file, source="new.jsonl")
+    assert sorted(index.upserted) == [record["id"] for record in records]
+
+
+class SyncedIndex(RecordingIndex):
+    def __init__(self):
+        super().__init__()
+        self.metadata = {}
+
+    def upsert(self, vectors, namespace):
+        self.metadata.update((vector_id, metadata) for vector_id, _, metadata in vectors)
+        return super().upsert(vectors, namespace)
+
+
+def test_ledger_sync_re_upserts_metadata_only_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(pincone_update, "CHECKPOINT_FILE", str(tmp_path / "checkpoint.log"))
+    ledger = IngestLedger(str(tmp_path / "ledger.sqlite"))
+    records = [make_record(f"protocol_{i}_0", f"text {i}") for i in range(3)]
+
+    def sync(records, doc_store=None):
+        index = SyncedIndex()
+        pincone_update.sync_with_ledger(index, records, ledger, doc_store=doc_store)
+        return index
+
+    assert sorted(sync(records).upserted) == ["protocol_0_0", "protocol_1_0", "protocol_2_0"]
+    assert sync(records).upserted == []
+
+    # Only the tags of one chunk changed: that chunk alone is uploaded, with the new metadata
+    retagged = [dict(record, metadata=dict(record["metadata"])) for record in records]
+    retagged[1]["metadata"]["tags"] = ["qiime2"]
+    index = sync(retagged)
+    assert index.upserted == ["protocol_1_0"] and index.metadata["protocol_1_0"]["tags"] == ["qiime2"]
+
+    # Turning the doc store on re-upserts everything with slim metadata (and fills the store)
+    store = DocStore(str(tmp_path / "docs.sqlite"))
+    index = sync(retagged, doc_store=store)
+    assert sorted(index.upserted) == ["protocol_0_0", "protocol_1_0", "protocol_2_0"]
+    assert index.metadata["protocol_1_0"] == {"pmid": "1"}
+    assert store.get_many(["protocol_1_0"])["protocol_1_0"]["tags"] == ["qiime2"]
+    assert sync(retagged, doc_store=store).upserted == []
+    ledger.close()
@@ -0,0 +1,49 @@
+# tests/test_pmc_extract.py
+from utils.pmc_extract import extract_first_body_text, split_pmc_articles, split_pmc_articles_many
+
+ARTICLE = """
+<article xmlns:xlink="http://www.w3.org/1999/xlink">
+  <front><article-meta><article-id pub-id-type="pmc">PMC{pmcid}</article-id></article-meta></front>
+  <body>
+    <p>Intro   paragraph
+       over two lines.</p>
+    <sec>
+      <title>Methods</title>
+      <p>Reads were denoised <inline-formula><tex-math>\\alpha</tex-math></inline-formula> with DADA2.</p>
+      <sec>
+        <title>Sequencing</title>
+        <p>Libraries ran on a <italic>MiSeq</italic>.</p>
+      </sec>
+      <table-wrap>
+        <caption><p>Table 1. Sample counts.</p></caption>
+        <table><tr><td>cell value</td><td>42</td></tr></table>
+      </table-wrap>
+      <fig><caption><p>Figure 1. Workflow.</p></caption><graphic xlink:href="f1.png"/></fig>
+    </sec>
+  </body>
+</article>
+"""
+
+
+def test_sections_paragraphs_and_tables():
+    text = extract_first_body_text(ARTICLE.format(pmcid="123"))
+    assert text.split("\n") == [
+        "Intro paragraph over two lines.",
+        "Methods",
+        "Reads were denoised with DADA2.",
+        "Sequencing",
+        "Libraries ran on a MiSeq.",
+        "Table 1. Sample counts.",
+        "Figure 1. Workflow.",
+    ]
+    assert "cell value" not in text and "alpha" not in text
+
+
+def test_bulk_response_is_split_per_article():
+    no_body = '<article><front><article-meta><article-id pub-id-type="pmcid">PMC9</article-id></article-meta></front></article>'
+    xml = f"<pmc-articleset>{ARTICLE.format(pmcid='1')}{ARTICLE.format(pmcid='2')}{no_body}</pmc-articleset>"
+
+    articles = split_pmc_articles(xml)
+    assert sorted(articles) == ["1", "2", "9"]
+    assert articles["1"].startswith("Intro paragraph") and articles["9"] is None
+    assert split_pmc_articles_many([xml, xml.encode("utf-8")]) == [articles, articles]
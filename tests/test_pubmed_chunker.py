@@ -0,0 +1,138 @@
+# tests/test_pubmed_chunker.py
+import threading
+import time
+
+import pytest
+
+from utils import pubmed_chunker
+
+
+def test_embedding_dimension_is_read_at_call_time(monkeypatch):
+    requested = []
+
+    def fake_embed_batch(batch, model, dimensions, results):
+        requested.append((model, dimensions))
+        for key, _, _ in batch:
+            results[key] = [0.0] * dimensions
+
+    monkeypatch.setattr(pubmed_chunker, "EMBEDDING_STORE_PATH", "")
+    monkeypatch.setattr(pubmed_chunker, "_embed_batch_with_retry", fake_embed_batch)
+    monkeypatch.setattr(pubmed_chunker, "EMBED_DIMENSIONS", 256)
+
+    embeddings = pubmed_chunker.embed_prepared_batched([("a", "first chunk", 3), ("b", "second chunk", 3)])
+
+    assert requested == [(pubmed_chunker.EMBED_MODEL, 256)]
+    assert len(embeddings["a"]) == 256
+
+
+def fake_pmcids(pmids, limiter=None):
+    return {str(pmid): f"PMC{pmid}" for pmid in pmids}
+
+
+def test_fetched_articles_arrive_for_every_pmid(monkeypatch):
+    monkeypatch.setattr(pubmed_chunker, "fetch_pmcids_bulk", fake_pmcids)
+    monkeypatch.setattr(pubmed_chunker, "fetch_full_texts_pmc_bulk",
+                        lambda pmcids, batch_size, limiter: {pmcid: f"text of {pmcid}" for pmcid in pmcids})
+
+    articles = list(pubmed_chunker.iter_fetched_articles(list(range(10)), workers=3, efetch_batch_size=2))
+
+    assert sorted(i for i, _, _, _ in articles) == list(range(10))
+    assert all(text == f"text of {pmcid}" for _, _, pmcid, text in articles)
+
+
+def test_fetch_worker_error_is_raised_to_the_consumer(monkeypatch):
+    def failing_fetch(pmcids, batch_size, limiter):
+        if "PMC3" in pmcids:
+            raise RuntimeError("efetch exploded")
+        return {pmcid: "text" for pmcid in pmcids}
+
+    monkeypatch.setattr(pubmed_chunker, "fetch_pmcids_bulk", fake_pmcids)
+    monkeypatch.setattr(pubmed_chunker, "fetch_full_texts_pmc_bulk", failing_fetch)
+
+    with pytest.raises(RuntimeError, match="efetch exploded"):
+        list(pubmed_chunker.iter_fetched_articles(list(range(8)), workers=2, efetch_batch_size=2))
+
+
+def test_jsonl_writer_replaces_the_file_on_success(tmp_path):
+    path = tmp_path / "records.jsonl"
+    with pubmed_chunker.JsonlWriter(str(path)) as writer:
+        writer.append({"id": "a", "values": [0.5]})
+    assert path.read_text() == '{"id":"a","values":[0.5]}\n'
+    assert not (tmp_path / "records.jsonl.tmp").exists()
+
+
+def test_jsonl_writer_keeps_the_previous_file_when_the_run_fails(tmp_path):
+    path = tmp_path / "records.jsonl"
+    path.write_text("last good run\n")
+    with pytest.raises(RuntimeError):
+        with pubmed_chunker.JsonlWriter(str(path)) as writer:
+            writer.append({"id": "a", "values": [0.5]})
+            raise RuntimeError("embedding failed")
+    assert path.read_text() == "last good run\n"
+    assert not (tmp_path / "records.jsonl.tmp").exists()
+
+
+def test_fetch_workers_stop_when_the_consumer_stops_early(monkeypatch):
+    monkeypatch.setattr(pubmed_chunker, "FETCH_STOP_POLL_SECONDS", 0.01)
+    monkeypatch.setattr(pubmed_chunker, "fetch_pmcids_bulk", fake_pmcids)
+    monkeypatch.setattr(pubmed_chunker, "fetch_full_texts_pmc_bulk",
+                        lambda pmcids, batch_size, limiter: {pmcid: "text" for pmcid in pmcids})
+    started = threading.active_count()
+
+    articles = pubmed_chunker.iter_fetched_articles(list(range(40)), workers=3, queue_size=1, efetch_batch_size=2)
+    next(articles)
+    time.sleep(0.05) # Let the workers fill the queue and block on it
+    articles.close()
+
+    deadline = time.monotonic() + 2
+    while threading.active_count() > started and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert threading.active_count() == started
+
+
+def test_default_ncbi_limiter_allows_no_burst(monkeypatch):
+    limiters = []
+
+    def record_limiter(pmids, limiter=None):
+        limiters.append(limiter)
+        return {}
+
+    monkeypatch.setattr(pubmed_chunker, "fetch_pmcids_bulk", record_limiter)
+    list(pubmed_chunker.iter_fetched_articles(["1"]))
+    assert limiters[0].capacity == 1
+
+
+class WordEncoding:
+    """One token per whitespace-separated word (the real tiktoken encoding needs a download)."""
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+def sentences(count, words=5):
+    return " ".join(f"S{i} " + " ".join(["word"] * (words - 2)) + " end." for i in range(count))
+
+
+def test_token_chunks_respect_the_budget_and_overlap(monkeypatch):
+    monkeypatch.setattr(pubmed_chunker, "_encoding", WordEncoding())
+    text = sentences(12) # 12 sentences of 5 words
+
+    chunks = pubmed_chunker.chunk_text_tokens(text, max_tokens=20, overlap_tokens=5)
+
+    assert all(text[start:end] == chunk for chunk, start, end in chunks)
+    assert all(len(chunk.split()) <= 20 for chunk, _, _ in chunks)
+    assert all(chunk.endswith("end.") for chunk, _, _ in chunks) # Sentence-aligned
+    assert [chunk.split()[0] for chunk, _, _ in chunks] == ["S0", "S3", "S6", "S9"]
+    # One trailing sentence (5 tokens <= overlap) is repeated at the start of the next chunk
+    for (previous, _, previous_end), (_, start, _) in zip(chunks, chunks[1:]):
+        assert start < previous_end and previous.endswith(text[start:previous_end])
+    assert chunks[0][1] == 0 and chunks[-1][2] == len(text)
+
+
+def test_over_long_sentences_are_split_at_words(monkeypatch):
+    monkeypatch.setattr(pubmed_chunker, "_encoding", WordEncoding())
+    text = "Short one.\n" + " ".join(f"w{i}" for i in range(25)) + "."
+
+    chunks = pubmed_chunker.chunk_text_tokens(text, max_tokens=10, overlap_tokens=0)
+
+    assert all(len(chunk.split()) <= 10 for chunk, _, _ in chunks)
+    assert " ".join(chunk for chunk, _, _ in chunks).split() == text.split()
@@ -0,0 +1,100 @@
+# tests/test_query_pipeline.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+import app as flask_app
+import asgi
+from utils import query_pipeline
+from utils.lexical_index import LexicalIndex
+from utils.query_pipeline import QueryError, error_payload, parse_rag_query, query_payload, run_query, run_query_async
+
+METADATA = {
+    "protocol_1_0": {"pmid": "1", "module": "protocol", "source": "PubMed", "text": "DADA2 denoising of amplicon reads."},
+    "protocol_1_1": {"pmid": "1", "module": "protocol", "source": "PubMed", "text": "Reads were trimmed before denoising."},
+}
+
+
+class FakeIndex:
+    def __init__(self):
+        self.queries = []
+
+    def query(self, vector, namespace, top_k, include_metadata, filter):
+        self.queries.append((namespace, filter))
+        matches = [SimpleNamespace(id=vector_id, score=1.0 - i / 10, metadata=metadata)
+                   for i, (vector_id, metadata) in enumerate(METADATA.items())]
+        return SimpleNamespace(matches=matches[:top_k])
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    async def embed_async(text, batcher=None):
+        return [0.1, 0.2]
+    monkeypatch.setattr(query_pipeline, "generate_embedding", lambda text, batcher=None: [0.1, 0.2])
+    monkeypatch.setattr(query_pipeline, "generate_embedding_async", embed_async)
+
+
+@pytest.mark.parametrize("data, message", [
+    (None, "Missing or empty 'text' field in JSON request"),
+    ({"text": "  "}, "Missing or empty 'text' field in JSON request"),
+    ({"text": "reads", "top_k": 0}, "'top_k' must be an integer"),
+    ({"text": "reads", "module": [1]}, "'module' must be a string or a list of strings"),
+])
+def test_invalid_requests_are_rejected(data, message):
+    with pytest.raises(QueryError) as error:
+        parse_rag_query(data)
+    assert error.value.status == 400 and error.value.message.startswith(message)
+
+
+def test_sync_and_async_pipelines_return_the_same_payload():
+    query = parse_rag_query({"text": "how are reads denoised?", "module": "protocol", "top_k": 1})
+    index = FakeIndex()
+    sync_payload = query_payload(query, run_query(query, index=index))
+    async_payload = query_payload(query, asyncio.run(run_query_async(query, index=index)))
+
+    assert sync_payload == async_payload
+    assert sync_payload["retrieval"] == "vector"
+    assert [result["id"] for result in sync_payload["results"]] == ["protocol_1_0"]
+    assert index.queries[0][1] == {"module": "protocol"}
+
+
+def test_identifier_queries_skip_the_embedding(monkeypatch):
+    def no_embedding(text, batcher=None):
+        raise AssertionError("identifier queries must not be embedded")
+    monkeypatch.setattr(query_pipeline, "generate_embedding", no_embedding)
+    lexical_index = LexicalIndex.from_records(METADATA.items())
+
+    result = run_query(parse_rag_query({"text": "DADA2"}), index=FakeIndex(), lexical_index=lexical_index)
+    assert result.retrieval == "lexical"
+    assert [match["id"] for match in result.results] == ["protocol_1_0"]
+
+
+def test_failed_embedding_and_unexpected_errors_map_to_500(monkeypatch):
+    monkeypatch.setattr(query_pipeline, "generate_embedding", lambda text, batcher=None: [])
+    with pytest.raises(QueryError) as error:
+        run_query(parse_rag_query({"text": "reads"}), index=FakeIndex())
+    assert error_payload(error.value) == ({"error": "Failed to generate query embedding"}, 500)
+    assert error_payload(RuntimeError("boom")) == ({"error": "An internal server error occurred"}, 500)
+
+
+def test_flask_and_asgi_endpoints_agree(monkeypatch):
+    index = FakeIndex()
+    monkeypatch.setattr(flask_app, "get_index", lambda: index)
+    monkeypatch.setattr(flask_app, "get_lexical_index", lambda: None)
+    monkeypatch.setattr(flask_app, "get_doc_store", lambda: None)
+    monkeypatch.setattr(flask_app, "result_cache", None)
+    monkeypatch.setattr(asgi, "pinecone_index", index)
+    monkeypatch.setattr(asgi, "lexical_index", None)
+    monkeypatch.setattr(asgi, "result_cache", None)
+    body = {"text": "how are reads denoised?", "fields": ["id", "pmid"]}
+
+    flask_response = flask_app.app.test_client().post("/rag/query", json=body)
+    asgi_response = TestClient(Starlette(routes=asgi.app.routes)).post("/rag/query", json=body)
+
+    assert flask_response.status_code == asgi_response.status_code == 200
+    assert flask_response.get_json() == asgi_response.json()
+    assert flask_app.app.test_client().post("/rag/query", json={}).status_code == 400
+    assert TestClient(Starlette(routes=asgi.app.routes)).post("/rag/query", json={}).status_code == 400
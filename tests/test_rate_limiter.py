@@ -0,0 +1,118 @@
+# tests/test_rate_limiter.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from utils import rate_limiter
+from utils.rate_limiter import OpenAIRateLimiter, TokenBucket, parse_duration
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, headers=None):
+        super().__init__("429")
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class BadRequestError(Exception):
+    status_code = 400
+
+
+def raw_response(headers=None):
+    return SimpleNamespace(headers=headers or {}, parse=lambda: "parsed")
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def flaky(failures):
+    calls = []
+
+    def request():
+        calls.append(1)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return raw_response()
+    return request, calls
+
+
+def test_parse_duration():
+    assert parse_duration("6m0s") == 360.0
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1.5s") == 1.5
+    assert parse_duration("2") == 2.0
+    assert parse_duration("") is None
+
+
+def test_token_bucket_reserve_goes_negative_and_reports_wait():
+    bucket = TokenBucket(rate=10, capacity=10)
+    assert bucket.reserve(10) == 0.0
+    assert bucket.reserve(5) == pytest.approx(0.5, abs=0.05)
+
+
+def test_retries_reserve_the_budget_once(no_sleep):
+    limiter = OpenAIRateLimiter(requests_per_minute=60, tokens_per_minute=6000, max_retries=3, backoff_cap=0.01)
+    request, calls = flaky([RateLimitError(), RateLimitError()])
+
+    assert limiter.call(request, tokens=1000) == "parsed"
+
+    assert len(calls) == 3
+    assert limiter.tokens.available == pytest.approx(5000, abs=5)
+    assert limiter.requests.available == pytest.approx(59, abs=0.1)
+    stats = limiter.stats()
+    assert stats["requests"] == 1 and stats["retries"] == 2 and stats["rate_limited"] == 2
+
+
+def test_retries_are_bounded(no_sleep):
+    limiter = OpenAIRateLimiter(60, 6000, max_retries=2, backoff_cap=0.01)
+    request, calls = flaky([RateLimitError()] * 5)
+    with pytest.raises(RateLimitError):
+        limiter.call(request, tokens=10)
+    assert len(calls) == 3 and limiter.stats()["failures"] == 1
+
+
+def test_non_retryable_errors_are_raised_at_once(no_sleep):
+    limiter = OpenAIRateLimiter(60, 6000, max_retries=3)
+    request, calls = flaky([BadRequestError()])
+    with pytest.raises(BadRequestError):
+        limiter.call(request, tokens=10)
+    assert len(calls) == 1 and no_sleep == []
+
+
+def test_retry_after_sets_the_minimum_backoff(no_sleep):
+    limiter = OpenAIRateLimiter(60, 6000, max_retries=1, backoff_base=0.001, backoff_cap=10)
+    request, _ = flaky([RateLimitError({"retry-after-ms": "1500"})])
+    limiter.call(request, tokens=10)
+    assert no_sleep and no_sleep[-1] == pytest.approx(1.5, abs=0.05)
+
+
+def test_headers_lower_the_budget_and_keep_the_headroom():
+    limiter = OpenAIRateLimiter(3000, 1_000_000, headroom=0.2)
+    limiter.update({"x-ratelimit-limit-requests": "500", "x-ratelimit-remaining-requests": "450",
+                    "x-ratelimit-limit-tokens": "100000", "x-ratelimit-remaining-tokens": "50000"})
+    assert limiter.requests.rate * 60 == pytest.approx(400)
+    assert limiter.tokens.rate * 60 == pytest.approx(80000)
+    assert limiter.tokens.available == pytest.approx(30000, abs=50)  # 50000 remaining - 20% of 100000
+
+
+def test_call_async_reserves_once(monkeypatch):
+    async def no_sleep(seconds):
+        return None
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", no_sleep)
+    limiter = OpenAIRateLimiter(60, 6000, max_retries=3, backoff_cap=0.01)
+    calls = []
+
+    async def request():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RateLimitError()
+        return raw_response()
+
+    assert asyncio.run(limiter.call_async(request, tokens=1000)) == "parsed"
+    assert len(calls) == 2 and limiter.tokens.available == pytest.approx(5000, abs=5)
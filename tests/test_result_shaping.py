@@ -0,0 +1,65 @@
+# tests/test_result_shaping.py
+import pytest
+
+import config
+from utils.result_shaping import (DEFAULT_RESULT_FIELDS, collapse_results, make_snippet, parse_query_options,
+                                  shape_results)
+
+
+def result(vector_id, pmid, start, end, text="", score=1.0):
+    return {"id": vector_id, "score": score, "text": text, "source": "PubMed", "module": "protocol",
+            "pmid": pmid, "chunk_id": 0, "char_start": start, "char_end": end}
+
+
+RESULTS = [result("a0", "1", 0, 100), result("a1", "1", 80, 180), result("a2", "1", 200, 300), result("b0", "2", 0, 100)]
+
+
+def test_default_options_keep_the_original_shape():
+    options = parse_query_options({})
+    assert (options.top_k, options.fields, options.is_default) == (config.TOP_K, DEFAULT_RESULT_FIELDS, True)
+    shaped = shape_results(RESULTS, options, "query")
+    assert all(set(item) == set(DEFAULT_RESULT_FIELDS) for item in shaped)
+
+
+@pytest.mark.parametrize("data", [
+    {"top_k": 0}, {"top_k": True}, {"top_k": config.MAX_TOP_K + 1}, {"fields": []}, {"fields": ["id", "vector"]},
+    {"snippet": "yes"}, {"collapse": "module"},
+])
+def test_invalid_options_are_rejected(data):
+    with pytest.raises(ValueError):
+        parse_query_options(data)
+
+
+def test_field_projection_and_top_k():
+    options = parse_query_options({"top_k": 2, "fields": ["id", "pmid", "id"]})
+    assert options.fields == ("id", "pmid")
+    assert shape_results(RESULTS, options, "query") == [{"id": "a0", "pmid": "1"}, {"id": "a1", "pmid": "1"}]
+
+
+def test_collapse_modes_and_oversampling():
+    assert [r["id"] for r in collapse_results(RESULTS, "overlap", top_k=10)] == ["a0", "a2", "b0"]
+    assert [r["id"] for r in collapse_results(RESULTS, "pmid", top_k=10)] == ["a0", "b0"]
+    options = parse_query_options({"top_k": 2, "collapse": "pmid"})
+    assert options.fetch_k == min(2 * 3, config.MAX_TOP_K)
+
+
+def test_snippet_truncates_at_words_and_highlights_terms(monkeypatch):
+    monkeypatch.setattr(config, "SNIPPET_HIGHLIGHT_PRE", "<em>")
+    monkeypatch.setattr(config, "SNIPPET_HIGHLIGHT_POST", "</em>")
+    text = " ".join(["filler"] * 30) + " reads were denoised with DADA2 before taxonomy " + " ".join(["filler"] * 30)
+
+    snippet = make_snippet(text, {"denoised", "dada2"}, length=60)
+
+    assert snippet.startswith("…") and snippet.endswith("…")
+    assert "<em>denoised</em>" in snippet and "<em>DADA2</em>" in snippet
+    plain = snippet.replace("<em>", "").replace("</em>", "").strip("…")
+    assert len(plain) <= 60 and plain in text and " " + plain.split()[0] in " " + text
+
+    options = parse_query_options({"snippet": True})
+    assert options.fields == ("id", "score", "snippet", "source", "module")
+    shaped = shape_results([result("a0", "1", 0, len(text), text=text)], options, "denoised")
+    assert "text" not in shaped[0] and "<em>denoised</em>" in shaped[0]["snippet"]
+
+
+def test_short_text_snippet_is_not_truncated():
+    assert make_snippet("Reads were denoised.", {"reads"}, length=240) == f"{config.SNIPPET_HIGHLIGHT_PRE}Reads{config.SNIPPET_HIGHLIGHT_POST} were denoised."
@@ -0,0 +1,70 @@
+# tests/test_retriever.py
+import numpy as np
+import pytest
+
+import config
+from utils.local_index import LocalIndex
+from utils.retriever import merge_shard_results, normalize_module_filter, normalize_namespaces, query_shards
+
+
+def make_index(prefix: str, namespace: str | None, count: int = 12, seed: int = 0) -> LocalIndex:
+    rng = np.random.default_rng(seed)
+    ids = [f"{prefix}{i}" for i in range(count)]
+    metadata = [{"text": f"chunk {i}", "module": ("protocol", "workflow", "design")[i % 3]} for i in range(count)]
+    return LocalIndex(rng.random((count, 8)).astype(np.float32), ids, metadata, namespace=namespace)
+
+
+class NamespacedIndex:
+    """One LocalIndex per namespace behind the Pinecone query interface."""
+
+    def __init__(self, shards: dict):
+        self.shards = shards
+
+    def query(self, namespace="", **kwargs):
+        return self.shards[namespace].query(namespace=namespace, **kwargs)
+
+
+def test_normalize_module_filter_lists():
+    assert normalize_module_filter(" Protocol ") == "protocol"
+    assert normalize_module_filter(["Workflow", "protocol", "workflow"]) == ("protocol", "workflow")
+    assert normalize_module_filter(["protocol"]) == "protocol"
+    assert normalize_module_filter([]) is None
+    with pytest.raises(ValueError):
+        normalize_module_filter(["protocol", 3])
+
+
+def test_default_namespace_is_always_allowed(monkeypatch):
+    monkeypatch.setattr(config, "NAMESPACE", "")
+    monkeypatch.setattr(config, "QUERY_NAMESPACES", ["archive"])
+    assert normalize_namespaces(["", "archive", ""]) == ("", "archive")
+    with pytest.raises(ValueError):
+        normalize_namespaces(["other"])
+
+
+def test_merge_shard_results_is_global_top_k():
+    shard_a = [{"id": "a1", "score": 0.9}, {"id": "a2", "score": 0.5}]
+    shard_b = [{"id": "b1", "score": 0.8}, {"id": "b2", "score": 0.7}]
+    merged = merge_shard_results([shard_a, shard_b], top_k=3)
+    assert [result["id"] for result in merged] == ["a1", "b1", "b2"]
+
+
+def test_fan_out_over_default_and_other_namespace():
+    index = NamespacedIndex({"": make_index("default", "", seed=1), "archive": make_index("archive", "archive", seed=2)})
+    query = np.random.default_rng(3).random(8).tolist()
+    results, shards = query_shards(index, query, namespaces=("", "archive"), module_filter=("protocol", "workflow"), top_k=6)
+
+    assert [shard["namespace"] for shard in shards] == ["", "archive"]
+    assert all(shard["matches"] == 6 for shard in shards)
+    scores = [result["score"] for result in results]
+    assert scores == sorted(scores, reverse=True) and len(results) == 6
+    assert {result["module"] for result in results} <= {"protocol", "workflow"}
+    for result in results:
+        assert result["id"].startswith("default" if result["namespace"] == "" else "archive")
+
+
+def test_local_index_answers_only_its_namespace():
+    index = make_index("doc", "")
+    query = np.random.default_rng(4).random(8).tolist()
+    results, shards = query_shards(index, query, namespaces=("", "archive"), top_k=5)
+    assert [shard["matches"] for shard in shards] == [5, 0]
+    assert len({result["id"] for result in results}) == len(results) == 5
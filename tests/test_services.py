@@ -0,0 +1,34 @@
+# tests/test_services.py
+from types import SimpleNamespace
+
+from utils import embedder, services
+from utils.rate_limiter import OpenAIRateLimiter
+
+
+class FakeOpenAIClient:
+    def __init__(self):
+        self.requests = []
+        self.embeddings = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create))
+
+    def with_options(self, **options):
+        return self
+
+    def _create(self, input, model, dimensions):
+        self.requests.append(input)
+        data = [SimpleNamespace(index=i, embedding=[0.0] * dimensions) for i in range(len(input))]
+        return SimpleNamespace(headers={"x-ratelimit-limit-requests": "120"}, parse=lambda: SimpleNamespace(data=data))
+
+
+def test_warm_up_embeds_through_the_rate_limiter(monkeypatch):
+    client = FakeOpenAIClient()
+    limiter = OpenAIRateLimiter(requests_per_minute=60, tokens_per_minute=10000)
+    monkeypatch.setattr(embedder, "rate_limiter", limiter)
+    monkeypatch.setattr(embedder, "get_openai_client", lambda: client)
+    monkeypatch.setattr(services, "get_index", lambda: SimpleNamespace(describe_index_stats=lambda: {}))
+    monkeypatch.setattr(services, "get_lexical_index", lambda: None)
+
+    assert services.warm_up()
+
+    assert client.requests == [[services.WARMUP_TEXT]]
+    assert limiter.stats()["requests"] == 1
+    assert limiter.requests.rate * 60 == 120 # Synced from the warm-up response's headers
@@ -0,0 +1,44 @@
+# tests/test_vector_format.py
+import numpy as np
+import pytest
+
+from utils.vector_format import (VectorStoreWriter, iter_metadata, iter_vector_store_records, load_vectors,
+                                 write_vector_store)
+
+
+def make_records(count: int, dimension: int = 3) -> list[dict]:
+    return [{"id": f"protocol_{i}_0", "values": [float(i)] * dimension, "metadata": {"pmid": str(i), "text": f"chunk {i}"}}
+            for i in range(count)]
+
+
+def test_write_and_read_back(tmp_path):
+    base_path = str(tmp_path / "corpus")
+    records = make_records(4)
+    assert write_vector_store(records, base_path) == 4
+
+    vectors = load_vectors(base_path)
+    assert vectors.shape == (4, 3) and vectors.dtype == np.float32
+    assert list(iter_metadata(f"{base_path}.vectors.npy")) == [(r["id"], r["metadata"]) for r in records]
+    read_back = list(iter_vector_store_records(base_path))
+    assert [r["id"] for r in read_back] == [r["id"] for r in records]
+    np.testing.assert_array_equal(read_back[2]["values"], records[2]["values"])
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["corpus.meta.jsonl", "corpus.vectors.npy"]
+
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        write_vector_store(make_records(1, dimension=3) + make_records(1, dimension=4), str(tmp_path / "corpus"))
+
+
+def test_failed_run_keeps_the_previous_store(tmp_path):
+    base_path = str(tmp_path / "corpus")
+    write_vector_store(make_records(2), base_path)
+
+    with pytest.raises(RuntimeError):
+        with VectorStoreWriter(base_path) as writer:
+            writer.append(make_records(1, dimension=3)[0])
+            raise RuntimeError("embedding failed")
+
+    assert load_vectors(base_path).shape == (2, 3)
+    assert len(list(iter_metadata(base_path))) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["corpus.meta.jsonl", "corpus.vectors.npy"]
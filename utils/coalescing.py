@@ -0,0 +1,213 @@
+# utils/coalescing.py
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Request coalescing for threaded servers: concurrent calls of do() with the same key run
+    fn once; the callers that arrive while it is in flight wait and share its result (or
+    its exception). Nothing is cached once the call has finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {} # key -> Future of the in-flight call
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    asyncio version of SingleFlight (one event loop per process). The computation runs as its
+    own task and every caller awaits it shielded, so a caller that disconnects (and is
+    cancelled) doesn't cancel the result the others are waiting for.
+    """
+
+    def __init__(self):
+        self._calls = {} # key -> Task of the in-flight call
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, coroutine_function):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(coroutine_function())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class _BatcherStats:
+    def _init_stats(self):
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    def _count_batch(self, size: int) -> None:
+        self.batches += 1
+        self.items += size
+        self.largest_batch = max(self.largest_batch, size)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
+
+
+class EmbeddingBatcher(_BatcherStats):
+    """
+    Micro-batching for threaded servers: texts submitted within `window_seconds` of each other
+    are embedded by one embed_many(texts) -> vectors call (e.g. embedder.generate_embeddings).
+    The first caller of a batch runs it in its own thread, so no background thread is needed.
+    It flushes right away when no other batch is in flight (a lone request pays no delay) and
+    waits out the window otherwise; a batch that reaches `max_batch_size` is sent at once.
+    """
+
+    def __init__(self, embed_many, window_seconds: float = 0.005, max_batch_size: int = 64):
+        self.embed_many = embed_many
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._pending = [] # (text, Future)
+        self._running = 0 # Batches taken and not finished yet
+        self._init_stats()
+
+    def _take_batch(self) -> list:
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if batch:
+                self._count_batch(len(batch))
+                self._running += 1
+            return batch
+
+    def _run(self, batch: list) -> None:
+        if not batch:
+            return
+        try:
+            vectors = self.embed_many([text for text, _ in batch])
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            with self._lock:
+                self._running -= 1
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def embed(self, text: str) -> list[float]:
+        future = Future()
+        with self._lock:
+            self._pending.append((text, future))
+            leader = len(self._pending) == 1
+            full = len(self._pending) >= self.max_batch_size
+            busy = self._running > 0
+        if full:
+            self._run(self._take_batch())
+        elif leader:
+            if busy:
+                time.sleep(self.window_seconds)
+            self._run(self._take_batch())
+        return future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return super().stats()
+
+
+class AsyncEmbeddingBatcher(_BatcherStats):
+    """
+    asyncio version of EmbeddingBatcher around an async embed_many(texts) -> vectors. The first
+    text is sent on the next loop iteration when no batch is in flight (texts submitted in the
+    same iteration join it), after the window otherwise.
+    """
+
+    def __init__(self, embed_many, window_seconds: float = 0.005, max_batch_size: int = 64):
+        self.embed_many = embed_many
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self._pending = [] # (text, asyncio.Future)
+        self._tasks = set() # The event loop only keeps weak references to tasks
+        self._running = 0 # Batches taken and not finished yet
+        self._init_stats()
+
+    def _take_batch(self) -> list:
+        batch, self._pending = self._pending, []
+        if batch:
+            self._count_batch(len(batch))
+            self._running += 1
+        return batch
+
+    async def _run(self, batch: list) -> None:
+        if not batch:
+            return
+        try:
+            vectors = await self.embed_many([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._running -= 1
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done(): # Its caller may have been cancelled
+                future.set_result(vector)
+
+    async def embed(self, text: str) -> list[float]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._start(self._run(self._take_batch()))
+        elif len(self._pending) == 1:
+            self._start(self._run_after_window())
+        return await future
+
+    def _start(self, coroutine) -> None:
+        # The batch runs as its own task, so a cancelled caller doesn't cancel it for the others
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_after_window(self) -> None:
+        await asyncio.sleep(self.window_seconds if self._running else 0)
+        await self._run(self._take_batch())
@@ -0,0 +1,124 @@
+# utils/doc_store.py
+"""
+Local document store for chunk metadata, keyed by vector ID.
+
+pincone_update writes every chunk's full metadata (text, source, tags, ...) here and upserts
+only INDEX_METADATA_FIELDS to Pinecone, which keeps upsert payloads, index storage and query
+responses small. The API then queries without metadata and hydrates the matches from this
+store in one bulk lookup (DOC_STORE_PATH in config.py).
+
+Backfill from an existing records file, or inspect a store:
+  python -m utils.doc_store doc_store.sqlite build pinecone_data_final_modules.json
+  python -m utils.doc_store doc_store.sqlite stats
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+# Metadata kept in Pinecone: what the queries filter on, plus the PMID for inspection / ledger tools
+INDEX_METADATA_FIELDS = ("pmid", "module")
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+def index_metadata(metadata: dict) -> dict:
+    """The subset of a chunk's metadata that is upserted to the index when a doc store holds the rest."""
+    return {field: metadata[field] for field in INDEX_METADATA_FIELDS if metadata.get(field) is not None}
+
+
+class DocStore:
+    """
+    SQLite table {vector_id: metadata JSON}. One connection per thread (SQLite connections
+    are not shareable across threads); WAL mode lets the API read while ingestion writes.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self._local = threading.local()
+        if not read_only:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            conn = self._connection()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS docs (vector_id TEXT PRIMARY KEY, metadata TEXT NOT NULL)")
+            conn.commit()
+        elif not os.path.exists(path):
+            raise FileNotFoundError(f"Document store not found: {path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                conn = sqlite3.connect(f"file:{os.path.abspath(self.path)}?mode=ro", uri=True)
+            else:
+                conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def put_many(self, records) -> int:
+        """Stores the full metadata of each record ({"id", "metadata", ...}); returns the count."""
+        rows = [(record["id"], json.dumps(record.get("metadata") or {}, separators=(",", ":"))) for record in records]
+        conn = self._connection()
+        conn.executemany("INSERT OR REPLACE INTO docs (vector_id, metadata) VALUES (?, ?)", rows)
+        conn.commit()
+        return len(rows)
+
+    def get_many(self, vector_ids: list[str]) -> dict:
+        """{vector_id: metadata} for the IDs present in the store (one query per LOOKUP_BATCH_SIZE IDs)."""
+        found = {}
+        conn = self._connection()
+        for start in range(0, len(vector_ids), LOOKUP_BATCH_SIZE):
+            batch = vector_ids[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(f"SELECT vector_id, metadata FROM docs WHERE vector_id IN ({placeholders})", batch)
+            found.update((vector_id, json.loads(metadata)) for vector_id, metadata in rows)
+        return found
+
+    def delete(self, vector_ids: list[str]) -> None:
+        conn = self._connection()
+        conn.executemany("DELETE FROM docs WHERE vector_id = ?", [(vector_id,) for vector_id in vector_ids])
+        conn.commit()
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"documents": self.count(), "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0}
+
+
+if __name__ == "__main__":
+    # Allow running as a script (python utils/doc_store.py) as well as a module (python -m utils.doc_store)
+    if __package__ in (None, ""):
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from utils.vector_format import iter_json_records, iter_metadata, store_base_path
+
+    usage = ("Usage: python -m utils.doc_store <store.sqlite> build <records.json|.jsonl|.vectors.npy>\n"
+             "       python -m utils.doc_store <store.sqlite> stats")
+    if len(sys.argv) < 3 or sys.argv[2] not in ("build", "stats") or (sys.argv[2] == "build" and len(sys.argv) != 4):
+        print(usage)
+        sys.exit(1)
+    store = DocStore(sys.argv[1])
+    if sys.argv[2] == "build":
+        source = sys.argv[3]
+        if source.endswith(".json") or source.endswith(".jsonl"):
+            records = iter_json_records(source)
+        else:
+            records = ({"id": vector_id, "metadata": metadata} for vector_id, metadata in iter_metadata(store_base_path(source)))
+        batch, written = [], 0
+        for record in records:
+            batch.append(record)
+            if len(batch) >= 1000:
+                written += store.put_many(batch)
+                batch = []
+        written += store.put_many(batch)
+        print(f"✅ Stored metadata of {written} chunks in {sys.argv[1]}")
+    print(store.stats())
@@ -1,27 +1,254 @@
 # utils/embedder.py
+import os
+import httpx
 import openai
-from config import OPENAI_API_KEY, EMBEDDING_MODEL # Import from config
+import config
+from config import OPENAI_API_KEY, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS # Import from config
+from utils.embedding_cache import EmbeddingCache, normalize_text, make_cache_key
+from utils.rate_limiter import OpenAIRateLimiter, estimate_tokens
+from utils.services import get_openai_client
+from utils.observability import get_logger, span
 
-# Initialize OpenAI client (can be done here or globally in app.py)
-# Ensure the key is loaded before initializing
-if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API Key not found. Please set the OPENAI_API_KEY environment variable.")
-openai.api_key = OPENAI_API_KEY
+logger = get_logger(__name__)
 
-def generate_embedding(text: str) -> list[float]:
-    """Generates an embedding vector for the given text using OpenAI."""
+# The OpenAI client is created lazily per worker process (utils/services.py); a missing
+# API key surfaces as a ValueError on the first embedding instead of at import time.
+
+# OpenAI accepts at most 2048 inputs per embeddings request
+MAX_INPUTS_PER_REQUEST = 2048
+
+# Query embedding cache (None when disabled in config)
+embedding_cache = None
+if config.EMBEDDING_CACHE_ENABLED:
+    embedding_cache = EmbeddingCache(
+        max_bytes=config.EMBEDDING_CACHE_MAX_BYTES,
+        ttl_seconds=config.EMBEDDING_CACHE_TTL_SECONDS,
+        disk_path=config.EMBEDDING_CACHE_DB_PATH or None,
+        disk_ttl_seconds=config.EMBEDDING_CACHE_TTL_SECONDS,
+    )
+
+# Pacing from the API's rate-limit headers and bounded, jittered retries of the embedding calls
+# (None when disabled). The SDK's own retries are turned off for these calls.
+rate_limiter = None
+if config.OPENAI_RATE_LIMIT_ENABLED:
+    rate_limiter = OpenAIRateLimiter(
+        requests_per_minute=config.OPENAI_REQUESTS_PER_MINUTE,
+        tokens_per_minute=config.OPENAI_TOKENS_PER_MINUTE,
+        max_retries=config.OPENAI_MAX_RETRIES,
+        backoff_cap=config.OPENAI_BACKOFF_CAP_SECONDS,
+    )
+
+def create_embeddings(texts: list[str]):
+    """One embeddings request for the texts (no cache), through rate_limiter when enabled."""
+    if rate_limiter is None:
+        return get_openai_client().embeddings.create(input=texts, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS)
+    client = get_openai_client().with_options(max_retries=0)
+    return rate_limiter.call(
+        lambda: client.embeddings.with_raw_response.create(input=texts, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS),
+        tokens=sum(estimate_tokens(text) for text in texts),
+    )
+
+def generate_embedding(text: str, batcher=None) -> list[float]:
+    """
+    Generates an embedding vector for the given text using OpenAI (cached by normalized text).
+    With a batcher (utils.coalescing.EmbeddingBatcher), a cache miss is embedded together with
+    the other queries that arrive within the batching window.
+    """
+    text = normalize_text(text) if text else ""
     if not text:
         # Or raise an error, depending on desired behavior
         return []
 
+    cache_key = make_cache_key(text, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+    if embedding_cache is not None:
+        cached = embedding_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    if batcher is not None:
+        return batcher.embed(text)
+
     try:
-        response = openai.embeddings.create(
-            input=[text],
-            model=EMBEDDING_MODEL
-        )
-        return response.data[0].embedding
+        with span("openai_embedding"):
+            response = create_embeddings([text])
+        embedding = response.data[0].embedding
     except Exception as e:
         # Consider more specific error handling and logging
-        print(f"Error generating embedding: {e}")
+        logger.error("Error generating embedding: %s", e)
         # Re-raise or return None/empty list based on desired handling
-        raise e
\ No newline at end of file
+        raise e
+
+    if embedding_cache is not None:
+        embedding_cache.put(cache_key, embedding)
+    return embedding
+
+# === ASYNC CLIENT (ASGI serving path) ===
+# One AsyncOpenAI client per process, with a bounded keep-alive connection pool shared by all
+# in-flight requests. Created on first use inside the running event loop.
+_async_client = None
+_async_client_pid = None
+
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    global _async_client, _async_client_pid
+    if _async_client is None or _async_client_pid != os.getpid():
+        if not OPENAI_API_KEY:
+            raise ValueError("OpenAI API Key not found. Please set the OPENAI_API_KEY environment variable.")
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=config.ASYNC_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.ASYNC_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(config.ASYNC_REQUEST_TIMEOUT, connect=5.0),
+        )
+        _async_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+        _async_client_pid = os.getpid()
+    return _async_client
+
+async def close_async_openai_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+async def create_embeddings_async(texts: list[str]):
+    """Async version of create_embeddings (waits for the rate limiter without blocking the event loop)."""
+    if rate_limiter is None:
+        return await get_async_openai_client().embeddings.create(input=texts, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS)
+    client = get_async_openai_client().with_options(max_retries=0)
+    return await rate_limiter.call_async(
+        lambda: client.embeddings.with_raw_response.create(input=texts, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS),
+        tokens=sum(estimate_tokens(text) for text in texts),
+    )
+
+async def generate_embedding_async(text: str, batcher=None) -> list[float]:
+    """Async version of generate_embedding (same cache; batcher: utils.coalescing.AsyncEmbeddingBatcher), for the ASGI app."""
+    text = normalize_text(text) if text else ""
+    if not text:
+        return []
+
+    cache_key = make_cache_key(text, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+    if embedding_cache is not None:
+        cached = embedding_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    if batcher is not None:
+        return await batcher.embed(text)
+
+    try:
+        with span("openai_embedding"):
+            response = await create_embeddings_async([text])
+        embedding = response.data[0].embedding
+    except Exception as e:
+        logger.error("Error generating embedding: %s", e)
+        raise e
+
+    if embedding_cache is not None:
+        embedding_cache.put(cache_key, embedding)
+    return embedding
+
+def get_embedding_cache_stats() -> dict:
+    """Returns hit/miss counters of the query embedding cache."""
+    if embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_cache.stats()}
+
+def get_rate_limiter_stats() -> dict:
+    """Returns the counters and current limits of the OpenAI rate limiter."""
+    if rate_limiter is None:
+        return {"enabled": False}
+    return {"enabled": True, **rate_limiter.stats()}
+
+def _split_cached(texts: list[str]) -> tuple[list, dict]:
+    """
+    Normalizes the texts and resolves cache hits. Returns the results list (hits filled in,
+    [] elsewhere) and {normalized text: result positions} for the distinct texts still to embed.
+    """
+    normalized = [normalize_text(text) if text else "" for text in texts]
+    results = [[] for _ in normalized]
+
+    pending = {} # normalized text -> list of result positions
+    for i, text in enumerate(normalized):
+        if not text:
+            continue
+        if text in pending:
+            pending[text].append(i)
+            continue
+        if embedding_cache is not None:
+            cached = embedding_cache.get(make_cache_key(text, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS))
+            if cached is not None:
+                results[i] = cached
+                continue
+        pending[text] = [i]
+    return results, pending
+
+def _store_batch(response, batch: list[str], pending: dict, results: list) -> None:
+    # The API returns one item per input, tagged with its input index
+    for item in response.data:
+        text = batch[item.index]
+        if embedding_cache is not None:
+            embedding_cache.put(make_cache_key(text, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS), item.embedding)
+        for position in pending[text]:
+            results[position] = item.embedding
+
+def _pending_texts(texts: list[str]) -> dict:
+    """{text: result positions} for the non-empty texts, without cache lookups."""
+    pending = {}
+    for i, text in enumerate(texts):
+        if text:
+            pending.setdefault(text, []).append(i)
+    return pending
+
+def _embed_pending(pending: dict, results: list) -> None:
+    texts_to_embed = list(pending.keys())
+    for start in range(0, len(texts_to_embed), MAX_INPUTS_PER_REQUEST):
+        batch = texts_to_embed[start:start + MAX_INPUTS_PER_REQUEST]
+        try:
+            with span("openai_embedding"):
+                response = create_embeddings(batch)
+        except Exception as e:
+            logger.error("Error generating batch embeddings: %s", e)
+            raise e
+        _store_batch(response, batch, pending, results)
+
+async def _embed_pending_async(pending: dict, results: list) -> None:
+    texts_to_embed = list(pending.keys())
+    for start in range(0, len(texts_to_embed), MAX_INPUTS_PER_REQUEST):
+        batch = texts_to_embed[start:start + MAX_INPUTS_PER_REQUEST]
+        try:
+            with span("openai_embedding"):
+                response = await create_embeddings_async(batch)
+        except Exception as e:
+            logger.error("Error generating batch embeddings: %s", e)
+            raise e
+        _store_batch(response, batch, pending, results)
+
+def generate_embeddings(texts: list[str]) -> list[list[float]]:
+    """
+    Generates embeddings for many texts, preserving order. Cache hits are served locally and
+    all misses are sent to OpenAI in a single batched request (the API accepts a list of inputs).
+    Empty texts yield an empty list in their slot.
+    """
+    results, pending = _split_cached(texts)
+    _embed_pending(pending, results)
+    return results
+
+async def generate_embeddings_async(texts: list[str]) -> list[list[float]]:
+    """Async version of generate_embeddings, for the ASGI app."""
+    results, pending = _split_cached(texts)
+    await _embed_pending_async(pending, results)
+    return results
+
+def embed_cache_misses(texts: list[str]) -> list[list[float]]:
+    """
+    Embeds normalized texts that already missed the cache (the embed_many of the EmbeddingBatcher
+    behind generate_embedding) and caches the results, without looking the texts up again.
+    """
+    results = [[] for _ in texts]
+    _embed_pending(_pending_texts(texts), results)
+    return results
+
+async def embed_cache_misses_async(texts: list[str]) -> list[list[float]]:
+    """Async version of embed_cache_misses (for the AsyncEmbeddingBatcher)."""
+    results = [[] for _ in texts]
+    await _embed_pending_async(_pending_texts(texts), results)
+    return results
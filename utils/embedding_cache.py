@@ -0,0 +1,314 @@
+# utils/embedding_cache.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Embeddings come back from the API as float32, so we keep them that way:
+# 4 bytes per dimension (12 KB for a 3072-dim vector) instead of a list of Python floats.
+VECTOR_TYPECODE = "f"
+# Rough per-entry overhead (key string, tuple, OrderedDict node) counted against the byte budget
+ENTRY_OVERHEAD_BYTES = 200
+
+
+# === KEY HELPERS ===
+def normalize_text(text: str) -> str:
+    """Normalizes query text for caching: unicode NFC, collapsed whitespace, stripped."""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def make_cache_key(text: str, model: str, dimensions: int | None = None) -> str:
+    """Builds the cache key for a text under a given embedding model and dimension setting."""
+    raw = f"{model}\x00{dimensions or ''}\x00{text}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+# === IN-PROCESS TIER ===
+class MemoryTier:
+    """Thread-safe LRU with a per-entry TTL and a total byte budget."""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float | None = None):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.current_bytes = 0
+        self._entries = OrderedDict() # key -> (expires_at, array)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(vector: array) -> int:
+        return len(vector) * vector.itemsize + ENTRY_OVERHEAD_BYTES
+
+    def get(self, key: str) -> array | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, vector = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def put(self, key: str, vector: array) -> None:
+        size = self._entry_size(vector)
+        if size > self.max_bytes:
+            return # Would never fit, don't flush the whole cache for it
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, vector)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def _remove(self, key: str) -> None:
+        _, vector = self._entries.pop(key)
+        self.current_bytes -= self._entry_size(vector)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# === SHARED ON-DISK TIER ===
+class SQLiteTier:
+    """
+    SQLite-backed, content-addressed vector store shared by every process that points at the
+    same file (e.g. all gunicorn workers, or repeated ingestion runs). Uses WAL so readers
+    don't block the writer. Connections are per thread and per process, so it is safe to use
+    after fork. Tracks last use per entry so the file can be shrunk with evict_to_size().
+    """
+
+    # SQLite's default limit on bound variables per statement is 999
+    MAX_KEYS_PER_QUERY = 500
+
+    def __init__(self, path: str, ttl_seconds: float | None = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used_at REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(embeddings)")}
+            if "last_used_at" not in columns: # Files created before usage tracking
+                conn.execute("ALTER TABLE embeddings ADD COLUMN last_used_at REAL NOT NULL DEFAULT 0")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _is_expired(self, created_at: float) -> bool:
+        return bool(self.ttl_seconds) and created_at + self.ttl_seconds < time.time()
+
+    @staticmethod
+    def _to_vector(blob: bytes) -> array:
+        vector = array(VECTOR_TYPECODE)
+        vector.frombytes(blob)
+        return vector
+
+    def get(self, key: str) -> array | None:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Looks up many keys with a few IN queries. Returns {key: vector} for the hits only."""
+        found = {}
+        conn = self._connect()
+        for start in range(0, len(keys), self.MAX_KEYS_PER_QUERY):
+            batch = keys[start:start + self.MAX_KEYS_PER_QUERY]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector, created_at FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob, created_at in rows:
+                if not self._is_expired(created_at): # Expired rows are overwritten on the next put
+                    found[key] = self._to_vector(blob)
+        if found:
+            with conn:
+                conn.executemany(
+                    "UPDATE embeddings SET last_used_at = ? WHERE key = ?",
+                    [(time.time(), key) for key in found],
+                )
+        return found
+
+    def put(self, key: str, vector: array) -> None:
+        self.put_many([(key, vector)])
+
+    def put_many(self, items: list[tuple[str, array]]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                [(key, vector.tobytes(), now, now) for key, vector in items],
+            )
+
+    def purge_expired(self) -> int:
+        """Deletes expired rows. Returns the number of rows removed."""
+        if not self.ttl_seconds:
+            return 0
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            return cursor.rowcount
+
+    def evict_to_size(self, max_bytes: int) -> int:
+        """
+        Deletes the least recently used entries until the stored vectors total at most max_bytes.
+        Returns the number of rows removed (run compact() afterwards to give the space back to the OS).
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM ("
+                "  SELECT key, SUM(LENGTH(vector)) OVER (ORDER BY last_used_at DESC, key) AS running_bytes"
+                "  FROM embeddings)"
+                " WHERE running_bytes > ?)",
+                (max_bytes,),
+            )
+            return cursor.rowcount
+
+    def compact(self) -> None:
+        """Drops expired rows and rewrites the file (VACUUM) so freed pages are returned to the OS."""
+        self.purge_expired()
+        conn = self._connect()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def stats(self) -> dict:
+        rows, vector_bytes = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        file_bytes = sum(os.path.getsize(p) for p in (self.path, f"{self.path}-wal") if os.path.exists(p))
+        return {"entries": rows, "vector_bytes": vector_bytes, "file_bytes": file_bytes}
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM embeddings")
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+# === TIERED CACHE ===
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-process LRU in front of an optional SQLite file.
+    Disk hits are promoted into memory. Keeps hit/miss counters for monitoring.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float | None = None,
+                 disk_path: str | None = None, disk_ttl_seconds: float | None = None):
+        self.memory = MemoryTier(max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self.disk = SQLiteTier(disk_path, ttl_seconds=disk_ttl_seconds) if disk_path else None
+        self._counter_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_errors = 0
+
+    def _count(self, name: str) -> None:
+        with self._counter_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key: str) -> list[float] | None:
+        vector = self.memory.get(key)
+        if vector is not None:
+            self._count("memory_hits")
+            return vector.tolist()
+
+        if self.disk is not None:
+            try:
+                vector = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning("Embedding cache disk read failed: %s", e)
+                self._count("disk_errors")
+                vector = None
+            if vector is not None:
+                self._count("disk_hits")
+                self.memory.put(key, vector)
+                return vector.tolist()
+
+        self._count("misses")
+        return None
+
+    def put(self, key: str, embedding: list[float]) -> None:
+        vector = array(VECTOR_TYPECODE, embedding)
+        self.memory.put(key, vector)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, vector)
+            except sqlite3.Error as e:
+                logger.warning("Embedding cache disk write failed: %s", e)
+                self._count("disk_errors")
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        with self._counter_lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_errors": self.disk_errors,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory.current_bytes,
+                "memory_max_bytes": self.memory.max_bytes,
+                "disk_enabled": self.disk is not None,
+            }
+
+
+# === MAINTENANCE COMMAND ===
+if __name__ == "__main__":
+    import sys
+    usage = ("Usage: python -m utils.embedding_cache <store.sqlite> stats\n"
+             "       python -m utils.embedding_cache <store.sqlite> evict <max_megabytes>\n"
+             "       python -m utils.embedding_cache <store.sqlite> compact")
+    if len(sys.argv) < 3 or sys.argv[2] not in ("stats", "evict", "compact"):
+        print(usage)
+        sys.exit(1)
+    store = SQLiteTier(sys.argv[1])
+    command = sys.argv[2]
+    if command == "evict":
+        if len(sys.argv) != 4:
+            print(usage)
+            sys.exit(1)
+        removed = store.evict_to_size(int(float(sys.argv[3]) * 1024 * 1024))
+        print(f"Evicted {removed} least recently used entries.")
+        store.compact()
+    elif command == "compact":
+        store.compact()
+    print(store.stats())
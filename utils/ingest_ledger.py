@@ -0,0 +1,113 @@
+# utils/ingest_ledger.py
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from itertools import islice
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+def record_content_hash(record: dict, slim: bool = False) -> str:
+    """
+    Hash of everything the sync writes for a chunk: its full metadata, the upsert mode (slim =
+    only index_metadata() in the index and the rest in a doc store, or full metadata in the
+    index) and the vector dimension. Any metadata edit or a switch of the doc store on/off
+    therefore re-upserts the chunk. The vector itself is a deterministic function of the text,
+    so it doesn't need hashing.
+    """
+    payload = json.dumps({"mode": "slim" if slim else "full", "metadata": record.get("metadata") or {}},
+                         sort_keys=True, separators=(",", ":"), default=str)
+    dimension = len(record.get("values") if record.get("values") is not None else [])
+    return hashlib.sha256(f"{dimension}\x00{payload}".encode("utf-8")).hexdigest()
+
+
+class IngestLedger:
+    """
+    Local SQLite record of what has been upserted to each namespace: one row per vector ID with
+    its PMID and content hash. Lets the sync upload only new/changed chunks and delete chunks
+    that disappeared from an article, without any remote existence checks.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " namespace TEXT NOT NULL,"
+            " vector_id TEXT NOT NULL,"
+            " pmid TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, vector_id))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_by_pmid ON chunks (namespace, pmid)")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def count(self, namespace: str = "") -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM chunks WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def filter_changed(self, records, namespace: str = "", seen_ids_by_pmid: dict | None = None, slim: bool = False):
+        """
+        Yields only the records that are new or whose content hash (for the given upsert mode,
+        see record_content_hash) differs from the ledger.
+        If seen_ids_by_pmid is given, it is filled with {pmid: set of vector IDs in the input},
+        which stale_ids() uses afterwards.
+        """
+        records = iter(records)
+        while True:
+            batch = list(islice(records, LOOKUP_BATCH_SIZE))
+            if not batch:
+                return
+            placeholders = ",".join("?" * len(batch))
+            known = dict(self.conn.execute(
+                f"SELECT vector_id, content_hash FROM chunks WHERE namespace = ? AND vector_id IN ({placeholders})",
+                (namespace, *(record["id"] for record in batch)),
+            ))
+            for record in batch:
+                if seen_ids_by_pmid is not None:
+                    pmid = str(record.get("metadata", {}).get("pmid"))
+                    seen_ids_by_pmid.setdefault(pmid, set()).add(record["id"])
+                if known.get(record["id"]) != record_content_hash(record, slim):
+                    yield record
+
+    def record_upserted(self, records, namespace: str = "", slim: bool = False) -> None:
+        """Marks a successfully upserted batch of records (upserted in the given mode) in the ledger."""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO chunks (namespace, vector_id, pmid, content_hash, updated_at) VALUES (?, ?, ?, ?, ?)",
+            [(namespace, record["id"], str(record.get("metadata", {}).get("pmid")), record_content_hash(record, slim), now)
+             for record in records],
+        )
+        self.conn.commit()
+
+    def stale_ids(self, seen_ids_by_pmid: dict, namespace: str = "") -> list[str]:
+        """
+        Vector IDs in the ledger for the PMIDs of this input that the input no longer contains
+        (e.g. an article now produces fewer chunks, or its module/ID prefix changed).
+        """
+        stale = []
+        pmids = list(seen_ids_by_pmid)
+        for start in range(0, len(pmids), LOOKUP_BATCH_SIZE):
+            batch = pmids[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT pmid, vector_id FROM chunks WHERE namespace = ? AND pmid IN ({placeholders})", (namespace, *batch)
+            )
+            stale.extend(vector_id for pmid, vector_id in rows if vector_id not in seen_ids_by_pmid[pmid])
+        return stale
+
+    def remove(self, vector_ids: list[str], namespace: str = "") -> None:
+        self.conn.executemany(
+            "DELETE FROM chunks WHERE namespace = ? AND vector_id = ?",
+            [(namespace, vector_id) for vector_id in vector_ids],
+        )
+        self.conn.commit()
@@ -0,0 +1,202 @@
+# utils/lexical_index.py
+import math
+import re
+
+import numpy as np
+
+from utils.local_index import LocalMatch, LocalQueryResult
+from utils.vector_format import iter_json_records, iter_metadata, store_base_path
+
+TOKEN_RE = re.compile(r"\w+")
+PMCID_RE = re.compile(r"^pmc\d+$")
+PMID_RE = re.compile(r"^\d{6,9}$")
+
+# BM25 parameters (the usual defaults) and how much more a tag occurrence counts than a word in the text
+BM25_K1 = 1.2
+BM25_B = 0.75
+TAG_WEIGHT = 3.0
+# Queries longer than this are never treated as identifier lookups
+MAX_IDENTIFIER_QUERY_TOKENS = 3
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased word tokens; underscores stay inside tokens so normalized tags match as a whole."""
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+def _tag_tokens(tag: str) -> list[str]:
+    """A normalized tag ("illumina_miseq") as one token plus its parts ("illumina", "miseq")."""
+    tokens = tokenize(tag)
+    parts = [part for token in tokens for part in token.split("_") if part and part != token]
+    return tokens + parts
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over chunk metadata written by pubmed_chunker: the chunk
+    'text', its 'tags' (weighted TAG_WEIGHT) and its 'pmid' / 'pmcid'. Built once from the
+    records file; per-posting BM25 weights are precomputed, so a query is a handful of
+    vectorized adds over the posting lists of its terms.
+    search() returns the same LocalQueryResult shape as LocalIndex.query, so
+    utils.retriever.format_matches works on both.
+    """
+
+    def __init__(self, ids: list[str], metadata: list[dict]):
+        self.ids = ids
+        self.metadata = metadata
+        self.tags = set() # whole normalized tags, for exact-tag identifier queries
+        self.identifier_terms = set() # pmids / pmcids present in the index
+
+        term_freqs = [] # per row: {term: weighted frequency}
+        for meta in metadata:
+            freqs = {}
+            for token in tokenize(meta.get("text", "")):
+                freqs[token] = freqs.get(token, 0.0) + 1.0
+            for tag in meta.get("tags") or []:
+                self.tags.add(str(tag).strip().lower())
+                for token in _tag_tokens(str(tag)):
+                    freqs[token] = freqs.get(token, 0.0) + TAG_WEIGHT
+            for field in ("pmid", "pmcid"):
+                value = str(meta.get(field) or "").strip().lower()
+                if value:
+                    freqs[value] = freqs.get(value, 0.0) + 1.0
+                    self.identifier_terms.add(value)
+                    if field == "pmcid" and not value.startswith("pmc"):
+                        freqs[f"pmc{value}"] = freqs.get(f"pmc{value}", 0.0) + 1.0
+                        self.identifier_terms.add(f"pmc{value}")
+            term_freqs.append(freqs)
+
+        doc_lengths = np.array([sum(freqs.values()) for freqs in term_freqs], dtype=np.float32)
+        average_length = float(doc_lengths.mean()) if len(doc_lengths) else 1.0
+        n_docs = len(ids)
+
+        postings = {}
+        for row, freqs in enumerate(term_freqs):
+            for term, tf in freqs.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(row)
+                postings[term][1].append(tf)
+
+        # term -> (rows, BM25 weight of the term in each row, idf included)
+        self.postings = {}
+        for term, (rows, tfs) in postings.items():
+            rows = np.asarray(rows, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            idf = math.log(1.0 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            if term in self.identifier_terms:
+                # No length normalization: every chunk of a PMID scores the same and stays in chunk order
+                norm = np.full(len(rows), BM25_K1, dtype=np.float32)
+            else:
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * doc_lengths[rows] / (average_length or 1.0))
+            self.postings[term] = (rows, (idf * tfs * (BM25_K1 + 1.0) / (tfs + norm)).astype(np.float32))
+
+        self.module_rows = {}
+        for row, meta in enumerate(metadata):
+            self.module_rows.setdefault(meta.get("module"), []).append(row)
+        self.module_rows = {module: np.asarray(rows, dtype=np.int32) for module, rows in self.module_rows.items()}
+
+    # === LOADING ===
+    @classmethod
+    def from_records(cls, records) -> "LexicalIndex":
+        """Builds from (id, metadata) pairs."""
+        ids, metadata = [], []
+        for vector_id, meta in records:
+            ids.append(vector_id)
+            metadata.append(meta or {})
+        return cls(ids, metadata)
+
+    @classmethod
+    def from_path(cls, path: str) -> "LexicalIndex":
+        """Builds from a records JSON/JSONL file or a vector store (only its metadata sidecar is read)."""
+        if path.endswith(".json") or path.endswith(".jsonl"):
+            records = ((record["id"], record.get("metadata")) for record in iter_json_records(path))
+        else:
+            records = iter_metadata(store_base_path(path))
+        index = cls.from_records(records)
+        print(f"Built lexical index over {len(index.ids)} chunks ({len(index.postings)} terms)")
+        return index
+
+    # === QUERYING ===
+    def is_identifier_query(self, text: str) -> bool:
+        """
+        True for short queries that are an exact whole tag ("illumina_miseq") or made only of
+        identifiers: PMIDs / PMCIDs and mixed letter-digit tokens (DADA2, QIIME2, 16S).
+        Ordinary words, parts of tags and plain acronyms (PCR) go through vector search.
+        """
+        query = (text or "").strip().lower()
+        if query in self.tags:
+            return True
+        tokens = TOKEN_RE.findall(query)
+        if not tokens or len(tokens) > MAX_IDENTIFIER_QUERY_TOKENS:
+            return False
+        for token in tokens:
+            if token in self.identifier_terms or PMCID_RE.match(token) or PMID_RE.match(token):
+                continue
+            if any(c.isdigit() for c in token) and any(c.isalpha() for c in token):
+                continue
+            return False
+        return True
+
+    def _filter_rows(self, filter: dict | None) -> np.ndarray | None:
+        """Rows allowed by a Pinecone-style filter on 'module' (equality, $eq or $in)."""
+        if not filter:
+            return None
+        condition = filter.get("module")
+        if isinstance(condition, dict):
+            modules = [condition["$eq"]] if "$eq" in condition else list(condition.get("$in", []))
+        else:
+            modules = [condition]
+        rows = [self.module_rows[module] for module in modules if module in self.module_rows]
+        return np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+
+    def search(self, text: str, top_k: int = 10, filter: dict | None = None,
+               include_metadata: bool = True) -> LocalQueryResult:
+        """BM25 top-k for the query text (ties keep index order, i.e. chunk order within an article)."""
+        terms = set(tokenize(text))
+        if not self.ids or top_k <= 0 or not terms:
+            return LocalQueryResult(matches=[])
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1] # Rows within a posting list are unique
+
+        allowed = self._filter_rows(filter)
+        if allowed is not None:
+            masked = np.zeros_like(scores)
+            masked[allowed] = scores[allowed]
+            scores = masked
+
+        candidates = np.flatnonzero(scores > 0)
+        if not len(candidates):
+            return LocalQueryResult(matches=[])
+        k = min(top_k, len(candidates))
+        if k < len(candidates):
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top_rows = candidates[np.lexsort((candidates, -scores[candidates]))]
+
+        return LocalQueryResult(matches=[
+            LocalMatch(id=self.ids[row], score=float(scores[row]),
+                       metadata=self.metadata[row] if include_metadata else None)
+            for row in top_rows
+        ])
+
+    def describe_index_stats(self) -> dict:
+        return {"total_chunk_count": len(self.ids), "term_count": len(self.postings)}
+
+
+def reciprocal_rank_fusion(result_lists: list[list[dict]], top_k: int, k: int = 60) -> list[dict]:
+    """
+    Merges ranked result lists (API result dicts with an 'id') by Reciprocal Rank Fusion:
+    score = sum over lists of 1 / (k + rank). The first list's copy of each result is kept,
+    with its score replaced by the fused score.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            entry = fused.get(result["id"])
+            if entry is None:
+                entry = fused[result["id"]] = [0.0, result]
+            entry[0] += 1.0 / (k + rank)
+    ranked = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)[:top_k]
+    return [{**result, "score": round(score, 6)} for score, result in ranked]
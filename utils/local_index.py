@@ -0,0 +1,169 @@
+# utils/local_index.py
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from utils.vector_format import (
+    convert_json_to_vector_store, iter_json_records, iter_metadata, load_vectors,
+    store_base_path, store_paths,
+)
+
+# Same shape as the Pinecone query response objects that query_pinecone reads
+LocalMatch = namedtuple("LocalMatch", ["id", "score", "metadata"])
+LocalQueryResult = namedtuple("LocalQueryResult", ["matches"])
+
+
+class LocalIndex:
+    """
+    Exact in-process vector index over the records written by pubmed_chunker
+    (save_data JSON or JsonlWriter output).
+    Exposes the subset of the Pinecone Index.query() interface used by utils.retriever,
+    so it can be passed to query_pinecone in place of a Pinecone index.
+
+    Vectors live in one contiguous float32 matrix (memory-mapped from a .npy vector store), row norms
+    are precomputed once, and each query is a single matmul + argpartition. Module filters
+    use precomputed boolean row masks.
+
+    The records form a single namespace: with `namespace` set, queries to any other namespace
+    return no matches (as Pinecone would); with None, the namespace argument is ignored.
+    """
+
+    def __init__(self, vectors: np.ndarray, ids: list[str], metadata: list[dict], namespace: str | None = None):
+        if len(ids) != vectors.shape[0] or len(metadata) != vectors.shape[0]:
+            raise ValueError("ids, metadata and vectors must have the same number of rows.")
+        self.vectors = vectors
+        self.ids = ids
+        self.metadata = metadata
+        self.namespace = namespace
+        self.dimension = vectors.shape[1] if vectors.ndim == 2 else 0
+
+        norms = np.linalg.norm(vectors, axis=1).astype(np.float32) if len(ids) else np.zeros(0, np.float32)
+        norms[norms == 0] = 1.0 # Zero vectors score 0 instead of NaN
+        self.norms = norms
+
+        module_rows = {}
+        for row, meta in enumerate(metadata):
+            module_rows.setdefault(meta.get("module"), []).append(row)
+        self.module_masks = {}
+        for module, rows in module_rows.items():
+            mask = np.zeros(len(ids), dtype=bool)
+            mask[rows] = True
+            self.module_masks[module] = mask
+
+    # === LOADING ===
+    @classmethod
+    def from_vector_store(cls, base_path: str, namespace: str | None = None) -> "LocalIndex":
+        """Memory-maps a binary vector store written by utils.vector_format."""
+        vectors = load_vectors(base_path)
+        ids, metadata = [], []
+        for vector_id, meta in iter_metadata(base_path):
+            ids.append(vector_id)
+            metadata.append(meta)
+        print(f"Loaded local index with {len(ids)} vectors (dim: {vectors.shape[1] if len(ids) else 0})")
+        return cls(vectors, ids, metadata, namespace)
+
+    @classmethod
+    def from_json(cls, json_path: str, use_cache: bool = True, namespace: str | None = None) -> "LocalIndex":
+        """
+        Loads an index from a pubmed_chunker JSON (or streamed .jsonl) file. The first load
+        converts it to a binary vector store next to it (<base>.vectors.npy + <base>.meta.jsonl);
+        later loads memory-map the .npy directly and only re-convert when the JSON is newer.
+        """
+        base_path, _ = os.path.splitext(json_path)
+        npy_path, meta_path = store_paths(base_path)
+        if not use_cache:
+            return cls._from_records(iter_json_records(json_path), namespace)
+
+        cache_is_fresh = (
+            os.path.exists(npy_path) and os.path.exists(meta_path)
+            and os.path.getmtime(npy_path) >= os.path.getmtime(json_path)
+            and os.path.getmtime(meta_path) >= os.path.getmtime(json_path)
+        )
+        if not cache_is_fresh:
+            convert_json_to_vector_store(json_path, base_path)
+        return cls.from_vector_store(base_path, namespace)
+
+    @classmethod
+    def from_path(cls, path: str, namespace: str | None = None) -> "LocalIndex":
+        """Loads from a vector store (.vectors.npy path or base path) or a JSON/JSONL records file."""
+        if path.endswith(".json") or path.endswith(".jsonl"):
+            return cls.from_json(path, namespace=namespace)
+        return cls.from_vector_store(store_base_path(path), namespace)
+
+    @classmethod
+    def _from_records(cls, records, namespace: str | None = None) -> "LocalIndex":
+        ids, metadata, rows = [], [], []
+        for record in records:
+            rows.append(np.asarray(record["values"], dtype=np.float32))
+            ids.append(record["id"])
+            metadata.append(record.get("metadata") or {})
+        vectors = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+        return cls(vectors, ids, metadata, namespace)
+
+    # === QUERYING ===
+    def _filter_mask(self, filter: dict | None) -> np.ndarray | None:
+        """Translates a Pinecone-style metadata filter on 'module' into a row mask."""
+        if not filter:
+            return None
+        unsupported = set(filter) - {"module"}
+        if unsupported:
+            raise ValueError(f"LocalIndex only supports filtering on 'module', got: {sorted(unsupported)}")
+        condition = filter["module"]
+        if isinstance(condition, dict):
+            if "$eq" in condition:
+                modules = [condition["$eq"]]
+            elif "$in" in condition:
+                modules = list(condition["$in"])
+            else:
+                raise ValueError(f"Unsupported module filter operator: {condition}")
+        else:
+            modules = [condition]
+
+        mask = np.zeros(len(self.ids), dtype=bool)
+        for module in modules:
+            module_mask = self.module_masks.get(module)
+            if module_mask is not None:
+                mask |= module_mask
+        return mask
+
+    def query(self, vector: list[float], top_k: int = 10, namespace: str = "",
+              include_metadata: bool = True, filter: dict | None = None, **kwargs) -> LocalQueryResult:
+        """Exact cosine top-k. No matches for a namespace other than self.namespace (when set)."""
+        if not self.ids or top_k <= 0 or (self.namespace is not None and namespace != self.namespace):
+            return LocalQueryResult(matches=[])
+
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape != (self.dimension,):
+            raise ValueError(f"Query vector has dimension {query.shape[0]}, index has {self.dimension}")
+        query_norm = float(np.linalg.norm(query)) or 1.0
+
+        scores = (self.vectors @ query) / (self.norms * query_norm)
+        mask = self._filter_mask(filter)
+        if mask is not None:
+            candidates = int(mask.sum())
+            if candidates == 0:
+                return LocalQueryResult(matches=[])
+            scores = np.where(mask, scores, -np.inf)
+        else:
+            candidates = len(self.ids)
+
+        k = min(top_k, candidates)
+        if k < len(scores):
+            top_rows = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top_rows = np.arange(len(scores))
+        top_rows = top_rows[np.argsort(-scores[top_rows], kind="stable")]
+
+        matches = [
+            LocalMatch(
+                id=self.ids[row],
+                score=float(scores[row]),
+                metadata=self.metadata[row] if include_metadata else None,
+            )
+            for row in top_rows
+        ]
+        return LocalQueryResult(matches=matches)
+
+    def describe_index_stats(self) -> dict:
+        return {"dimension": self.dimension, "total_vector_count": len(self.ids)}
@@ -0,0 +1,246 @@
+# utils/observability.py
+import bisect
+import contextlib
+import logging
+import math
+import sys
+import threading
+import time
+
+import config
+
+# Latency buckets in seconds: sub-millisecond cache hits up to slow OpenAI round trips
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+INF_LABEL = 'le="+Inf"'
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] pid=%(process)d %(message)s"
+
+
+# === LOGGING ===
+_logging_configured = False
+
+def setup_logging(level: str | None = None) -> None:
+    """
+    Configures the root logger once (level from LOG_LEVEL); later calls are no-ops.
+    Only the entry points (app.py, asgi.py) call this, so importing a utils module
+    never touches the logging setup of whoever imports it.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+    logging.basicConfig(level=(level or config.LOG_LEVEL).upper(), format=LOG_FORMAT, stream=sys.stderr)
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+# === METRICS ===
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics) with optional labels."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # labelvalues -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for labelvalues, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, INF_LABEL)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labelvalues)} {series[-2]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labelvalues)} {_format_value(series[-1])}"
+
+
+class Registry:
+    """Metrics of this process plus callbacks that contribute gauges at scrape time (e.g. cache stats)."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._gauge_callbacks = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def register_gauges(self, prefix: str, documentation: str, stats_function) -> None:
+        """At every scrape, stats_function() -> dict; each numeric value becomes a gauge <prefix>_<key>."""
+        with self._lock:
+            self._gauge_callbacks.append((prefix, documentation, stats_function))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            callbacks = list(self._gauge_callbacks)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for prefix, documentation, stats_function in callbacks:
+            try:
+                stats = stats_function() or {}
+            except Exception as e:
+                get_logger(__name__).warning("Metrics callback %s failed: %s", prefix, e)
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {documentation} ({key})")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Serving metrics (per worker process; scrape each worker or aggregate in Prometheus)
+STAGE_LATENCY = REGISTRY.histogram(
+    "rag_stage_duration_seconds", "Latency of one stage of a RAG query", ("stage",))
+REQUEST_LATENCY = REGISTRY.histogram(
+    "rag_request_duration_seconds", "End-to-end latency of an API request", ("endpoint",))
+REQUESTS = REGISTRY.counter(
+    "rag_requests_total", "API requests by endpoint and HTTP status", ("endpoint", "status"))
+ERRORS = REGISTRY.counter(
+    "rag_errors_total", "Errors by stage and exception type", ("stage", "error"))
+
+
+@contextlib.contextmanager
+def span(stage: str, logger: logging.Logger | None = None):
+    """
+    Times a block as one stage: observes rag_stage_duration_seconds{stage}, counts exceptions
+    in rag_errors_total{stage, error} (and re-raises), and logs the duration at DEBUG.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        ERRORS.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        if logger is not None and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("stage=%s duration_ms=%.2f", stage, elapsed * 1000)
+
+def record_request(endpoint: str, status: int, elapsed: float) -> None:
+    REQUESTS.inc(endpoint=endpoint, status=status)
+    REQUEST_LATENCY.observe(elapsed, endpoint=endpoint)
+
+
+# === INGESTION THROUGHPUT ===
+class StageStats:
+    """
+    Per-stage wall time and item counts for the ingestion scripts (fetch, extract, chunk,
+    embed, upsert, ...). Thread-safe; report() prints items/s per stage.
+    """
+
+    def __init__(self, name: str = "pipeline"):
+        self.name = name
+        self._stages = {} # stage -> [seconds, items, errors]
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, items: int = 0):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.add(stage, time.perf_counter() - start, 0, errors=1)
+            raise
+        self.add(stage, time.perf_counter() - start, items)
+
+    def add(self, stage: str, seconds: float, items: int = 0, errors: int = 0) -> None:
+        with self._lock:
+            totals = self._stages.setdefault(stage, [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += items
+            totals[2] += errors
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {stage: {"seconds": round(seconds, 3), "items": items, "errors": errors,
+                            "items_per_second": round(items / seconds, 2) if seconds > 0 else None}
+                    for stage, (seconds, items, errors) in self._stages.items()}
+
+    def report(self) -> None:
+        """Prints one line per stage. Stage times are summed over threads, so they can exceed wall time."""
+        wall = time.perf_counter() - self._started_at
+        print(f"\n📊 {self.name} stage throughput (wall time {wall:.1f}s):")
+        for stage, stats in self.snapshot().items():
+            rate = f"{stats['items_per_second']:.1f}/s" if stats["items_per_second"] is not None else "-"
+            errors = f", {stats['errors']} errors" if stats["errors"] else ""
+            print(f"  {stage:<12} {stats['items']:>8} items in {stats['seconds']:8.2f}s ({rate}){errors}")
@@ -1,10 +1,21 @@
 import os
+import sys
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pinecone import Pinecone
-from math import ceil
+from pinecone.exceptions import PineconeApiException as ApiException
 from collections import defaultdict
 
+# Allow running as a script (python utils/pincone_update.py) as well as a module (python -m utils.pincone_update)
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.vector_format import iter_vector_store_records
+from utils.rate_limiter import AdaptiveThrottle, backoff_delay, is_rate_limit_error, is_retryable_error
+from utils.ingest_ledger import IngestLedger, record_content_hash
+from utils.doc_store import DocStore, index_metadata
+from utils.observability import StageStats
+
 # === CONFIGURATION ===
 # --- Pinecone Credentials & Index ---
 # Best practice: Load API key from environment variable
@@ -18,10 +29,33 @@ PINECONE_NAMESPACE = "" # e.g., "pubmed-data" or leave empty for default namespa
 
 # --- Input Data ---
 # Path to the JSON file generated by the processing script
+# A ".jsonl" file (pubmed_chunker OUTPUT_FORMAT = "jsonl") is read lazily, batch by batch.
+# A ".vectors.npy" file (OUTPUT_FORMAT = "npy") is memory-mapped and sliced per batch, with its .meta.jsonl sidecar.
 INPUT_JSON_FILE = "pinecone_data_final_modules.json" # Make sure this path is correct
 
 # --- Processing Parameters ---
 BATCH_SIZE = 100 # Pinecone recommends up to 100 for upsert
+UPSERT_CONCURRENCY = 4 # Upsert batches in flight at once
+UPSERT_MAX_RETRIES = 5 # Attempts per batch before it is left for the next run
+# Append-only log of upserted vector IDs and their content hashes; an interrupted run over the same
+# input resumes after the last completed batch. Removed once every batch of a run has succeeded.
+CHECKPOINT_FILE = "upsert_checkpoint.log"
+# Local record of upserted chunk IDs + content hashes. When enabled, only new/changed chunks are
+# uploaded and chunks that disappeared from an article are deleted, with no remote existence checks.
+# Set to "" to fall back to the first-chunk check against Pinecone (find_existing_pmids).
+LEDGER_FILE = "ingest_ledger.sqlite"
+DELETE_BATCH_SIZE = 1000 # IDs per Pinecone delete request
+# Local document store (utils/doc_store.py) for the chunk text and the rest of the metadata. When set,
+# only the filterable fields (pmid, module) are upserted to Pinecone and the API hydrates results from
+# this file (config.DOC_STORE_PATH). "" upserts the full metadata as before.
+DOC_STORE_FILE = ""
+
+# --- Serving API (optional) ---
+# Base URL of the running mind-api (e.g. "http://localhost:5050"). When set, its query result
+# cache is invalidated after new vectors are upserted so stale results are not served.
+MIND_API_URL = os.getenv("MIND_API_URL", "")
+# Must match the API's CACHE_ADMIN_TOKEN (its /cache/invalidate endpoint refuses requests without it)
+MIND_API_TOKEN = os.getenv("CACHE_ADMIN_TOKEN", "")
 
 # === SCRIPT ===
 
@@ -52,6 +86,45 @@ def load_data_from_json(filepath):
         print(f"An error occurred while loading data: {e}")
         return None
 
+def iter_records_jsonl(filepath):
+    """
+    Lazily yields records from a JSON Lines file (one record per line), so memory use does not
+    depend on the size of the corpus. Malformed lines are reported and skipped.
+    """
+    with open(filepath, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip(): continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"  ⚠️ Skipping malformed JSON on line {line_number} of {filepath}")
+                continue
+            if 'pmid' not in record.get('metadata', {}):
+                print(f"  ⚠️ Skipping record on line {line_number} without 'pmid' in its metadata")
+                continue
+            yield record
+
+def iter_input_records(filepath):
+    """Lazily yields records from a .jsonl file or a binary vector store (.vectors.npy)."""
+    if filepath.endswith(".vectors.npy"):
+        return iter_vector_store_records(filepath)
+    return iter_records_jsonl(filepath)
+
+def iter_batches(records, batch_size=BATCH_SIZE):
+    """Groups any iterable of records into lists of at most batch_size."""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _as_float_list(values):
+    """Vector-store rows are float32 memmap views; convert only at upsert time, one batch at a time."""
+    return values.tolist() if hasattr(values, "tolist") else values
+
 def find_existing_pmids(index, data_records, namespace=""):
     """
     Checks Pinecone for the existence of PMIDs based on a proxy chunk ID.
@@ -93,47 +166,213 @@ def find_existing_pmids(index, data_records, namespace=""):
     print(f"Found {len(existing_pmids)} PMIDs potentially already in Pinecone (based on first chunk check).")
     return existing_pmids
 
-def upsert_new_data(index, data_records, pmids_to_skip, namespace=""):
-    """Filters out records belonging to skipped PMIDs and upserts the rest."""
+def _checkpoint_header(namespace="", source=""):
+    return f"#namespace={namespace}\tsource={source}"
+
+def load_checkpoint(checkpoint_file, namespace="", source=""):
+    """
+    Returns {vector ID: content hash} of the records already upserted by an interrupted run into
+    the same namespace from the same input `source` (empty if none). The first line of the log
+    records both; a checkpoint from any other run is ignored.
+    """
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return {}
+    with open(checkpoint_file, 'r') as f:
+        header = f.readline().strip()
+        if header != _checkpoint_header(namespace, source):
+            print(f"  ⚠️ Ignoring checkpoint {checkpoint_file}: it belongs to another run ({header}).")
+            return {}
+        done = dict(line.rstrip("\n").rsplit(" ", 1) for line in f if line.strip())
+    print(f"Resuming from checkpoint {checkpoint_file}: {len(done)} vectors already upserted.")
+    return done
 
-    # Filter records
-    records_to_upload = [
+def _upsert_batch_with_retry(index, vectors_to_upsert, namespace, throttle, max_retries=UPSERT_MAX_RETRIES):
+    """
+    Upserts one batch, retrying rate limits and transient failures (5xx, timeouts, connection
+    errors) with jittered exponential backoff. Rate-limit errors also slow down every other
+    in-flight worker through the shared throttle. Other errors (e.g. a 400 for a dimension
+    mismatch or oversized metadata) can't succeed on retry and fail the batch at once.
+    Returns the upserted count, or None if the batch failed.
+    """
+    for attempt in range(max_retries):
+        throttle.wait()
+        try:
+            upsert_response = index.upsert(vectors=vectors_to_upsert, namespace=namespace)
+            throttle.success()
+            return upsert_response.upserted_count
+        except Exception as e:
+            if is_rate_limit_error(e):
+                throttle.failure()
+            if not is_retryable_error(e):
+                print(f"  ❌ Upsert of {len(vectors_to_upsert)} records rejected (not retryable): {e}")
+                return None
+            if attempt + 1 == max_retries:
+                print(f"  ❌ Upsert of {len(vectors_to_upsert)} records failed after {max_retries} attempts: {e}")
+                return None
+            delay = backoff_delay(attempt)
+            print(f"  ⚠️ Upsert of {len(vectors_to_upsert)} records failed (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return None
+
+def upsert_new_data(index, data_records, pmids_to_skip, namespace="",
+                    concurrency=UPSERT_CONCURRENCY, checkpoint_file=CHECKPOINT_FILE, on_batch_upserted=None,
+                    stats=None, doc_store=None, source=""):
+    """
+    Filters out records belonging to skipped PMIDs and upserts the rest.
+    data_records may be a list or any iterable (e.g. iter_records_jsonl); it is consumed
+    lazily, one upsert batch at a time, with up to `concurrency` batches in flight.
+    Completed batches are logged to checkpoint_file (with each record's content hash) so a rerun
+    over the same input `source` skips the records that haven't changed since, and passed to
+    on_batch_upserted(records) if given (e.g. to update the ingest ledger).
+    With a doc_store (utils.doc_store.DocStore), each batch's full metadata is written to it
+    first and only index_metadata() is upserted.
+    Prints per-stage throughput at the end (pass a StageStats as `stats` to collect it instead).
+    """
+    report = stats is None
+    stats = stats or StageStats("pincone_update")
+    slim = doc_store is not None
+    done = load_checkpoint(checkpoint_file, namespace, source)
+    new_records = (
         record for record in data_records
         if record.get('metadata', {}).get('pmid') not in pmids_to_skip
-    ]
-    total_new_records = len(records_to_upload)
+        and (not done or done.get(record['id']) != record_content_hash(record, slim))
+    )
 
-    if not total_new_records:
-        print("\nNo new records to upload (all PMIDs found or input was empty).")
-        return
-
-    print(f"\n🚀 Preparing to upload {total_new_records} chunks belonging to new PMIDs...")
+    print(f"\n🚀 Uploading chunks belonging to new PMIDs in batches of {BATCH_SIZE} ({concurrency} in flight)...")
 
+    throttle = AdaptiveThrottle()
+    checkpoint = None
+    if checkpoint_file:
+        checkpoint = open(checkpoint_file, 'a' if done else 'w')
+        if not done:
+            checkpoint.write(_checkpoint_header(namespace, source) + "\n")
+    total_new_records = 0
     upserted_count = 0
-    # Process in batches
-    for i in range(0, total_new_records, BATCH_SIZE):
-        batch_upload_records = records_to_upload[i : i + BATCH_SIZE]
+    failed_batches = 0
+
+    def handle_done(futures):
+        nonlocal upserted_count, failed_batches
+        for future in futures:
+            batch_upload_records, count = future.result()
+            batch_ids = [record['id'] for record in batch_upload_records]
+            if count is None:
+                failed_batches += 1
+                print(f"  ⚠️ Giving up on a batch of {len(batch_ids)} records for this run (starting at {batch_ids[0]}).")
+                continue
+            upserted_count += count
+            if on_batch_upserted:
+                on_batch_upserted(batch_upload_records)
+            if checkpoint:
+                checkpoint.write("".join(f"{record['id']} {record_content_hash(record, slim)}\n"
+                                         for record in batch_upload_records))
+                checkpoint.flush()
+
+    def run_batch(batch_upload_records):
         # Prepare for upsert format: list of tuples or Vector objects
         vectors_to_upsert = [
-            (record['id'], record['values'], record['metadata'])
+            (record['id'], _as_float_list(record['values']),
+             index_metadata(record['metadata']) if slim else record['metadata'])
             for record in batch_upload_records
         ]
+        start = time.perf_counter()
+        count = _upsert_batch_with_retry(index, vectors_to_upsert, namespace, throttle)
+        stats.add("upsert", time.perf_counter() - start, count or 0, errors=0 if count is not None else 1)
+        return batch_upload_records, count
 
-        print(f"  Uploading batch {i//BATCH_SIZE + 1}/{ceil(total_new_records/BATCH_SIZE)} ({len(vectors_to_upsert)} records)...")
-        try:
-            upsert_response = index.upsert(vectors=vectors_to_upsert, namespace=namespace)
-            upserted_count += upsert_response.upserted_count
-        except ApiException as e:
-            print(f"  ⚠️ Error upserting batch: {e}")
-        except Exception as e:
-            print(f"  ⚠️ An unexpected error occurred during upsert: {e}")
-        time.sleep(0.5) # Small delay between upsert batches
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            in_flight = set()
+            for batch_number, batch_upload_records in enumerate(iter_batches(new_records, BATCH_SIZE), start=1):
+                if len(in_flight) >= concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    handle_done(done)
+                total_new_records += len(batch_upload_records)
+                print(f"  Uploading batch {batch_number} ({len(batch_upload_records)} records, {total_new_records} so far)...")
+                if doc_store is not None:
+                    # Written before the upsert (from this thread only), so no vector is queryable without its text
+                    with stats.stage("doc_store", items=len(batch_upload_records)):
+                        doc_store.put_many(batch_upload_records)
+                in_flight.add(executor.submit(run_batch, batch_upload_records))
+            handle_done(wait(in_flight).done)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    if checkpoint_file and not failed_batches and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file) # Run completed; next run starts fresh
+
+    if not total_new_records:
+        print("\nNo new records to upload (all PMIDs found or input was empty).")
+        return 0
+
+    if report: stats.report()
 
     print("\n--- Upload Summary ---")
     print(f"Attempted to upload: {total_new_records} records")
     print(f"Successfully upserted count reported by Pinecone: {upserted_count}")
-    print(f"(Skipped {len(data_records) - total_new_records} records belonging to existing PMIDs)")
+    if failed_batches:
+        print(f"Failed batches: {failed_batches} (rerun the script to resume from {checkpoint_file})")
     print("----------------------")
+    return upserted_count
+
+def delete_stale_chunks(index, vector_ids, namespace=""):
+    """Deletes vectors by ID in batches. Returns the IDs whose delete request succeeded."""
+    deleted = []
+    for i in range(0, len(vector_ids), DELETE_BATCH_SIZE):
+        batch_ids = vector_ids[i:i + DELETE_BATCH_SIZE]
+        try:
+            index.delete(ids=batch_ids, namespace=namespace)
+            deleted.extend(batch_ids)
+        except Exception as e:
+            print(f"  ⚠️ Error deleting {len(batch_ids)} stale vectors: {e}")
+    return deleted
+
+def sync_with_ledger(index, data_records, ledger, namespace="", stats=None, doc_store=None, source=""):
+    """
+    Ledger-driven sync: upserts only records that are new or changed since they were last
+    upserted, then deletes the chunks of the input's PMIDs that the input no longer contains.
+    Returns (upserted_count, deleted_count).
+    """
+    report = stats is None
+    stats = stats or StageStats("ledger sync")
+    print(f"\n📒 Syncing against local ledger {ledger.path} ({ledger.count(namespace)} chunks recorded)...")
+    seen_ids_by_pmid = {}
+    slim = doc_store is not None
+    changed_records = ledger.filter_changed(data_records, namespace, seen_ids_by_pmid, slim=slim)
+    upserted = upsert_new_data(
+        index, changed_records, pmids_to_skip=set(), namespace=namespace,
+        on_batch_upserted=lambda records: ledger.record_upserted(records, namespace, slim=slim),
+        stats=stats, doc_store=doc_store, source=source,
+    )
+
+    stale_ids = ledger.stale_ids(seen_ids_by_pmid, namespace)
+    deleted = []
+    if stale_ids:
+        print(f"Deleting {len(stale_ids)} stale chunks no longer produced for their PMIDs...")
+        start = time.perf_counter()
+        deleted = delete_stale_chunks(index, stale_ids, namespace)
+        stats.add("delete", time.perf_counter() - start, len(deleted), errors=len(stale_ids) - len(deleted))
+        ledger.remove(deleted, namespace)
+        if doc_store is not None:
+            doc_store.delete(deleted)
+    print(f"Ledger sync done: {upserted} upserted, {len(deleted)} deleted.")
+    if report: stats.report()
+    return upserted, len(deleted)
+
+def invalidate_api_cache(api_url, token=None):
+    """Asks the serving API to drop its cached query results after the index changed."""
+    token = token or MIND_API_TOKEN
+    if not token:
+        print(f"  ⚠️ Not invalidating API result cache at {api_url}: CACHE_ADMIN_TOKEN is not set.")
+        return
+    try:
+        import requests
+        response = requests.post(f"{api_url.rstrip('/')}/cache/invalidate", json={}, timeout=10,
+                                 headers={"Authorization": f"Bearer {token}"})
+        response.raise_for_status()
+        print(f"Invalidated API result cache at {api_url}: {response.json()}")
+    except Exception as e:
+        print(f"  ⚠️ Could not invalidate API result cache at {api_url}: {e}")
 
 
 if __name__ == "__main__":
@@ -152,12 +391,20 @@ if __name__ == "__main__":
         exit(1)
 
     # --- Load Data ---
-    data = load_data_from_json(INPUT_JSON_FILE)
-    if data is None:
-        exit(1)
-    if not data:
-        print("Input JSON file contains no records. Exiting.")
-        exit(0)
+    streaming_input = INPUT_JSON_FILE.endswith(".jsonl") or INPUT_JSON_FILE.endswith(".vectors.npy")
+    if streaming_input:
+        # Two lazy passes over the file (PMID check, then upsert) instead of holding it in memory
+        if not os.path.exists(INPUT_JSON_FILE):
+            print(f"Error: Input file not found at {INPUT_JSON_FILE}")
+            exit(1)
+        data = None
+    else:
+        data = load_data_from_json(INPUT_JSON_FILE)
+        if data is None:
+            exit(1)
+        if not data:
+            print("Input JSON file contains no records. Exiting.")
+            exit(0)
 
     # --- Initialize Pinecone ---
     # --- Initialize Pinecone ---
@@ -195,10 +442,30 @@ if __name__ == "__main__":
         # The original TypeError likely happened before this point if it was during the check
         exit(1)
         
-    # --- Check Existing PMIDs ---
-    pmids_already_present = find_existing_pmids(index, data, namespace=PINECONE_NAMESPACE)
+    doc_store = DocStore(DOC_STORE_FILE) if DOC_STORE_FILE else None
+
+    if LEDGER_FILE:
+        # --- Sync Against Local Ledger (no remote checks) ---
+        ledger = IngestLedger(LEDGER_FILE)
+        records = iter_input_records(INPUT_JSON_FILE) if streaming_input else data
+        upserted, deleted = sync_with_ledger(index, records, ledger, namespace=PINECONE_NAMESPACE, doc_store=doc_store,
+                                             source=INPUT_JSON_FILE)
+        ledger.close()
+        changed = upserted or deleted
+    else:
+        # --- Check Existing PMIDs ---
+        records = iter_input_records(INPUT_JSON_FILE) if streaming_input else data
+        pmids_already_present = find_existing_pmids(index, records, namespace=PINECONE_NAMESPACE)
+
+        # --- Upsert New Data ---
+        records = iter_input_records(INPUT_JSON_FILE) if streaming_input else data
+        changed = upsert_new_data(index, records, pmids_already_present, namespace=PINECONE_NAMESPACE,
+                                  doc_store=doc_store, source=INPUT_JSON_FILE)
+
+    if doc_store is not None:
+        doc_store.close()
 
-    # --- Upsert New Data ---
-    upsert_new_data(index, data, pmids_already_present, namespace=PINECONE_NAMESPACE)
+    if changed and MIND_API_URL:
+        invalidate_api_cache(MIND_API_URL)
 
     print("\nScript finished.")
\ No newline at end of file
@@ -0,0 +1,114 @@
+# utils/pmc_extract.py
+import io
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from lxml import etree
+
+# Elements whose text is not prose we want to embed
+SKIP_TAGS = {"table", "disp-formula", "inline-formula", "tex-math", "graphic", "media", "object-id"}
+
+
+def _localname(element) -> str | None:
+    """Tag name without namespace; None for comments / processing instructions."""
+    tag = element.tag
+    if not isinstance(tag, str):
+        return None
+    return tag.rsplit("}", 1)[-1]
+
+def _clean(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+def _element_text(element) -> str:
+    """All text under an element, skipping SKIP_TAGS subtrees (their tails are kept)."""
+    parts = [element.text or ""]
+    for child in element:
+        if _localname(child) not in SKIP_TAGS:
+            parts.append(_element_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+def _collect_blocks(element, blocks: list[str]) -> None:
+    """
+    Single walk over the body: every <p> is emitted exactly once (with its nested content),
+    section titles are emitted as their own blocks before the section's paragraphs.
+    """
+    for child in element:
+        name = _localname(child)
+        if name is None or name in SKIP_TAGS:
+            continue
+        if name == "p":
+            text = _clean(_element_text(child))
+            if text: blocks.append(text)
+        elif name == "title":
+            if _localname(element) == "sec":
+                text = _clean(_element_text(child))
+                if text: blocks.append(text)
+        else:
+            # sec, list, fig, table-wrap, boxed-text, ...: recurse to reach their paragraphs
+            _collect_blocks(child, blocks)
+
+def extract_body_text(body) -> str | None:
+    """
+    Flattens a PMC <body> element (lxml) into text: one block per line, section titles on
+    their own line, each paragraph exactly once, whitespace normalized within blocks.
+    """
+    blocks = []
+    _collect_blocks(body, blocks)
+    return "\n".join(blocks) if blocks else None
+
+def _article_pmcid(article) -> str | None:
+    """The article's PMC ID without the 'PMC' prefix."""
+    for article_id in article.iter("{*}article-id"):
+        if article_id.get("pub-id-type") in ("pmc", "pmcid") and article_id.text:
+            pmcid = article_id.text.strip()
+            return pmcid[3:] if pmcid.upper().startswith("PMC") else pmcid
+    return None
+
+def iter_pmc_articles(xml: bytes | str):
+    """
+    Streams over an efetch response (one or many <article>s) and yields (pmcid, body text or None)
+    per article. Each article subtree is freed as soon as it has been processed.
+    """
+    if isinstance(xml, str):
+        xml = xml.encode("utf-8")
+    context = etree.iterparse(io.BytesIO(xml), events=("end",), tag="{*}article",
+                              huge_tree=True, resolve_entities=False, no_network=True)
+    for _, article in context:
+        # Only top-level articles (sub-articles such as peer reviews use a different tag)
+        body = None
+        for child in article:
+            if _localname(child) == "body":
+                body = child
+                break
+        yield _article_pmcid(article), extract_body_text(body) if body is not None else None
+        article.clear()
+        while article.getprevious() is not None:
+            del article.getparent()[0]
+
+def extract_first_body_text(xml: bytes | str) -> str | None:
+    """Body text of the first article in an efetch response (single-article fetches)."""
+    for _, text in iter_pmc_articles(xml):
+        return text
+    return None
+
+def split_pmc_articles(xml: bytes | str) -> dict:
+    """{pmcid (without 'PMC'): body text or None} for every article in an efetch response."""
+    return {pmcid: text for pmcid, text in iter_pmc_articles(xml) if pmcid}
+
+
+# === PROCESS POOL FOR BULK XML ===
+_process_pool = None
+
+def get_process_pool(processes: int) -> ProcessPoolExecutor:
+    """Shared pool for parsing bulk XML off the GIL (created on first use)."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=processes)
+    return _process_pool
+
+def split_pmc_articles_many(xml_documents: list, processes: int = 0) -> list[dict]:
+    """split_pmc_articles over many efetch responses, in parallel processes when processes > 1."""
+    if processes and processes > 1 and len(xml_documents) > 1:
+        return list(get_process_pool(processes).map(split_pmc_articles, xml_documents))
+    return [split_pmc_articles(xml) for xml in xml_documents]
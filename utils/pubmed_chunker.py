@@ -1,23 +1,67 @@
 import os
+import sys
 import time
+import queue
+import threading
 import pandas as pd
 from Bio import Entrez
-from bs4 import BeautifulSoup
 import openai
 import re
 import json
+import tiktoken
+
+# Allow running as a script (python utils/pubmed_chunker.py) as well as a module (python -m utils.pubmed_chunker)
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from utils.rate_limiter import OpenAIRateLimiter, TokenBucket
+from utils.pmc_extract import extract_first_body_text, split_pmc_articles, get_process_pool
+from utils.vector_format import VectorStoreWriter
+from utils.embedding_cache import SQLiteTier, VECTOR_TYPECODE, make_cache_key
+from utils.observability import StageStats
+from array import array
 
 # === CONFIG ===
 # Friday, April 11, 2025 at 7:03:19 PM CEST
 Entrez.email = "your@email.com"  # Replace with your email
+Entrez.api_key = os.getenv("NCBI_API_KEY") or None # Optional; raises NCBI's limit from 3 to 10 req/s
 openai.api_key = "" # Example key - Replace or use environment variables
+openai.max_retries = 0 # Retries are done by embedding_limiter (below), paced by the API's rate-limit headers
 
 CHUNK_SIZE = 2000
 CHUNK_OVERLAP = 200
-MAX_CHARS_PER_EMBED = 8000
-EMBED_MODEL = "text-embedding-3-large"
-EMBED_DIMENSIONS = 3072
+# "chars": fixed CHUNK_SIZE-character windows (chunk_text)
+# "tokens": sentence/paragraph-aligned chunks of at most CHUNK_TOKENS tokens (chunk_text_tokens)
+CHUNKING_MODE = "chars"
+CHUNK_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 50 # Trailing whole sentences repeated at the start of the next chunk
+EMBED_MODEL = config.EMBEDDING_MODEL
+EMBED_DIMENSIONS = config.EMBEDDING_DIMENSIONS # Shared with the query side (EMBEDDING_DIMENSIONS env var)
+# OpenAI embeddings limits: tokens per input, tokens summed over a request, inputs per request
+MAX_TOKENS_PER_INPUT = 8191
+MAX_TOKENS_PER_REQUEST = 300000
+MAX_INPUTS_PER_REQUEST = 2048
+EMBED_MAX_RETRIES = 4 # Retries per request (rate limits, 5xx, timeouts) before a sub-batch is split / given up
+EMBED_BACKOFF_CAP_SECONDS = 30 # Longest single wait after a rate limit or failure
+# Content-addressed embedding store keyed by sha256(text, model, dimensions): re-runs only embed
+# chunks whose exact text wasn't embedded before. "" disables it.
+# Maintenance: python -m utils.embedding_cache embedding_store.sqlite stats|evict <MB>|compact
+EMBEDDING_STORE_PATH = "embedding_store.sqlite"
+# Concurrent fetch stage: NCBI allows 3 requests/s per client, 10 with an API key
+NCBI_REQUESTS_PER_SECOND = 10 if Entrez.api_key else 3
+FETCH_WORKERS = 4
+FETCH_QUEUE_SIZE = 32 # Fetched articles waiting for chunking/embedding (bounds memory)
+FETCH_STOP_POLL_SECONDS = 0.1 # How often a worker blocked on the full queue checks whether the consumer stopped
+ELINK_BATCH_SIZE = 200 # PMIDs resolved per elink request
+EFETCH_BATCH_SIZE = 100 # PMC articles fetched per efetch request
+EXTRACT_PROCESSES = 0 # >1: parse bulk efetch XML in a process pool of this size
 OUTPUT_JSON = "pinecone_data_final_modules.json"
+OUTPUT_JSONL = "pinecone_data_final_modules.jsonl"
+OUTPUT_VECTOR_STORE = "pinecone_data_final_modules" # -> .vectors.npy + .meta.jsonl (see utils/vector_format.py)
+# "json": one in-memory list saved at the end (+ optional CSV)
+# "jsonl": each chunk streamed to OUTPUT_JSONL as it is embedded (constant memory)
+# "npy": each chunk streamed to the float32 binary store at OUTPUT_VECTOR_STORE (constant memory, compact)
+OUTPUT_FORMAT = "json"
 OUTPUT_CSV = "pinecone_data_final_modules.csv"
 
 # === TOY DATASET METADATA LOOKUP ===
@@ -122,7 +166,7 @@ def get_metadata_for_pmid(pmid, pmcid):
     return standardized_metadata
 
 
-# === CORE FUNCTIONS (fetch_pmcid_from_pmid, fetch_full_text_pmc, chunk_text, embed_text - unchanged) ===
+# === CORE FUNCTIONS (fetch_pmcid_from_pmid, fetch_full_text_pmc, chunk_text, embed_text) ===
 def fetch_pmcid_from_pmid(pmid):
     try:
         with Entrez.elink(dbfrom="pubmed", db="pmc", id=pmid, linkname="pubmed_pmc_refs") as handle:
@@ -136,15 +180,66 @@ def fetch_full_text_pmc(pmcid):
     try:
         with Entrez.efetch(db="pmc", id=pmcid, rettype="full", retmode="xml") as handle:
             xml = handle.read()
-        soup = BeautifulSoup(xml, "lxml-xml")
-        body = soup.find("body")
-        if body:
-            text_parts = [p.get_text() for p in body.find_all(['p', 'sec'])]
-            full_text = "\n".join(text_parts); full_text = re.sub(r'\s+', ' ', full_text).strip()
-            return full_text
-        else: return None
+        return extract_first_body_text(xml)
     except Exception as e: return None
 
+
+# === BULK E-UTILITIES (many IDs per request) ===
+def _normalize_pmcid(pmcid):
+    """'PMC1234567' and '1234567' refer to the same article."""
+    pmcid = str(pmcid).strip()
+    return pmcid[3:] if pmcid.upper().startswith("PMC") else pmcid
+
+def fetch_pmcids_bulk(pmids, batch_size=ELINK_BATCH_SIZE, limiter=None):
+    """
+    Resolves many PMIDs to PMCIDs with one elink call per batch. IDs are passed as a list
+    (one id= parameter each), so NCBI returns one LinkSet per PMID instead of merging them.
+    Returns {pmid: pmcid or None}. A failing batch falls back to one-by-one lookups.
+    """
+    pmids = [str(pmid) for pmid in pmids]
+    result = {pmid: None for pmid in pmids}
+    for start in range(0, len(pmids), batch_size):
+        batch = pmids[start:start + batch_size]
+        if limiter: limiter.acquire()
+        try:
+            with Entrez.elink(dbfrom="pubmed", db="pmc", id=batch, linkname="pubmed_pmc_refs") as handle:
+                records = Entrez.read(handle)
+            for linkset in records:
+                source_ids = linkset.get("IdList") or []
+                link_dbs = linkset.get("LinkSetDb") or []
+                if source_ids and link_dbs and link_dbs[0].get("Link"):
+                    result[str(source_ids[0])] = link_dbs[0]["Link"][0]["Id"]
+        except Exception as e:
+            print(f"  ⚠️ Bulk elink failed for {len(batch)} PMIDs ({e}), resolving one by one...")
+            for pmid in batch:
+                if limiter: limiter.acquire()
+                result[pmid] = fetch_pmcid_from_pmid(pmid)
+    return result
+
+def fetch_full_texts_pmc_bulk(pmcids, batch_size=EFETCH_BATCH_SIZE, limiter=None, extract_processes=EXTRACT_PROCESSES):
+    """
+    Fetches full text for many PMC articles with one efetch call per batch.
+    Returns {pmcid: text or None}, keyed by the PMCIDs exactly as given.
+    """
+    pmcids = [str(pmcid) for pmcid in pmcids]
+    result = {pmcid: None for pmcid in pmcids}
+    for start in range(0, len(pmcids), batch_size):
+        batch = pmcids[start:start + batch_size]
+        if limiter: limiter.acquire()
+        try:
+            with Entrez.efetch(db="pmc", id=",".join(batch), rettype="full", retmode="xml") as handle:
+                xml = handle.read()
+            if extract_processes and extract_processes > 1:
+                # Parse off the GIL so other fetch threads keep going
+                texts = get_process_pool(extract_processes).submit(split_pmc_articles, xml).result()
+            else:
+                texts = split_pmc_articles(xml)
+            for pmcid in batch:
+                result[pmcid] = texts.get(_normalize_pmcid(pmcid))
+        except Exception as e:
+            print(f"  ⚠️ Bulk efetch failed for {len(batch)} PMCIDs: {e}")
+    return result
+
 def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     chunks = []; start = 0; text_len = len(text)
     while start < text_len:
@@ -156,23 +251,343 @@ def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
         if start >= end: start = end
     return chunks
 
-def embed_text(text, model=EMBED_MODEL, dimensions=EMBED_DIMENSIONS):
+# Sentence ends (., !, ? followed by whitespace) and line breaks; the separator stays with the preceding segment
+SEGMENT_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+|\n\s*')
+WORD_RE = re.compile(r'\S+\s*')
+
+def _iter_segments(text):
+    """Yields (start, end) spans of sentences / paragraph lines covering the whole text, in one pass."""
+    start = 0
+    for match in SEGMENT_BOUNDARY_RE.finditer(text):
+        if match.end() > start:
+            yield start, match.end()
+            start = match.end()
+    if start < len(text): yield start, len(text)
+
+def _trimmed_span(text, start, end):
+    """Shrinks a span so it neither starts nor ends with whitespace."""
+    while start < end and text[start].isspace(): start += 1
+    while end > start and text[end - 1].isspace(): end -= 1
+    return start, end
+
+def chunk_text_tokens(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Token-budgeted chunking aligned to sentence and paragraph boundaries.
+    One pass over the text: each sentence is tokenized once, sentences are packed greedily
+    until the next one would exceed max_tokens, and the trailing sentences (up to
+    overlap_tokens) are carried into the next chunk. Sentences longer than max_tokens are
+    split at word boundaries. Returns (chunk, char_start, char_end) tuples like chunk_text,
+    with text[char_start:char_end] == chunk.
+    """
+    encoding = get_encoding()
+    segments = []
+    for start, end in _iter_segments(text):
+        n_tokens = len(encoding.encode(text[start:end], disallowed_special=()))
+        if n_tokens <= max_tokens:
+            segments.append((start, end, n_tokens))
+            continue
+        for word in WORD_RE.finditer(text, start, end): # Over-long sentence: fall back to words
+            segments.append((word.start(), word.end(), len(encoding.encode(word.group(), disallowed_special=()))))
+
+    chunks = []
+    window = [] # Segments of the chunk being built
+    window_tokens = 0
+    has_new_segments = False # False while the window only holds overlap from the previous chunk
+
+    def emit():
+        start, end = _trimmed_span(text, window[0][0], window[-1][1])
+        if end > start: chunks.append((text[start:end], start, end))
+
+    for segment in segments:
+        if has_new_segments and window_tokens + segment[2] > max_tokens:
+            emit()
+            # Keep whole trailing segments as overlap, as long as they fit with the next segment
+            keep_tokens = 0; keep_from = len(window)
+            while keep_from > 0:
+                n = window[keep_from - 1][2]
+                if keep_tokens + n > overlap_tokens or keep_tokens + n + segment[2] > max_tokens: break
+                keep_tokens += n; keep_from -= 1
+            window = window[keep_from:]; window_tokens = keep_tokens
+            has_new_segments = False
+        window.append(segment); window_tokens += segment[2]
+        has_new_segments = True
+
+    if window and has_new_segments: emit()
+    return chunks
+
+def chunk_article(text):
+    """Chunks an article's text with the configured CHUNKING_MODE."""
+    if CHUNKING_MODE == "tokens": return chunk_text_tokens(text)
+    return chunk_text(text)
+
+def embed_text(text, model=None, dimensions=None):
     if not text: return None
+    # Resolved per call so EMBED_MODEL / EMBED_DIMENSIONS can be changed at runtime (e.g. bench_ingest --dimension)
+    model = model or EMBED_MODEL; dimensions = dimensions or EMBED_DIMENSIONS
     try:
-        if len(text) > MAX_CHARS_PER_EMBED: text = text[:MAX_CHARS_PER_EMBED]
-        response = openai.embeddings.create(input=[text], model=model, dimensions=dimensions)
-        return response.data[0].embedding
-    except openai.RateLimitError:
-        print("Rate limit exceeded, sleeping..."); time.sleep(60); return embed_text(text, model, dimensions)
+        text, n_tokens = truncate_to_token_limit(text)
+        store = get_embedding_store()
+        key = make_cache_key(text, model, dimensions)
+        if store is not None:
+            stored = store.get(key)
+            if stored is not None: return stored.tolist()
+        response = embedding_limiter.call(
+            lambda: openai.embeddings.with_raw_response.create(input=[text], model=model, dimensions=dimensions), tokens=n_tokens)
+        embedding = response.data[0].embedding
+        if store is not None: store.put(key, array(VECTOR_TYPECODE, embedding))
+        return embedding
     except Exception as e: print(f"Embedding failed: {e}"); return None
 
 
-# === MAIN WORKFLOW (Unchanged logic, uses revised get_metadata_for_pmid) ===
-def process_pmids(pmids):
-    all_data_for_pinecone = []
+# === PERSISTENT EMBEDDING STORE ===
+_embedding_store = None
+
+def get_embedding_store():
+    """Returns the on-disk embedding store (opened once), or None if EMBEDDING_STORE_PATH is empty."""
+    global _embedding_store
+    if _embedding_store is None and EMBEDDING_STORE_PATH:
+        _embedding_store = SQLiteTier(EMBEDDING_STORE_PATH)
+    return _embedding_store
+
+
+# === TOKEN-AWARE BATCHED EMBEDDING ===
+# Paces the embedding requests to the account's limits, as reported by the API's x-ratelimit-*
+# headers, leaving OPENAI_SERVING_HEADROOM of them to the query API running on the same key.
+embedding_limiter = OpenAIRateLimiter(
+    requests_per_minute=config.OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=config.OPENAI_TOKENS_PER_MINUTE,
+    headroom=config.OPENAI_SERVING_HEADROOM,
+    max_retries=EMBED_MAX_RETRIES,
+    backoff_cap=EMBED_BACKOFF_CAP_SECONDS,
+)
+_encoding = None
+
+def get_encoding():
+    """Returns the tiktoken encoding of EMBED_MODEL (loaded once)."""
+    global _encoding
+    if _encoding is None:
+        try: _encoding = tiktoken.encoding_for_model(EMBED_MODEL)
+        except KeyError: _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+def truncate_to_token_limit(text, max_tokens=MAX_TOKENS_PER_INPUT):
+    """Returns (text, token_count), cutting the text at max_tokens tokens (with a warning) if needed."""
+    tokens = get_encoding().encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens: return text, len(tokens)
+    print(f"  ⚠️ Input of {len(tokens)} tokens truncated to {max_tokens} tokens for embedding.")
+    return get_encoding().decode(tokens[:max_tokens]), max_tokens
+
+def pack_embedding_batches(items, max_tokens=MAX_TOKENS_PER_REQUEST, max_inputs=MAX_INPUTS_PER_REQUEST):
+    """
+    Greedily packs (key, text, n_tokens) items into request-sized batches that stay under
+    both the per-request token limit and the per-request input limit. Order is preserved.
+    """
+    batches = []; current = []; current_tokens = 0
+    for item in items:
+        n_tokens = item[2]
+        if current and (current_tokens + n_tokens > max_tokens or len(current) >= max_inputs):
+            batches.append(current); current = []; current_tokens = 0
+        current.append(item); current_tokens += n_tokens
+    if current: batches.append(current)
+    return batches
+
+def _embed_batch_with_retry(batch, model, dimensions, results):
+    """
+    Embeds one packed batch through embedding_limiter, which paces it and retries rate limits and
+    transient errors with jittered backoff. If the batch is rejected or keeps failing it is split
+    in half and each half retried on its own, so only the failing inputs are lost. A batch still
+    rate limited after EMBED_MAX_RETRIES retries is given up whole (splitting won't restore quota).
+    """
+    try:
+        response = embedding_limiter.call(
+            lambda: openai.embeddings.with_raw_response.create(input=[text for _, text, _ in batch], model=model, dimensions=dimensions),
+            tokens=sum(n_tokens for _, _, n_tokens in batch))
+        for item in response.data:
+            results[batch[item.index][0]] = item.embedding
+        return
+    except openai.RateLimitError as e:
+        print(f"  ⚠️ Still rate limited after {EMBED_MAX_RETRIES} retries, giving up on a batch of {len(batch)} inputs: {e}")
+        return
+    except openai.BadRequestError as e:
+        print(f"  Embedding batch of {len(batch)} rejected: {e}") # Retrying the same payload won't help; isolate the bad input instead
+    except Exception as e:
+        print(f"  Embedding batch of {len(batch)} failed: {e}")
+
+    if len(batch) > 1:
+        middle = len(batch) // 2
+        _embed_batch_with_retry(batch[:middle], model, dimensions, results)
+        _embed_batch_with_retry(batch[middle:], model, dimensions, results)
+    else:
+        print(f"  ⚠️ Giving up on embedding input {batch[0][0]}.")
+
+def embed_texts_batched(items, model=None, dimensions=None):
+    """
+    Embeds many texts with as few requests as possible.
+    items: list of (key, text) pairs, e.g. key = (pmcid, chunk_id).
+    Returns {key: embedding}; keys whose embedding failed are missing from the result.
+    model / dimensions default to EMBED_MODEL / EMBED_DIMENSIONS at call time.
+    """
+    prepared = []
+    for key, text in items:
+        if not text: continue
+        text, n_tokens = truncate_to_token_limit(text)
+        prepared.append((key, text, n_tokens))
+    return embed_prepared_batched(prepared, model, dimensions)
+
+def embed_prepared_batched(prepared, model=None, dimensions=None):
+    """
+    Same as embed_texts_batched for (key, text, n_tokens) items whose tokens were already counted.
+    Texts already in the embedding store are served from it; only the misses are sent to OpenAI.
+    """
+    model = model or EMBED_MODEL; dimensions = dimensions or EMBED_DIMENSIONS
+    results = {}
+    store = get_embedding_store()
+    if store is not None:
+        store_keys = {key: make_cache_key(text, model, dimensions) for key, text, _ in prepared}
+        stored = store.get_many(list(set(store_keys.values())))
+        misses = []
+        for item in prepared:
+            vector = stored.get(store_keys[item[0]])
+            if vector is not None: results[item[0]] = vector.tolist()
+            else: misses.append(item)
+    else:
+        misses = prepared
+
+    embedded = {}
+    for batch in pack_embedding_batches(misses):
+        _embed_batch_with_retry(batch, model, dimensions, embedded)
+    if store is not None and embedded:
+        store.put_many([(store_keys[key], array(VECTOR_TYPECODE, embedding)) for key, embedding in embedded.items()])
+    if store is not None:
+        print(f"  Embedding store: {len(prepared) - len(misses)} reused, {len(embedded)} newly embedded.")
+    limiter_stats = embedding_limiter.stats()
+    if limiter_stats["throttled"] or limiter_stats["retries"]:
+        print(f"  OpenAI rate limiter: {limiter_stats}")
+    results.update(embedded)
+    return results
+
+
+# === EMBEDDING STAGE ===
+def _embed_pending_chunks(pending, output, stats=None):
+    """Embeds the queued chunks in packed batches and appends the resulting records to output (in order)."""
+    if not pending: return
+    stats = stats or StageStats()
+    with stats.stage("embed", items=len(pending)):
+        embeddings = embed_prepared_batched([((c["pmcid"], c["chunk_id"]), c["embed_text"], c["n_tokens"]) for c in pending])
+    write_start = time.perf_counter(); written = 0
+    for c in pending:
+        embedding = embeddings.get((c["pmcid"], c["chunk_id"]))
+        if not embedding: continue
+        base_metadata = c["base_metadata"]
+        pinecone_id = f"{base_metadata.get('module', DEFAULT_MODULE)}_{c['pmcid']}_{c['chunk_id']}"
+        chunk_data = {
+            "id": pinecone_id, "values": embedding,
+            "metadata": { **base_metadata, # Merges the new base metadata
+                          "text": c["text"], "pmid": str(c["pmid"]),
+                          "pmcid": str(c["pmcid"]), "chunk_id": c["chunk_id"],
+                          "char_start": c["start"], "char_end": c["end"], }
+        }
+        output.append(chunk_data); written += 1
+    stats.add("write", time.perf_counter() - write_start, written)
+    print(f"  Embedded {len(embeddings)}/{len(pending)} queued chunks.")
+
+# === CONCURRENT FETCH STAGE ===
+class _FetchDone:
+    """Put on the output queue by a fetch worker when it stops; carries the exception that stopped it, if any."""
+    def __init__(self, error=None): self.error = error
+
+def _put_unless_stopped(output_queue, item, stop):
+    """Puts item on the bounded queue, giving up (False) once `stop` is set, e.g. after the consumer went away."""
+    while not stop.is_set():
+        try:
+            output_queue.put(item, timeout=FETCH_STOP_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _fetch_worker(work_queue, output_queue, limiter, stats, stop):
+    """Fetches batches of PMC articles with one efetch each, respecting the shared NCBI rate limit."""
+    error = None
+    try:
+        while not stop.is_set():
+            try: batch = work_queue.get_nowait()
+            except queue.Empty: break
+            with stats.stage("efetch", items=len(batch)):
+                texts = fetch_full_texts_pmc_bulk([pmcid for _, _, pmcid in batch], batch_size=len(batch), limiter=limiter)
+            for i, pmid, pmcid in batch:
+                # Blocks while the consumer is behind
+                if not _put_unless_stopped(output_queue, (i, pmid, pmcid, texts.get(str(pmcid))), stop): return
+    except Exception as e:
+        error = e
+    finally:
+        _put_unless_stopped(output_queue, _FetchDone(error), stop) # Or the consumer would wait for this worker forever
+
+def iter_fetched_articles(pmids, workers=FETCH_WORKERS, queue_size=FETCH_QUEUE_SIZE, limiter=None,
+                          efetch_batch_size=EFETCH_BATCH_SIZE, stats=None):
+    """
+    Fetches articles and yields (index, pmid, pmcid, text) as they arrive.
+    PMIDs are first resolved to PMCIDs in bulk; the PMC full texts are then fetched in
+    multi-article efetch batches on a pool of threads. All requests share one token-bucket
+    limiter (NCBI's per-client rate, no burst above it), and results pass through a bounded
+    queue so fetching overlaps with whatever the caller does with each article.
+    If the caller stops early (break, exception) or a worker fails, the workers stop too.
+    Per-stage timings (elink / efetch) are added to `stats` (a StageStats) if given.
+    """
+    limiter = limiter or TokenBucket(rate=NCBI_REQUESTS_PER_SECOND, capacity=1)
+    stats = stats or StageStats()
+    with stats.stage("elink", items=len(pmids)):
+        pmcid_by_pmid = fetch_pmcids_bulk(pmids, limiter=limiter)
+
+    to_fetch = []
     for i, pmid in enumerate(pmids):
-        print(f"\n🔍 Processing PMID {pmid} ({i+1}/{len(pmids)})")
-        pmcid = fetch_pmcid_from_pmid(pmid)
+        pmcid = pmcid_by_pmid.get(str(pmid))
+        if pmcid: to_fetch.append((i, pmid, pmcid))
+        else: yield (i, pmid, None, None)
+    if not to_fetch: return
+
+    work_queue = queue.Queue()
+    for start in range(0, len(to_fetch), efetch_batch_size):
+        work_queue.put(to_fetch[start:start + efetch_batch_size])
+    output_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    workers = max(1, min(workers, work_queue.qsize()))
+    threads = [threading.Thread(target=_fetch_worker, args=(work_queue, output_queue, limiter, stats, stop), daemon=True)
+               for _ in range(workers)]
+    for thread in threads: thread.start()
+
+    try:
+        finished = 0
+        while finished < workers:
+            item = output_queue.get()
+            if isinstance(item, _FetchDone):
+                finished += 1
+                if item.error is not None: raise item.error # The finally stops the other workers
+                continue
+            yield item
+    finally:
+        # Runs on completion, on an error and when the generator is closed early (break / garbage collection)
+        stop.set()
+
+
+# === MAIN WORKFLOW (Unchanged logic, uses revised get_metadata_for_pmid) ===
+def process_pmids(pmids, embed_batch_tokens=MAX_TOKENS_PER_REQUEST, fetch_workers=FETCH_WORKERS, output=None, stats=None):
+    """
+    Fetches, chunks and embeds each PMID. Articles are fetched concurrently (rate-limited) and
+    handed over through a bounded queue, so fetching overlaps with chunking/embedding.
+    Chunks are queued across articles and embedded in token-packed batches
+    (one request per ~embed_batch_tokens tokens instead of one per chunk).
+    Records are appended to `output` (a list by default, or a JsonlWriter / VectorStoreWriter to
+    stream them to disk), which is returned.
+    Prints per-stage throughput at the end (pass a StageStats as `stats` to collect it instead).
+    """
+    report = stats is None
+    stats = stats or StageStats("pubmed_chunker")
+    all_data_for_pinecone = output if output is not None else []
+    pending = []; pending_tokens = 0
+    for n, (i, pmid, pmcid, text) in enumerate(iter_fetched_articles(pmids, workers=fetch_workers, stats=stats)):
+        print(f"\n🔍 Processing PMID {pmid} ({n+1}/{len(pmids)})")
         if not pmcid: print(f" PMID {pmid}: No PMCID. ", end="")
 
         # --- Get Standardized Metadata (Now excludes difficulty/audience/curated) ---
@@ -180,43 +595,74 @@ def process_pmids(pmids):
 
         if not pmcid: print("Skipping text processing."); continue
 
-        print(f" PMCID {pmcid}: Fetching text... ", end="")
-        text = fetch_full_text_pmc(pmcid)
-        if not text: print("Failed. Skipping text processing."); continue
+        print(f" PMCID {pmcid}: ", end="")
+        if not text: print("Failed to fetch text. Skipping text processing."); continue
         print(f"{len(text)} chars. Chunking... ", end="")
 
-        chunks = chunk_text(text)
-        print(f"{len(chunks)} chunks. Embedding... ", end="")
+        chunk_start = time.perf_counter()
+        chunks = chunk_article(text)
+        print(f"{len(chunks)} chunks queued for embedding.")
 
-        embedded_count = 0
         for j, (chunk_text_content, start, end) in enumerate(chunks):
-            embedding = embed_text(chunk_text_content)
-            if not embedding: continue
-            embedded_count += 1
-
-            pinecone_id = f"{base_metadata.get('module', DEFAULT_MODULE)}_{pmcid}_{j}"
-
-            chunk_data = {
-                "id": pinecone_id, "values": embedding,
-                "metadata": { **base_metadata, # Merges the new base metadata
-                              "text": chunk_text_content, "pmid": str(pmid),
-                              "pmcid": str(pmcid), "chunk_id": j,
-                              "char_start": start, "char_end": end, }
-            }
-            all_data_for_pinecone.append(chunk_data)
-
-        print(f"Embedded {embedded_count}/{len(chunks)} chunks.")
-        time.sleep(0.4)
-
+            embed_input, n_tokens = truncate_to_token_limit(chunk_text_content)
+            pending.append({"pmid": pmid, "pmcid": pmcid, "chunk_id": j, "text": chunk_text_content,
+                            "embed_text": embed_input, "n_tokens": n_tokens,
+                            "start": start, "end": end, "base_metadata": base_metadata})
+            pending_tokens += n_tokens
+        stats.add("chunk", time.perf_counter() - chunk_start, len(chunks))
+
+        if pending_tokens >= embed_batch_tokens:
+            _embed_pending_chunks(pending, all_data_for_pinecone, stats)
+            pending = []; pending_tokens = 0
+
+    _embed_pending_chunks(pending, all_data_for_pinecone, stats)
+    if report: stats.report()
     return all_data_for_pinecone
 
-# === SAVE FUNCTION ===
+# === SAVE FUNCTIONS ===
 def save_data(data, filename):
     try:
         with open(filename, 'w') as f: json.dump(data, f, indent=4)
         print(f"✅ Standardized data saved to {filename}")
     except Exception as e: print(f"Error saving data to {filename}: {e}")
 
+class JsonlWriter:
+    """
+    Streams records to a JSON Lines file as they are produced (one compact record per line),
+    so no run has to hold every embedding in memory. Pass it as `output` to process_pmids
+    (utils.vector_format.VectorStoreWriter does the same in the compact binary format).
+    Writes to a temp file that replaces `filename` on close, so readers never see a partial run;
+    if the `with` block raises, the temp file is discarded and the previous file is kept.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._tmp_filename = f"{filename}.tmp"
+        self._file = open(self._tmp_filename, 'w')
+        self.count = 0
+
+    def append(self, record):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.count += 1
+
+    def __len__(self): return self.count
+
+    def close(self):
+        if self._file.closed: return
+        self._file.close()
+        os.replace(self._tmp_filename, self.filename)
+        print(f"✅ Streamed {self.count} records to {self.filename}")
+
+    def discard(self):
+        """Drops the partial output and keeps whatever `filename` held before."""
+        if self._file.closed: return
+        self._file.close()
+        os.remove(self._tmp_filename)
+
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None: self.discard()
+        else: self.close()
+
 # === RUN SCRIPT ===
 if __name__ == "__main__":
     # Ensure the PMIDs here correspond to categories in your updated TOY_METADATA_LOOKUP
@@ -224,6 +670,15 @@ if __name__ == "__main__":
     pmids_to_process.extend(["12345678", "98765432"]) # Example unknown PMIDs
 
     print("Starting standardization and processing script with updated modules...")
+    if OUTPUT_FORMAT in ("jsonl", "npy"):
+        # Records go straight to disk as they are embedded (the CSV export below needs them in memory)
+        writer = JsonlWriter(OUTPUT_JSONL) if OUTPUT_FORMAT == "jsonl" else VectorStoreWriter(OUTPUT_VECTOR_STORE)
+        with writer:
+            process_pmids(pmids_to_process, output=writer)
+        if not writer.count: print("No data was generated.")
+        print("Script finished.")
+        sys.exit(0)
+
     structured_data = process_pmids(pmids_to_process)
 
     if structured_data:
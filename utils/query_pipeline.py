@@ -0,0 +1,160 @@
+# utils/query_pipeline.py
+"""
+The /rag/query pipeline shared by the Flask (app.py) and ASGI (asgi.py) apps: request
+validation, the lexical fast path, embedding + retrieval (single namespace or shard fan-out,
+optionally fused with BM25), request coalescing, response shaping and error mapping.
+run_query / run_query_async differ only in how they await the embedding and the index;
+the apps keep the HTTP I/O (reading the body, encoding the response).
+"""
+import openai
+
+import config
+from utils.embedder import generate_embedding, generate_embedding_async
+from utils.embedding_cache import normalize_text
+from utils.result_shaping import QueryOptions, parse_query_options, shape_results
+from utils.retriever import (fuse_with_lexical, lexical_fast_path, normalize_module_filter, normalize_namespaces,
+                             query_pinecone, query_pinecone_async, query_shards, query_shards_async)
+from utils.observability import get_logger, span
+
+logger = get_logger(__name__)
+
+
+class QueryError(Exception):
+    """A /rag/query failure with a client-facing message and its HTTP status."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class RagQuery:
+    """A validated /rag/query request."""
+
+    def __init__(self, text: str, module_filter: str | tuple | None, namespaces: tuple | None, options: QueryOptions):
+        self.text = text
+        self.module_filter = module_filter
+        self.namespaces = namespaces
+        self.options = options
+
+    @property
+    def flight_key(self) -> tuple:
+        """Identical queries in flight at the same time share one embedding + retrieval."""
+        return normalize_text(self.text), self.module_filter, self.namespaces, self.options.fetch_k
+
+
+class QueryResult:
+    """Unshaped results of a query, how they were retrieved and, for namespace fan-outs, the shard timings."""
+
+    def __init__(self, results: list[dict], retrieval: str, shards: list[dict] | None = None):
+        self.results = results
+        self.retrieval = retrieval
+        self.shards = shards
+
+
+def parse_rag_query(data) -> RagQuery:
+    """
+    {"text": ..., "module": "..." or [...], "namespaces": [...]} plus the result options of
+    utils/result_shaping.py. Raises QueryError (400) for an invalid body.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("text"), str) or not data["text"].strip():
+        raise QueryError("Missing or empty 'text' field in JSON request")
+    try:
+        query = RagQuery(data["text"], normalize_module_filter(data.get("module")),
+                         normalize_namespaces(data.get("namespaces")), parse_query_options(data))
+    except ValueError as e:
+        raise QueryError(str(e)) from e
+    logger.info("Received query: '%s...' | Module Filter: %s | Namespaces: %s",
+                query.text[:100], query.module_filter, query.namespaces)
+    return query
+
+def _query_lexical_index(query: RagQuery, lexical_index):
+    # The lexical index only covers the default namespace, so namespace fan-outs skip it
+    return lexical_index if query.namespaces is None else None
+
+def _lexical_result(query: RagQuery, lexical_index) -> QueryResult | None:
+    """Identifier-like queries (PMID, tool name, exact tag) are answered by the lexical index without embedding."""
+    with span("lexical", logger):
+        results = lexical_fast_path(lexical_index, query.text, query.module_filter, query.options.fetch_k)
+    if results is None:
+        return None
+    logger.debug("Answered from the lexical index (%d results).", len(results))
+    return QueryResult(results, "lexical")
+
+def _vector_result(query: RagQuery, retrieved, lexical_index) -> QueryResult:
+    if retrieved is None:
+        raise QueryError("Failed to generate query embedding", status=500)
+    results, shards = retrieved
+    logger.debug("Retrieved %d results.", len(results))
+    retrieval = "hybrid" if lexical_index is not None and config.HYBRID_FUSION_ENABLED else "vector"
+    return QueryResult(results, retrieval, shards)
+
+
+def run_query(query: RagQuery, index, lexical_index=None, result_cache=None, doc_store=None,
+              embedding_batcher=None, query_flights=None, executor=None) -> QueryResult:
+    """Runs a query on the calling thread (namespace fan-outs on `executor`)."""
+    lexical_index = _query_lexical_index(query, lexical_index)
+    lexical = _lexical_result(query, lexical_index)
+    if lexical is not None:
+        return lexical
+
+    def retrieve():
+        with span("embedding", logger):
+            query_vector = generate_embedding(query.text, batcher=embedding_batcher)
+        if not query_vector:
+            return None
+        with span("retrieval", logger):
+            if query.namespaces is not None:
+                return query_shards(index=index, query_vector=query_vector, namespaces=query.namespaces,
+                                    module_filter=query.module_filter, result_cache=result_cache,
+                                    top_k=query.options.fetch_k, doc_store=doc_store, executor=executor)
+            results = query_pinecone(index=index, query_vector=query_vector, module_filter=query.module_filter,
+                                     result_cache=result_cache, top_k=query.options.fetch_k, doc_store=doc_store)
+            return fuse_with_lexical(results, lexical_index, query.text, query.module_filter, query.options.fetch_k), None
+
+    retrieved = query_flights.do(query.flight_key, retrieve) if query_flights is not None else retrieve()
+    return _vector_result(query, retrieved, lexical_index)
+
+async def run_query_async(query: RagQuery, index, lexical_index=None, result_cache=None, doc_store=None,
+                          embedding_batcher=None, query_flights=None) -> QueryResult:
+    """run_query on the event loop: the embedding and the index queries (fan-outs concurrently) are awaited."""
+    lexical_index = _query_lexical_index(query, lexical_index)
+    lexical = _lexical_result(query, lexical_index)
+    if lexical is not None:
+        return lexical
+
+    async def retrieve():
+        with span("embedding", logger):
+            query_vector = await generate_embedding_async(query.text, batcher=embedding_batcher)
+        if not query_vector:
+            return None
+        with span("retrieval", logger):
+            if query.namespaces is not None:
+                return await query_shards_async(index=index, query_vector=query_vector, namespaces=query.namespaces,
+                                                module_filter=query.module_filter, result_cache=result_cache,
+                                                top_k=query.options.fetch_k, doc_store=doc_store)
+            results = await query_pinecone_async(index=index, query_vector=query_vector, module_filter=query.module_filter,
+                                                 result_cache=result_cache, top_k=query.options.fetch_k, doc_store=doc_store)
+            return fuse_with_lexical(results, lexical_index, query.text, query.module_filter, query.options.fetch_k), None
+
+    retrieved = await (query_flights.do(query.flight_key, retrieve) if query_flights is not None else retrieve())
+    return _vector_result(query, retrieved, lexical_index)
+
+
+def query_payload(query: RagQuery, result: QueryResult) -> dict:
+    """The /rag/query response body: shaped results, the retrieval mode and the shard timings of a fan-out."""
+    payload = {"results": shape_results(result.results, query.options, query.text), "retrieval": result.retrieval}
+    if result.shards is not None:
+        payload["shards"] = result.shards
+    return payload
+
+def error_payload(error: Exception) -> tuple[dict, int]:
+    """Maps an exception raised by parse_rag_query / run_query to a (JSON body, HTTP status) pair."""
+    if isinstance(error, QueryError):
+        return {"error": error.message}, error.status
+    if isinstance(error, openai.APIError):
+        logger.error("OpenAI API Error: %s", error)
+        return {"error": f"OpenAI API Error: {error}"}, 500
+    # Includes Pinecone errors
+    logger.error("Unexpected error processing query: %s", error, exc_info=error)
+    return {"error": "An internal server error occurred"}, 500
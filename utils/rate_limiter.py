@@ -0,0 +1,282 @@
+# utils/rate_limiter.py
+import asyncio
+import random
+import re
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to `capacity`.
+    acquire() reserves tokens immediately (the balance may go negative) and sleeps outside
+    the lock until the reservation is covered, so concurrent callers are served in order
+    without busy-waiting.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Reserves `tokens` without blocking. Returns the seconds to wait before using them."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Blocks until `tokens` are available. Returns the time spent waiting, in seconds."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Takes `tokens` if they are available right now; never blocks."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def update(self, rate: float | None = None, available: float | None = None) -> None:
+        """
+        Adjusts the bucket to what the server reports: a new refill rate (capacity follows it,
+        one minute's worth at most) and/or an upper bound on the current balance. The balance is
+        only ever lowered, since requests still in flight are not reflected in the server's count.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if rate is not None and rate > 0:
+                self.capacity = max(1.0, self.capacity * rate / self.rate)
+                self.rate = rate
+            if available is not None:
+                self._tokens = min(self._tokens, self.capacity, available)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter: a random delay in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for HTTP 429 errors from the OpenAI or Pinecone clients."""
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+def is_retryable_error(error: Exception) -> bool:
+    """Rate limits, server errors (5xx), timeouts and connection errors: worth retrying as-is."""
+    if is_rate_limit_error(error):
+        return True
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # OpenAI (httpx) and Pinecone (urllib3) transport errors, matched by name to avoid importing either
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout",
+                                    "MaxRetryError", "NewConnectionError", "ProtocolError", "ReadTimeoutError")
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_duration(value: str | None) -> float | None:
+    """Seconds in an OpenAI reset header ("1s", "6m0s", "20ms", "0.5s"; a bare number is seconds)."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+def _header_float(headers, name: str) -> float | None:
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveThrottle:
+    """
+    Shared pacing delay for concurrent workers, driven by errors instead of fixed sleeps.
+    Starts at zero; every failure (e.g. a 429) doubles the delay up to max_delay, and every
+    success shrinks it again, so throughput settles just under what the server accepts.
+    """
+
+    def __init__(self, initial_delay: float = 0.0, min_step: float = 0.1, max_delay: float = 30.0,
+                 increase_factor: float = 2.0, decrease_factor: float = 0.8):
+        self.delay = initial_delay
+        self.min_step = min_step
+        self.max_delay = max_delay
+        self.increase_factor = increase_factor
+        self.decrease_factor = decrease_factor
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            delay = self.delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def success(self) -> None:
+        with self._lock:
+            self.delay *= self.decrease_factor
+            if self.delay < self.min_step / 10:
+                self.delay = 0.0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.delay = min(self.max_delay, max(self.min_step, self.delay * self.increase_factor))
+
+
+class OpenAIRateLimiter:
+    """
+    Client-side pacing for the OpenAI API: a requests-per-minute and a tokens-per-minute
+    TokenBucket, corrected after every response from its x-ratelimit-* headers (limits,
+    remaining quota, time to reset), so all processes sharing the key stay under the limit.
+
+    headroom keeps that fraction of both limits unused by this limiter, e.g. 0.2 for ingestion
+    so the serving path (its own limiter with headroom 0) always finds quota left.
+
+    call() / call_async() wrap one request made with `.with_raw_response` (for the headers):
+    they reserve the request's budget once and wait for the buckets, then retry rate limits,
+    5xx and connection errors at most max_retries times with jittered exponential backoff
+    (at least the server's retry-after). Retries don't reserve budget again.
+    A 429 pauses every caller of the limiter, not only the one that received it.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, headroom: float = 0.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_cap: float = 30.0):
+        if not 0 <= headroom < 1:
+            raise ValueError("headroom must be in [0, 1)")
+        self.headroom = headroom
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.requests = TokenBucket(rate=requests_per_minute * (1 - headroom) / 60, capacity=requests_per_minute * (1 - headroom))
+        self.tokens = TokenBucket(rate=tokens_per_minute * (1 - headroom) / 60, capacity=tokens_per_minute * (1 - headroom))
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "throttled": 0, "wait_seconds": 0.0, "rate_limited": 0, "retries": 0, "failures": 0}
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def reserve(self, tokens: int) -> float:
+        """Reserves one request and `tokens` tokens; returns the seconds to wait before sending."""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(max(1, tokens)),
+                   self._paused_until - time.monotonic())
+        self._count("requests")
+        if wait > 0:
+            self._count("throttled")
+            self._count("wait_seconds", wait)
+        return max(0.0, wait)
+
+    def _pause_remaining(self) -> float:
+        """Seconds left of the pause set by the last rate-limit error (shared by all callers)."""
+        return max(0.0, self._paused_until - time.monotonic())
+
+    def update(self, headers) -> None:
+        """Syncs both buckets with the x-ratelimit-* headers of a response (missing headers are ignored)."""
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = _header_float(headers, f"x-ratelimit-limit-{kind}")
+            remaining = _header_float(headers, f"x-ratelimit-remaining-{kind}")
+            rate = limit * (1 - self.headroom) / 60 if limit else None
+            available = remaining - limit * self.headroom if remaining is not None and limit else remaining
+            bucket.update(rate=rate, available=available)
+
+    def backoff(self, attempt: int, error: Exception | None = None) -> float:
+        """
+        Delay before retry number `attempt`: jittered exponential backoff, but never less than
+        the server's retry-after. A rate-limit error also pauses all callers for that long.
+        """
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+        if error is not None and is_rate_limit_error(error):
+            self._count("rate_limited")
+            headers = getattr(getattr(error, "response", None), "headers", None) or {}
+            retry_after = _header_float(headers, "retry-after-ms")
+            retry_after = retry_after / 1000 if retry_after is not None else _header_float(headers, "retry-after")
+            if retry_after is None:
+                retry_after = max(parse_duration(headers.get("x-ratelimit-reset-requests")) or 0.0,
+                                  parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0.0) or None
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.backoff_cap))
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self.update(headers)
+        return delay
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries or not is_retryable_error(error):
+            self._count("failures")
+            return False
+        self._count("retries")
+        return True
+
+    def call(self, request, tokens: int):
+        """Runs request() (returning a raw response) under the limits; returns the parsed response."""
+        wait = self.reserve(tokens) # Once per logical request: retries don't draw from the budget again
+        for attempt in range(self.max_retries + 1):
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                raw = request()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                wait = max(self.backoff(attempt, e), self._pause_remaining())
+                continue
+            self.update(raw.headers)
+            return raw.parse()
+
+    async def call_async(self, request, tokens: int):
+        """Async version of call(): request is a coroutine function; waits with asyncio.sleep."""
+        wait = self.reserve(tokens)
+        for attempt in range(self.max_retries + 1):
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                raw = await request()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                wait = max(self.backoff(attempt, e), self._pause_remaining())
+                continue
+            self.update(raw.headers)
+            return raw.parse()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        stats["requests_per_minute"] = round(self.requests.rate * 60)
+        stats["tokens_per_minute"] = round(self.tokens.rate * 60)
+        stats["requests_available"] = round(self.requests.available)
+        stats["tokens_available"] = round(self.tokens.available)
+        return stats
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for pacing when no tokenizer is at hand."""
+    return max(1, len(text) // 4)
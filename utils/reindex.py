@@ -0,0 +1,123 @@
+# utils/reindex.py
+"""
+Re-indexes the chunk records at a reduced embedding dimension (text-embedding-3 models
+support shortened vectors), into a new local vector store and optionally a new Pinecone
+index / namespace, so the API can be switched over by configuration.
+
+Modes:
+  truncate  keep the first D components of the existing vectors and L2-renormalize them.
+            No API calls: for text-embedding-3 this is how OpenAI shortens vectors for
+            dimensions=D, so the result matches new query embeddings (up to float rounding).
+  reembed   embed the chunk text again with dimensions=D (pubmed_chunker's token-packed
+            batches and embedding store). Use it for sources not embedded with text-embedding-3.
+
+Usage (from the repository root):
+  python -m utils.reindex <source.json|.jsonl|.vectors.npy> --dimensions 1024
+      [--mode truncate|reembed] [--output base_path] [--index name] [--namespace ns]
+      [--create-index] [--cloud aws] [--region us-east-1]
+
+Then point the API at the result: EMBEDDING_DIMENSIONS=1024 plus INDEX_NAME / PINECONE_NAMESPACE
+(Pinecone) or LOCAL_INDEX_PATH (RETRIEVER_BACKEND=local), and re-run pubmed_chunker with the
+same EMBEDDING_DIMENSIONS for new articles.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+from pinecone import Pinecone, ServerlessSpec
+
+# Allow running as a script (python utils/reindex.py) as well as a module (python -m utils.reindex)
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from utils.pincone_update import iter_batches, upsert_new_data
+from utils.vector_format import VectorStoreWriter, iter_json_records, iter_vector_store_records, store_base_path
+
+REINDEX_BATCH_SIZE = 1000 # Records truncated / re-embedded at a time
+
+
+def truncate_vectors(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """First `dimensions` components of each row, L2-renormalized (float32)."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if vectors.shape[1] < dimensions:
+        raise ValueError(f"Cannot shorten {vectors.shape[1]}-dim vectors to {dimensions} dimensions.")
+    reduced = np.array(vectors[:, :dimensions], dtype=np.float32)
+    norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return reduced / norms
+
+def iter_source_records(path: str):
+    """Records from a pubmed_chunker JSON/JSONL file or a binary vector store."""
+    if path.endswith(".json") or path.endswith(".jsonl"):
+        return iter_json_records(path)
+    return iter_vector_store_records(store_base_path(path))
+
+def iter_reindexed_records(records, dimensions: int, mode: str = "truncate", batch_size: int = REINDEX_BATCH_SIZE):
+    """Yields the records with `dimensions`-dim vectors (same ids and metadata), batch by batch."""
+    for batch in iter_batches(records, batch_size):
+        if mode == "truncate":
+            vectors = truncate_vectors(np.vstack([np.asarray(r["values"], dtype=np.float32) for r in batch]), dimensions)
+        else:
+            from utils import pubmed_chunker # Imported lazily: only re-embedding needs tiktoken / OpenAI
+            embedded = pubmed_chunker.embed_texts_batched(
+                [(r["id"], r.get("metadata", {}).get("text", "")) for r in batch], dimensions=dimensions)
+            vectors = [embedded.get(r["id"]) for r in batch]
+        for record, vector in zip(batch, vectors):
+            if vector is None:
+                print(f"  ⚠️ Skipping {record['id']}: no embedding.")
+                continue
+            yield {"id": record["id"], "values": np.asarray(vector, dtype=np.float32), "metadata": record.get("metadata") or {}}
+
+def connect_target_index(index_name: str, dimensions: int, create: bool = False, cloud: str = "aws",
+                         region: str = "us-east-1"):
+    """The target Pinecone index, created (cosine, serverless) if missing and `create` is set."""
+    pc = Pinecone(api_key=config.PINECONE_API_KEY)
+    index_names = [index_info.name for index_info in pc.list_indexes().indexes]
+    if index_name not in index_names:
+        if not create:
+            raise ValueError(f"Index '{index_name}' does not exist (pass --create-index to create it).")
+        print(f"Creating index '{index_name}' ({dimensions} dims, cosine, {cloud}/{region})...")
+        pc.create_index(index_name, dimension=dimensions, metric="cosine", spec=ServerlessSpec(cloud=cloud, region=region))
+    else:
+        existing = pc.describe_index(index_name).dimension
+        if existing != dimensions:
+            raise ValueError(f"Index '{index_name}' has dimension {existing}, not {dimensions}.")
+    return pc.Index(index_name)
+
+def reindex(source: str, dimensions: int, output: str, mode: str = "truncate", index=None, namespace: str = "") -> int:
+    """
+    Writes the re-dimensioned records to the vector store at `output`, then (if a Pinecone
+    index is given) streams that store into it. Returns the number of records written.
+    """
+    with VectorStoreWriter(output) as writer:
+        for record in iter_reindexed_records(iter_source_records(source), dimensions, mode):
+            writer.append(record)
+    print(f"Re-indexed {writer.count} records to {dimensions} dims ({mode}) -> {output}")
+
+    if index is not None:
+        upserted = upsert_new_data(index, iter_vector_store_records(output), set(), namespace=namespace,
+                                   checkpoint_file=None)
+        print(f"Upserted {upserted} vectors into namespace '{namespace}'.")
+    return writer.count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Records JSON/JSONL or vector store written by pubmed_chunker")
+    parser.add_argument("--dimensions", type=int, required=True)
+    parser.add_argument("--mode", choices=("truncate", "reembed"), default="truncate")
+    parser.add_argument("--output", default=None, help="Vector store base path (default: <source>_<D>d)")
+    parser.add_argument("--index", default=None, help="Pinecone index to upsert into (optional)")
+    parser.add_argument("--namespace", default="")
+    parser.add_argument("--create-index", action="store_true")
+    parser.add_argument("--cloud", default="aws")
+    parser.add_argument("--region", default="us-east-1")
+    args = parser.parse_args()
+
+    source_base = os.path.splitext(args.source)[0] if args.source.endswith((".json", ".jsonl")) else store_base_path(args.source)
+    output = args.output or f"{source_base}_{args.dimensions}d"
+    target = None
+    if args.index:
+        target = connect_target_index(args.index, args.dimensions, args.create_index, args.cloud, args.region)
+    reindex(args.source, args.dimensions, output, args.mode, target, args.namespace)
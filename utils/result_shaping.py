@@ -0,0 +1,158 @@
+# utils/result_shaping.py
+import re
+
+import config
+
+# Fields a client may select with "fields"; the default keeps the original response shape
+RESULT_FIELDS = ("id", "score", "text", "snippet", "source", "module", "pmid", "chunk_id", "char_start", "char_end", "namespace")
+DEFAULT_RESULT_FIELDS = ("id", "score", "text", "source", "module")
+COLLAPSE_MODES = ("overlap", "pmid")
+# Extra candidates retrieved per requested result when collapsing, so top_k survive the dedup
+COLLAPSE_OVERSAMPLE = 3
+SNIPPET_TERM_RE = re.compile(r"\w+")
+SNIPPET_MIN_TERM_LENGTH = 3
+
+
+class QueryOptions:
+    """Validated result options of a /rag/query request (top_k, fields, snippet, collapse)."""
+
+    def __init__(self, top_k: int, fields: tuple, snippet: bool, collapse: str | None):
+        self.top_k = top_k
+        self.fields = fields
+        self.snippet = snippet
+        self.collapse = collapse
+
+    @property
+    def fetch_k(self) -> int:
+        """Matches to retrieve: top_k, oversampled when collapsing (bounded by MAX_TOP_K)."""
+        if self.collapse is None:
+            return self.top_k
+        return min(self.top_k * COLLAPSE_OVERSAMPLE, config.MAX_TOP_K)
+
+    @property
+    def is_default(self) -> bool:
+        return self.fields == DEFAULT_RESULT_FIELDS and not self.snippet and self.collapse is None
+
+
+def parse_query_options(data: dict) -> QueryOptions:
+    """
+    Reads the optional keys of a /rag/query body. Raises ValueError with a client-facing message
+    on invalid values:
+      top_k     1..MAX_TOP_K (default TOP_K)
+      fields    list of RESULT_FIELDS to return (default: id, score, text, source, module)
+      snippet   true: return a highlighted 'snippet' around the query terms instead of the full 'text'
+      collapse  "overlap": drop chunks overlapping a higher-ranked chunk of the same PMID;
+                "pmid": keep only the best chunk per PMID
+    """
+    top_k = data.get("top_k", config.TOP_K)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= config.MAX_TOP_K:
+        raise ValueError(f"'top_k' must be an integer between 1 and {config.MAX_TOP_K}")
+
+    snippet = data.get("snippet", False)
+    if not isinstance(snippet, bool):
+        raise ValueError("'snippet' must be true or false")
+
+    fields = data.get("fields")
+    if fields is None:
+        fields = tuple("snippet" if field == "text" and snippet else field for field in DEFAULT_RESULT_FIELDS)
+    else:
+        if not isinstance(fields, list) or not fields or not all(isinstance(field, str) for field in fields):
+            raise ValueError("'fields' must be a non-empty list of field names")
+        unknown = [field for field in fields if field not in RESULT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown field(s) {unknown}; allowed: {list(RESULT_FIELDS)}")
+        fields = tuple(dict.fromkeys(fields))
+
+    collapse = data.get("collapse")
+    if collapse is not None and collapse not in COLLAPSE_MODES:
+        raise ValueError(f"'collapse' must be one of {list(COLLAPSE_MODES)}")
+
+    return QueryOptions(top_k, fields, snippet or "snippet" in fields, collapse)
+
+
+# === DEDUP ===
+def _overlaps(result: dict, spans: list[tuple]) -> bool:
+    start, end = result.get("char_start"), result.get("char_end")
+    if start is None or end is None:
+        return False
+    return any(start < kept_end and kept_start < end for kept_start, kept_end in spans)
+
+def collapse_results(results: list[dict], mode: str, top_k: int) -> list[dict]:
+    """Drops lower-ranked chunks of the same PMID (any, or only character-overlapping ones); keeps order."""
+    kept = []
+    spans = {} # pmid -> [(char_start, char_end)] of kept chunks
+    for result in results:
+        pmid = result.get("pmid")
+        if pmid is not None and pmid in spans:
+            if mode == "pmid" or _overlaps(result, spans[pmid]):
+                continue
+        if pmid is not None:
+            spans.setdefault(pmid, [])
+            if result.get("char_start") is not None and result.get("char_end") is not None:
+                spans[pmid].append((result["char_start"], result["char_end"]))
+        kept.append(result)
+        if len(kept) >= top_k:
+            break
+    return kept
+
+
+# === SNIPPETS ===
+def query_terms(query_text: str) -> set[str]:
+    return {term for term in SNIPPET_TERM_RE.findall(query_text.lower()) if len(term) >= SNIPPET_MIN_TERM_LENGTH}
+
+def make_snippet(text: str, terms: set[str], length: int | None = None) -> str:
+    """
+    The `length`-character window of `text` containing the most query-term occurrences,
+    cut at word boundaries, with the terms wrapped in SNIPPET_HIGHLIGHT_PRE / _POST.
+    """
+    length = length or config.SNIPPET_CHARS
+    hits = [m for m in SNIPPET_TERM_RE.finditer(text) if m.group().lower() in terms] if terms else []
+
+    # Sliding window over the hit positions: most hits within `length` characters
+    best_start, best_count, first = 0, 0, 0
+    for last, hit in enumerate(hits):
+        while hit.end() - hits[first].start() > length:
+            first += 1
+        if last - first + 1 > best_count:
+            best_count, best_start = last - first + 1, hits[first].start()
+    if best_count:
+        # Center the hits a little: start up to a quarter window before the first one
+        best_start = max(0, best_start - length // 4)
+    start = best_start
+    end = min(len(text), start + length)
+    if start > 0:
+        space = text.find(" ", start)
+        start = space + 1 if 0 <= space < end else start
+    if end < len(text):
+        space = text.rfind(" ", start, end)
+        end = space if space > start else end
+
+    window_hits = [m for m in hits if m.start() >= start and m.end() <= end]
+    pieces, position = [], start
+    for m in window_hits:
+        pieces.append(text[position:m.start()])
+        pieces.append(f"{config.SNIPPET_HIGHLIGHT_PRE}{m.group()}{config.SNIPPET_HIGHLIGHT_POST}")
+        position = m.end()
+    pieces.append(text[position:end])
+    snippet = "".join(pieces).strip()
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+# === PROJECTION ===
+def shape_results(results: list[dict], options: QueryOptions, query_text: str) -> list[dict]:
+    """Applies collapse, top_k, snippets and field projection to retriever results (new dicts)."""
+    if options.collapse is not None:
+        results = collapse_results(results, options.collapse, options.top_k)
+    results = results[:options.top_k]
+    terms = query_terms(query_text) if options.snippet else None
+
+    shaped = []
+    for result in results:
+        item = {}
+        for field in options.fields:
+            if field == "snippet":
+                item["snippet"] = make_snippet(result.get("text", ""), terms)
+            else:
+                item[field] = result.get(field)
+        shaped.append(item)
+    return shaped
@@ -1,47 +1,273 @@
 # utils/retriever.py
+import asyncio
+import heapq
+import inspect
+import itertools
+import time
 from pinecone import Pinecone
 import config
+from utils.doc_store import DocStore
+from utils.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from utils.semantic_cache import SemanticResultCache
+from utils.observability import get_logger, span
+
+logger = get_logger(__name__)
 
 # (Asumimos que pinecone_index se pasa desde app.py)
 
-def query_pinecone(index: Pinecone.Index, query_vector: list[float], module_filter: str | None = None) -> list[dict]:
+def normalize_module_filter(module):
     """
-    Queries the Pinecone index, optionally filtering by module,
-    and returns formatted results.
+    Returns the lower-cased module name to filter on, a sorted tuple of names for a list of
+    modules (one "$in" filter), or None for no filter. Raises ValueError for a list with
+    non-string entries.
     """
-    if not query_vector:
-        return []
+    if isinstance(module, list):
+        if not all(isinstance(item, str) for item in module):
+            raise ValueError("'module' must be a string or a list of strings")
+        modules = tuple(sorted({item.strip().lower() for item in module if item.strip()}))
+        if len(modules) <= 1:
+            return modules[0] if modules else None
+        return modules
+    if module and isinstance(module, str):
+        module = module.strip().lower()
+        return module or None
+    return None
+
+def normalize_namespaces(namespaces) -> tuple | None:
+    """
+    The namespaces a request asked for ("namespaces": a name or a list), deduplicated in request
+    order; None when not given (the configured NAMESPACE only). Raises ValueError for names
+    other than NAMESPACE and QUERY_NAMESPACES, which bounds the fan-out of a single request.
+    """
+    if namespaces is None:
+        return None
+    if isinstance(namespaces, str):
+        namespaces = [namespaces]
+    if not isinstance(namespaces, list) or not namespaces or not all(isinstance(item, str) for item in namespaces):
+        raise ValueError("'namespaces' must be a non-empty list of namespace names")
+    allowed = list(dict.fromkeys([config.NAMESPACE, *config.QUERY_NAMESPACES]))
+    unknown = [item for item in namespaces if item not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown namespace(s) {unknown}; allowed: {allowed}")
+    return tuple(dict.fromkeys(namespaces))
+
+def module_cache_predicate(module_filter):
+    """Result cache partitions that can hold chunks of the given module(s): unfiltered ones and those filtering on any of them."""
+    modules = {module_filter} if isinstance(module_filter, str) else set(module_filter)
+    def matches(key):
+        cached_filter = key[1]
+        if cached_filter is None:
+            return True
+        if isinstance(cached_filter, str):
+            return cached_filter in modules
+        return not modules.isdisjoint(cached_filter)
+    return matches
 
-    filter_dict = None
+def _result_cache_key(module_filter: str | tuple | None, top_k: int, namespace: str | None = None) -> tuple:
+    namespace = config.NAMESPACE if namespace is None else namespace
+    if isinstance(module_filter, str):
+        module_filter = module_filter.strip() or None
+    return (namespace, module_filter or None, top_k)
+
+def _build_filter(module_filter: str | tuple | None) -> dict | None:
+    if module_filter and isinstance(module_filter, (tuple, list)):
+        filter_dict = {"module": {"$in": list(module_filter)}}
+        logger.debug("Applying Pinecone filter: %s", filter_dict)
+        return filter_dict
     if module_filter and isinstance(module_filter, str) and module_filter.strip():
         filter_dict = {"module": module_filter.strip()}
-        print(f"DEBUG RETRIEVER: Applying Pinecone filter: {filter_dict}")
-    else:
-        print("DEBUG RETRIEVER: No module filter applied, searching all modules.")
+        logger.debug("Applying Pinecone filter: %s", filter_dict)
+        return filter_dict
+    logger.debug("No module filter applied, searching all modules.")
+    return None
+
+def format_matches(result, doc_store: DocStore | None = None) -> list[dict]:
+    """
+    Turns a Pinecone (or LocalIndex) query response into the API's result dicts.
+    With a doc_store, the metadata of all matches is read from it in one bulk lookup.
+    """
+    stored = {}
+    if doc_store is not None and result.matches:
+        with span("hydration"):
+            stored = doc_store.get_many([match.id for match in result.matches])
+        if len(stored) < len(result.matches):
+            logger.warning("%d of %d matches missing from the document store.", len(result.matches) - len(stored), len(result.matches))
+    matches = []
+    for match in result.matches:
+        metadata = stored.get(match.id) or match.metadata or {}
+        matches.append({
+            "id": match.id,
+            "score": match.score,
+            "text": metadata.get("text", ""),
+            "source": metadata.get("source", "unknown"),
+            "module": metadata.get("module", "unknown"),
+            # Not returned by default; available through the 'fields' option and used to collapse overlapping chunks
+            "pmid": metadata.get("pmid"),
+            "chunk_id": metadata.get("chunk_id"),
+            "char_start": metadata.get("char_start"),
+            "char_end": metadata.get("char_end"),
+        })
+    return matches
+
+def query_pinecone(index: Pinecone.Index, query_vector: list[float], module_filter: str | tuple | None = None,
+                   result_cache: SemanticResultCache | None = None, top_k: int | None = None,
+                   doc_store: DocStore | None = None, namespace: str | None = None) -> list[dict]:
+    """
+    Queries the Pinecone index, optionally filtering by module (or a tuple of modules),
+    and returns formatted results. namespace defaults to config.NAMESPACE.
+    If a result_cache is given, near-duplicate queries are answered from it without hitting Pinecone.
+    If a doc_store is given, the index is queried without metadata and the matches are hydrated from it.
+    """
+    if not query_vector:
+        return []
+
+    top_k = top_k or config.TOP_K
+    cache_key = _result_cache_key(module_filter, top_k, namespace)
+    if result_cache is not None:
+        cached = result_cache.lookup(cache_key, query_vector)
+        if cached is not None:
+            return cached
+
+    filter_dict = _build_filter(module_filter)
 
     try:
-        result = index.query(
-            vector=query_vector,
-            namespace=config.NAMESPACE,
-            top_k=config.TOP_K,
-            include_metadata=True,
-            filter=filter_dict
-        )
-
-        matches = []
-        for match in result.matches:
-            metadata = match.metadata or {}
-            matches.append({
-                "id": match.id,
-                "score": match.score,
-                "text": metadata.get("text", ""),
-                "source": metadata.get("source", "unknown"),
-                "module": metadata.get("module", "unknown"),
-            })
+        with span("index_query"):
+            result = index.query(
+                vector=query_vector,
+                namespace=cache_key[0],
+                top_k=top_k,
+                include_metadata=doc_store is None,
+                filter=filter_dict
+            )
+
+        matches = format_matches(result, doc_store)
+        if result_cache is not None:
+            result_cache.store(cache_key, query_vector, matches)
         return matches
     # except ApiException as e: <-- BLOQUE ELIMINADO
     #     print(f"Pinecone API Error during query: {e}")
     #     raise e
     except Exception as e: # <-- Este bloque atrapará ahora también los errores de Pinecone
-        print(f"Unexpected error during query (may include Pinecone errors): {e}")
+        logger.error("Unexpected error during query (may include Pinecone errors): %s", e)
         raise e # Re-lanza para que lo atrape el manejador de Flask
+
+async def query_pinecone_async(index, query_vector: list[float], module_filter: str | tuple | None = None,
+                               result_cache: SemanticResultCache | None = None, top_k: int | None = None,
+                               doc_store: DocStore | None = None, namespace: str | None = None) -> list[dict]:
+    """
+    Async version of query_pinecone for the ASGI app. Awaits the query on an async index
+    (Pinecone IndexAsyncio); a synchronous index (e.g. LocalIndex) is queried in a worker
+    thread so the event loop is never blocked.
+    """
+    if not query_vector:
+        return []
+
+    top_k = top_k or config.TOP_K
+    cache_key = _result_cache_key(module_filter, top_k, namespace)
+    if result_cache is not None:
+        cached = result_cache.lookup(cache_key, query_vector)
+        if cached is not None:
+            return cached
+
+    query_args = dict(
+        vector=query_vector,
+        namespace=cache_key[0],
+        top_k=top_k,
+        include_metadata=doc_store is None,
+        filter=_build_filter(module_filter)
+    )
+
+    try:
+        with span("index_query"):
+            if inspect.iscoroutinefunction(index.query):
+                result = await index.query(**query_args)
+            else:
+                result = await asyncio.to_thread(index.query, **query_args)
+
+        matches = format_matches(result, doc_store)
+        if result_cache is not None:
+            result_cache.store(cache_key, query_vector, matches)
+        return matches
+    except Exception as e:
+        logger.error("Unexpected error during query (may include Pinecone errors): %s", e)
+        raise e
+
+# === SHARD FAN-OUT ===
+def merge_shard_results(result_lists: list[list[dict]], top_k: int) -> list[dict]:
+    """
+    Global top_k of per-shard result lists (each already sorted by descending score, as the
+    index returns them): a k-way heap merge that stops after top_k results.
+    """
+    merged = heapq.merge(*result_lists, key=lambda result: result["score"], reverse=True)
+    return list(itertools.islice(merged, top_k))
+
+def _shard_results(namespace: str, results: list[dict], seconds: float) -> tuple[list[dict], dict]:
+    # Copies, since the per-shard lists may be shared with the result cache
+    tagged = [{**result, "namespace": namespace} for result in results]
+    return tagged, {"namespace": namespace, "matches": len(results), "ms": round(seconds * 1000, 2)}
+
+def query_shards(index, query_vector: list[float], namespaces: tuple, module_filter: str | tuple | None = None,
+                 result_cache: SemanticResultCache | None = None, top_k: int | None = None,
+                 doc_store: DocStore | None = None, executor=None) -> tuple[list[dict], list[dict]]:
+    """
+    Queries each namespace with the same query vector (in parallel on `executor` when given),
+    and merges the partial top-k lists into one global top_k. Returns (results, per-shard
+    timings [{"namespace", "matches", "ms"}]). Results carry the namespace they came from.
+    """
+    top_k = top_k or config.TOP_K
+
+    def run(namespace):
+        start = time.perf_counter()
+        results = query_pinecone(index, query_vector, module_filter, result_cache, top_k, doc_store, namespace)
+        return _shard_results(namespace, results, time.perf_counter() - start)
+
+    if executor is not None and len(namespaces) > 1:
+        shards = list(executor.map(run, namespaces))
+    else:
+        shards = [run(namespace) for namespace in namespaces]
+    with span("shard_merge"):
+        results = merge_shard_results([results for results, _ in shards], top_k)
+    return results, [timing for _, timing in shards]
+
+async def query_shards_async(index, query_vector: list[float], namespaces: tuple, module_filter: str | tuple | None = None,
+                             result_cache: SemanticResultCache | None = None, top_k: int | None = None,
+                             doc_store: DocStore | None = None) -> tuple[list[dict], list[dict]]:
+    """Async version of query_shards: the namespaces are queried concurrently with asyncio.gather."""
+    top_k = top_k or config.TOP_K
+
+    async def run(namespace):
+        start = time.perf_counter()
+        results = await query_pinecone_async(index, query_vector, module_filter, result_cache, top_k, doc_store, namespace)
+        return _shard_results(namespace, results, time.perf_counter() - start)
+
+    shards = await asyncio.gather(*(run(namespace) for namespace in namespaces))
+    with span("shard_merge"):
+        results = merge_shard_results([results for results, _ in shards], top_k)
+    return results, [timing for _, timing in shards]
+
+def search_lexical(lexical_index: LexicalIndex, query_text: str, module_filter: str | tuple | None = None,
+                   top_k: int | None = None) -> list[dict]:
+    """BM25 results from the lexical index, in the same shape as query_pinecone's."""
+    with span("lexical_query"):
+        result = lexical_index.search(query_text, top_k=top_k or config.TOP_K, filter=_build_filter(module_filter))
+    return format_matches(result)
+
+def lexical_fast_path(lexical_index: LexicalIndex | None, query_text: str, module_filter: str | tuple | None = None,
+                      top_k: int | None = None) -> list[dict] | None:
+    """
+    Results for an identifier-like query (PMID, tool name, tag) straight from the lexical index,
+    skipping the embedding call. None when the query should take the vector path instead
+    (fast path disabled, not identifier-like, or no lexical hit).
+    """
+    if lexical_index is None or not config.LEXICAL_FAST_PATH or not lexical_index.is_identifier_query(query_text):
+        return None
+    return search_lexical(lexical_index, query_text, module_filter, top_k) or None
+
+def fuse_with_lexical(results: list[dict], lexical_index: LexicalIndex | None, query_text: str,
+                      module_filter: str | tuple | None = None, top_k: int | None = None) -> list[dict]:
+    """Vector results fused with the lexical ones by RRF when HYBRID_FUSION_ENABLED; otherwise unchanged."""
+    if lexical_index is None or not config.HYBRID_FUSION_ENABLED:
+        return results
+    top_k = top_k or config.TOP_K
+    lexical_results = search_lexical(lexical_index, query_text, module_filter, top_k)
+    return reciprocal_rank_fusion([results, lexical_results], top_k=top_k, k=config.RRF_K)
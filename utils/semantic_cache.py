@@ -0,0 +1,124 @@
+# utils/semantic_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class _Partition:
+    """Fixed-capacity block of unit-normalized query vectors and their cached results."""
+
+    def __init__(self, capacity: int, dimension: int):
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.results = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.created_at = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+
+
+class SemanticResultCache:
+    """
+    Near-duplicate query result cache. Recent query vectors are kept per partition
+    (e.g. per module filter) in a small NumPy matrix; a new query whose cosine similarity
+    to a cached one is at least `threshold` is answered with that query's results.
+    Each partition holds at most `capacity` entries (LRU eviction), and at most
+    `max_partitions` partitions are kept.
+    """
+
+    def __init__(self, capacity: int = 256, threshold: float = 0.97,
+                 ttl_seconds: float | None = None, max_partitions: int = 64):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_partitions = max_partitions
+        self._partitions = OrderedDict() # partition key -> _Partition
+        self._lock = threading.Lock()
+        self._tick = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray | None:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def lookup(self, partition_key, query_vector) -> list[dict] | None:
+        """Returns a copy of the cached results for a near-duplicate query, or None."""
+        query = self._normalize(query_vector)
+        with self._lock:
+            partition = self._partitions.get(partition_key)
+            if query is None or partition is None or partition.size == 0 \
+                    or partition.vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            similarities = partition.vectors[:partition.size] @ query
+            if self.ttl_seconds:
+                expired = partition.created_at[:partition.size] < time.time() - self.ttl_seconds
+                similarities[expired] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._tick += 1
+            partition.last_used[best] = self._tick
+            self._partitions.move_to_end(partition_key)
+            self.hits += 1
+            return [dict(match) for match in partition.results[best]]
+
+    def store(self, partition_key, query_vector, results: list[dict]) -> None:
+        query = self._normalize(query_vector)
+        if query is None:
+            return
+        with self._lock:
+            partition = self._partitions.get(partition_key)
+            if partition is None or partition.vectors.shape[1] != query.shape[0]:
+                partition = _Partition(self.capacity, query.shape[0])
+                self._partitions[partition_key] = partition
+                while len(self._partitions) > self.max_partitions:
+                    self._partitions.popitem(last=False)
+            self._partitions.move_to_end(partition_key)
+
+            if partition.size < self.capacity:
+                slot = partition.size
+                partition.size += 1
+            else:
+                slot = int(np.argmin(partition.last_used)) # Least recently used entry
+
+            self._tick += 1
+            partition.vectors[slot] = query
+            partition.results[slot] = [dict(match) for match in results]
+            partition.last_used[slot] = self._tick
+            partition.created_at[slot] = time.time()
+
+    def invalidate(self, partition_filter=None) -> int:
+        """
+        Drops cached results. With no argument everything is dropped; otherwise only the
+        partitions for which partition_filter(key) is true. Returns the number of partitions dropped.
+        """
+        with self._lock:
+            if partition_filter is None:
+                keys = list(self._partitions)
+            else:
+                keys = [key for key in self._partitions if partition_filter(key)]
+            for key in keys:
+                del self._partitions[key]
+            self.invalidations += 1
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "partitions": len(self._partitions),
+                "entries": sum(p.size for p in self._partitions.values()),
+                "threshold": self.threshold,
+            }
@@ -0,0 +1,54 @@
+# utils/serialization.py
+import gzip
+import json
+
+import config
+
+# Optional faster encoders / compressors: used when installed, stdlib otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_CONTENT_TYPE = "application/json"
+
+
+def dumps(payload) -> bytes:
+    """Compact UTF-8 JSON; orjson when available (several times faster on result lists)."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _accepted_encodings(accept_encoding: str | None) -> set[str]:
+    encodings = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            encodings.add(name.lower())
+    return encodings
+
+def compress(body: bytes, accept_encoding: str | None) -> tuple[bytes, str | None]:
+    """
+    Compresses the body with br (if the brotli package is installed) or gzip, when the client
+    accepts it and the body is at least COMPRESSION_MIN_BYTES. Returns (body, content encoding or None).
+    """
+    if not config.RESPONSE_COMPRESSION or len(body) < config.COMPRESSION_MIN_BYTES:
+        return body, None
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=config.BROTLI_QUALITY), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=config.GZIP_LEVEL), "gzip"
+    return body, None
+
+def encode_json(payload, accept_encoding: str | None = None) -> tuple[bytes, dict]:
+    """JSON body and the response headers to send with it (Content-Type, and Content-Encoding / Vary if compressed)."""
+    body, encoding = compress(dumps(payload), accept_encoding)
+    headers = {"Content-Type": JSON_CONTENT_TYPE, "Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return body, headers
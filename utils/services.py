@@ -0,0 +1,225 @@
+# utils/services.py
+"""
+Lazy, per-process clients for the API (Pinecone / local index and OpenAI).
+
+Nothing connects at import time. Each worker process creates its own clients on first use,
+so gunicorn --preload / fork never shares sockets or connection pools between processes:
+the state is keyed by PID and also reset in the child right after a fork. readiness()
+reports the init state for the /ready endpoint and warm_up() pre-opens the connections.
+"""
+import hmac
+import os
+import threading
+import time
+
+import openai
+from pinecone import Pinecone
+
+import config
+from utils.doc_store import DocStore
+from utils.lexical_index import LexicalIndex
+from utils.local_index import LocalIndex
+from utils.observability import get_logger
+
+logger = get_logger(__name__)
+
+WARMUP_TEXT = "warm-up"
+
+
+class _ServiceState:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.index = None
+        self.index_error = None
+        self.index_failed_at = None
+        self.index_init_seconds = None
+        self.openai_client = None
+        self.lexical_index = None
+        self.doc_store = None
+        self.lexical_index_loaded = False
+        self.warmed_up = False
+
+_state = _ServiceState()
+
+def _reset_after_fork() -> None:
+    global _state
+    _state = _ServiceState()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _current_state() -> _ServiceState:
+    # Belt and braces for fork paths that bypass os.register_at_fork (e.g. os.fork from C code)
+    if _state.pid != os.getpid():
+        _reset_after_fork()
+    return _state
+
+
+# === CLIENT FACTORIES ===
+def connect_pinecone_index():
+    """
+    Connects to the configured index without a list_indexes() round trip; with
+    PINECONE_INDEX_HOST set, the describe_index host lookup is skipped as well.
+    """
+    logger.info("Attempting to initialize Pinecone client...")
+    pc = Pinecone(api_key=config.PINECONE_API_KEY)
+    if config.PINECONE_INDEX_HOST:
+        index = pc.Index(host=config.PINECONE_INDEX_HOST)
+    else:
+        index = pc.Index(config.INDEX_NAME)
+    logger.info("Connected to Pinecone index '%s'.", config.INDEX_NAME)
+    return index
+
+def load_local_index():
+    logger.info("Loading local vector index from '%s'...", config.LOCAL_INDEX_PATH)
+    return LocalIndex.from_path(config.LOCAL_INDEX_PATH, namespace=config.NAMESPACE)
+
+def build_lexical_index(index=None) -> LexicalIndex | None:
+    """
+    BM25 index over the chunk records at LEXICAL_INDEX_PATH, or over the records already in
+    memory in a LocalIndex when no path is set. None if disabled, unavailable or failing to build
+    (the API then simply skips the lexical fast path / fusion).
+    """
+    if not config.LEXICAL_INDEX_ENABLED:
+        return None
+    try:
+        if config.LEXICAL_INDEX_PATH:
+            logger.info("Building lexical index from '%s'...", config.LEXICAL_INDEX_PATH)
+            return LexicalIndex.from_path(config.LEXICAL_INDEX_PATH)
+        if isinstance(index, LocalIndex):
+            logger.info("Building lexical index from the local vector index records...")
+            return LexicalIndex.from_records(zip(index.ids, index.metadata))
+    except Exception as e:
+        logger.error("Failed to build lexical index: %s", e)
+    return None
+
+
+# === LAZY ACCESSORS ===
+def get_index():
+    """
+    The retriever index of this process (Pinecone, or LocalIndex for RETRIEVER_BACKEND=local),
+    created on first call. Returns None if initialization failed; a failed init is retried
+    after SERVICE_INIT_RETRY_SECONDS so a transient outage doesn't leave the worker dead.
+    """
+    state = _current_state()
+    if state.index is not None:
+        return state.index
+    with state.lock:
+        if state.index is not None:
+            return state.index
+        if state.index_failed_at is not None and time.monotonic() - state.index_failed_at < config.SERVICE_INIT_RETRY_SECONDS:
+            return None
+        start = time.perf_counter()
+        try:
+            state.index = load_local_index() if config.RETRIEVER_BACKEND == "local" else connect_pinecone_index()
+            state.index_error = None
+            state.index_failed_at = None
+            state.index_init_seconds = time.perf_counter() - start
+        except Exception as e:
+            logger.error("Failed to initialize retriever index: %s", e)
+            state.index_error = str(e)
+            state.index_failed_at = time.monotonic()
+        return state.index
+
+def get_lexical_index() -> LexicalIndex | None:
+    """This process's lexical index, built on first call (see build_lexical_index); not retried on failure."""
+    state = _current_state()
+    if state.lexical_index_loaded:
+        return state.lexical_index
+    index = None
+    if config.LEXICAL_INDEX_ENABLED and not config.LEXICAL_INDEX_PATH and config.RETRIEVER_BACKEND == "local":
+        index = get_index()
+        if index is None:
+            return None # Retried with the index itself
+    with state.lock:
+        if not state.lexical_index_loaded:
+            state.lexical_index = build_lexical_index(index)
+            state.lexical_index_loaded = True
+    return state.lexical_index
+
+def get_doc_store() -> DocStore | None:
+    """This process's read-only document store (DOC_STORE_PATH), or None when not configured."""
+    if not config.DOC_STORE_PATH:
+        return None
+    state = _current_state()
+    if state.doc_store is None:
+        with state.lock:
+            if state.doc_store is None:
+                state.doc_store = DocStore(config.DOC_STORE_PATH, read_only=True)
+    return state.doc_store
+
+def get_openai_client() -> openai.OpenAI:
+    """This process's OpenAI client. Raises ValueError if no API key is configured."""
+    state = _current_state()
+    if state.openai_client is None:
+        with state.lock:
+            if state.openai_client is None:
+                if not config.OPENAI_API_KEY:
+                    raise ValueError("OpenAI API Key not found. Please set the OPENAI_API_KEY environment variable.")
+                state.openai_client = openai.OpenAI(api_key=config.OPENAI_API_KEY)
+    return state.openai_client
+
+
+# === ADMIN AUTH ===
+def is_admin_request(authorization: str | None) -> bool:
+    """True if the Authorization header carries CACHE_ADMIN_TOKEN as a bearer token (False when no token is configured)."""
+    if not config.CACHE_ADMIN_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), config.CACHE_ADMIN_TOKEN.encode())
+
+
+# === WARM-UP & READINESS ===
+def warm_up() -> bool:
+    """
+    Initializes the clients and opens their connections before the first real request:
+    one index stats call and one embedding of a fixed text. Returns True on success.
+    """
+    state = _current_state()
+    start = time.perf_counter()
+    try:
+        index = get_index()
+        if index is None:
+            return False
+        index.describe_index_stats()
+        get_lexical_index()
+        # Through the embedder's rate limiter: every worker warms up at once after a (re)start.
+        # Imported here because utils.embedder imports this module.
+        from utils.embedder import create_embeddings
+        create_embeddings([WARMUP_TEXT])
+    except Exception as e:
+        logger.warning("Warm-up failed: %s", e)
+        return False
+    state.warmed_up = True
+    logger.info("Warm-up done in %.2fs.", time.perf_counter() - start)
+    return True
+
+def warm_up_in_background() -> threading.Thread:
+    thread = threading.Thread(target=warm_up, name="service-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def readiness() -> dict:
+    """Init state of this process's services (initializing the index if not tried yet)."""
+    index = get_index()
+    state = _current_state()
+    checks = {
+        "index": "ok" if index is not None else f"error: {state.index_error}",
+        "openai": "ok" if config.OPENAI_API_KEY else "error: OPENAI_API_KEY not set",
+    }
+    if config.DOC_STORE_PATH:
+        try:
+            get_doc_store()
+            checks["doc_store"] = "ok"
+        except Exception as e:
+            checks["doc_store"] = f"error: {e}"
+    return {
+        "ready": all(value == "ok" for value in checks.values()),
+        "checks": checks,
+        "backend": config.RETRIEVER_BACKEND,
+        "index_init_seconds": state.index_init_seconds,
+        "warmed_up": state.warmed_up,
+        "lexical_index": state.lexical_index is not None,
+        "pid": os.getpid(),
+    }
@@ -0,0 +1,158 @@
+# utils/vector_format.py
+"""
+Binary handoff format between pubmed_chunker, pincone_update and the local index.
+
+A store with base path "data/corpus" is two files:
+  data/corpus.vectors.npy   float32 matrix, one row per record (memory-mappable)
+  data/corpus.meta.jsonl    one {"id": ..., "metadata": {...}} line per row, same order
+
+Compared to JSON float text this is ~3x smaller on disk and needs no float parsing to load.
+
+Convert an existing JSON/JSONL file:
+  python -m utils.vector_format pinecone_data_final_modules.json pinecone_data_final_modules
+"""
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+VECTOR_DTYPE = np.dtype("<f4")
+
+
+def store_paths(base_path: str) -> tuple[str, str]:
+    """Returns the (.vectors.npy, .meta.jsonl) paths of the store at base_path."""
+    return f"{base_path}.vectors.npy", f"{base_path}.meta.jsonl"
+
+def store_base_path(path: str) -> str:
+    """Accepts either the base path or the path of the .vectors.npy file."""
+    return path[:-len(".vectors.npy")] if path.endswith(".vectors.npy") else path
+
+
+# === WRITING ===
+class VectorStoreWriter:
+    """
+    Streams records ({"id", "values", "metadata"}) into a vector store without holding them in
+    memory: rows go to a raw float32 temp file, metadata to a temp sidecar, and close() writes
+    the .npy header and renames both into place. Same append()/close() interface as
+    pubmed_chunker.JsonlWriter, so it can be passed as process_pmids(output=...). If the `with`
+    block raises, the temp files are discarded and the previous store is left untouched.
+    """
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self.npy_path, self.meta_path = store_paths(base_path)
+        directory = os.path.dirname(os.path.abspath(self.npy_path))
+        os.makedirs(directory, exist_ok=True)
+        self._raw_path = f"{self.npy_path}.raw.tmp"
+        self._raw_file = open(self._raw_path, 'wb')
+        self._meta_file = open(f"{self.meta_path}.tmp", 'w')
+        self.dimension = None
+        self.count = 0
+
+    def append(self, record: dict) -> None:
+        vector = np.asarray(record["values"], dtype=VECTOR_DTYPE)
+        if self.dimension is None:
+            self.dimension = vector.shape[0]
+        elif vector.shape != (self.dimension,):
+            raise ValueError(f"Record {record.get('id')} has dimension {vector.shape[0]}, expected {self.dimension}")
+        self._raw_file.write(vector.tobytes())
+        self._meta_file.write(json.dumps({"id": record["id"], "metadata": record.get("metadata") or {}},
+                                         separators=(",", ":")) + "\n")
+        self.count += 1
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        if self._raw_file.closed:
+            return
+        self._raw_file.close()
+        self._meta_file.close()
+        header = {
+            "descr": np.lib.format.dtype_to_descr(VECTOR_DTYPE),
+            "fortran_order": False,
+            "shape": (self.count, self.dimension or 0),
+        }
+        tmp_npy = f"{self.npy_path}.tmp"
+        with open(tmp_npy, 'wb') as out, open(self._raw_path, 'rb') as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, length=16 * 1024 * 1024)
+        os.remove(self._raw_path)
+        os.replace(f"{self.meta_path}.tmp", self.meta_path)
+        os.replace(tmp_npy, self.npy_path)
+        print(f"✅ Wrote {self.count} vectors to {self.npy_path} (+ {os.path.basename(self.meta_path)})")
+
+    def discard(self) -> None:
+        """Drops the partial output and keeps whatever store was at base_path before."""
+        if self._raw_file.closed:
+            return
+        self._raw_file.close()
+        self._meta_file.close()
+        os.remove(self._raw_path)
+        os.remove(f"{self.meta_path}.tmp")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+
+def write_vector_store(records, base_path: str) -> int:
+    """Writes any iterable of records to a vector store. Returns the number of rows written."""
+    with VectorStoreWriter(base_path) as writer:
+        for record in records:
+            writer.append(record)
+    return writer.count
+
+
+# === READING ===
+def load_vectors(base_path: str) -> np.ndarray:
+    """Memory-maps the vector matrix of a store (read-only, nothing is loaded up front)."""
+    npy_path, _ = store_paths(store_base_path(base_path))
+    return np.load(npy_path, mmap_mode="r")
+
+def iter_metadata(base_path: str):
+    """Yields (id, metadata) per row, in row order."""
+    _, meta_path = store_paths(store_base_path(base_path))
+    with open(meta_path, 'r') as f:
+        for line in f:
+            row = json.loads(line)
+            yield row["id"], row.get("metadata") or {}
+
+def iter_vector_store_records(base_path: str):
+    """
+    Lazily yields records from a store. "values" is a float32 row view into the memory map,
+    so no per-float Python objects are built until a consumer serializes the row.
+    """
+    vectors = load_vectors(base_path)
+    for row, (vector_id, metadata) in enumerate(iter_metadata(base_path)):
+        yield {"id": vector_id, "values": vectors[row], "metadata": metadata}
+
+
+# === CONVERSION ===
+def iter_json_records(json_path: str):
+    """Yields records from a pubmed_chunker .json (list) or .jsonl (one record per line) file."""
+    if json_path.endswith(".jsonl"):
+        with open(json_path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(json_path, 'r') as f:
+            yield from json.load(f)
+
+def convert_json_to_vector_store(json_path: str, base_path: str) -> int:
+    """Converts an existing JSON/JSONL records file into the binary vector store format."""
+    return write_vector_store(iter_json_records(json_path), base_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m utils.vector_format <input.json|input.jsonl> <output_base_path>")
+        sys.exit(1)
+    convert_json_to_vector_store(sys.argv[1], sys.argv[2])